@@ -0,0 +1,258 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from timeit import default_timer as timer
+
+import numpy as np
+
+from deepdoc.vision import OCR, Recognizer
+
+# The only char fields page OCR reads; the rest of pdfplumber's char dict is not shipped to workers.
+CHAR_KEYS = ["x0", "x1", "top", "bottom", "width", "height", "text", "page_number"]
+
+
+# A text layer with more of these than TEXT_LAYER_MAX_GARBLED is not trusted to replace detection.
+GARBLED_CHAR = re.compile(r"\(cid:[0-9]+\)|[\ufffd\x00-\x08\x0b\x0c\x0e-\x1f]")
+TEXT_LAYER_MIN_CHARS = 16
+TEXT_LAYER_MAX_GARBLED = 0.02
+
+
+def text_layer_healthy(chars):
+    """Whether the PDF chars of a page are enough to build its text lines without running detection."""
+    printable = [c for c in chars if c["text"].strip()]
+    if len(printable) < TEXT_LAYER_MIN_CHARS:
+        return False
+    garbled = sum(1 for c in printable if GARBLED_CHAR.search(c["text"]))
+    return garbled <= TEXT_LAYER_MAX_GARBLED * len(printable)
+
+
+def text_layer_lines(pagenum, chars, mean_height=0):
+    """
+    Group the PDF chars of a page into text line boxes, the way detection would
+    box them: chars join a line when they overlap it vertically by half their
+    height and start within one char height of its right end.
+
+    Returns the same (boxes, lefted_chars, mean_height) as `ocr_page`.
+    """
+    lines = []
+    for c in sorted(chars, key=lambda c: (c["x0"], c["top"])):
+        h = c["bottom"] - c["top"]
+        if h <= 0:
+            continue
+        for b in reversed(lines):
+            last = b["chars"][-1]
+            lh = last["bottom"] - last["top"]
+            overlap = min(c["bottom"], last["bottom"]) - max(c["top"], last["top"])
+            if overlap >= min(h, lh) / 2 and -h / 2 <= c["x0"] - b["x1"] <= max(h, lh):
+                break
+        else:
+            b = {"x0": c["x0"], "x1": c["x1"], "top": c["top"], "bottom": c["bottom"], "text": "", "chars": [], "page_number": pagenum}
+            lines.append(b)
+        b["chars"].append(c)
+        b["x1"] = max(b["x1"], c["x1"])
+        b["top"] = min(b["top"], c["top"])
+        b["bottom"] = max(b["bottom"], c["bottom"])
+
+    for b in lines:
+        prev = None
+        for c in b["chars"]:
+            if c["text"] == " ":
+                if b["text"] and b["text"][-1] != " ":
+                    b["text"] += " "
+            else:
+                # a word gap the text layer has no space char for
+                if (
+                    prev is not None
+                    and c["x0"] - prev["x1"] > 0.1 * (c["bottom"] - c["top"])
+                    and b["text"]
+                    and re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%]", b["text"][-1])
+                    and re.match(r"[0-9a-zA-Zа-яА-Я]", c["text"])
+                ):
+                    b["text"] += " "
+                b["text"] += c["text"]
+            prev = c
+        b["text"] = b["text"].strip()
+        del b["chars"]
+
+    bxs = [b for b in lines if b["text"]]
+    if not bxs:
+        return [], [], mean_height
+    if mean_height == 0:
+        mean_height = np.median([b["bottom"] - b["top"] for b in bxs])
+    return Recognizer.sort_Y_firstly(bxs, mean_height / 3), [], mean_height
+
+
+def ocr_page(ocr, pagenum, img, chars, ZM=3, mean_height=0, device_id: int | None = None, text_layer=False, detected=None):
+    """
+    Detect and recognize the text lines of one page image, filling them with
+    the PDF chars they cover. With `text_layer`, the lines are built from
+    `chars` alone and `img` is not used. `detected` is the page's result of
+    `OCR.detect_batch`, when its detection already ran with other pages.
+
+    Returns:
+        boxes: text lines of the page in page coordinates (1/ZM of the image).
+        lefted_chars: chars which could not be assigned to any line.
+        mean_height: `mean_height` or, if it was 0, the median line height.
+    """
+    if text_layer:
+        start = timer()
+        res = text_layer_lines(pagenum, chars, mean_height)
+        logging.info(f"__ocr building lines from {len(chars)} chars of the text layer cost {timer() - start}s")
+        return res
+
+    lefted_chars = []
+    if detected is None:
+        start = timer()
+        bxs = ocr.detect(np.array(img), device_id)
+        logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
+    else:
+        bxs = detected
+
+    start = timer()
+    if not bxs:
+        return [], lefted_chars, mean_height
+    bxs = [(line[0], line[1][0]) for line in bxs]
+    bxs = Recognizer.sort_Y_firstly(
+        [
+            {"x0": b[0][0] / ZM, "x1": b[1][0] / ZM, "top": b[0][1] / ZM, "text": "", "txt": t, "bottom": b[-1][1] / ZM, "chars": [], "page_number": pagenum}
+            for b, t in bxs
+            if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]
+        ],
+        mean_height / 3,
+    )
+
+    # merge chars in the same rect
+    for c in chars:
+        ii = Recognizer.find_overlapped(c, bxs)
+        if ii is None:
+            lefted_chars.append(c)
+            continue
+        ch = c["bottom"] - c["top"]
+        bh = bxs[ii]["bottom"] - bxs[ii]["top"]
+        if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != " ":
+            lefted_chars.append(c)
+            continue
+        bxs[ii]["chars"].append(c)
+
+    for b in bxs:
+        if not b["chars"]:
+            del b["chars"]
+            continue
+        m_ht = np.mean([c["height"] for c in b["chars"]])
+        for c in Recognizer.sort_Y_firstly(b["chars"], m_ht):
+            if c["text"] == " " and b["text"]:
+                if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
+                    b["text"] += " "
+            else:
+                b["text"] += c["text"]
+        del b["chars"]
+
+    logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
+    start = timer()
+    boxes_to_reg = []
+    points = []
+    img_np = np.array(img)
+    for b in bxs:
+        if not b["text"]:
+            left, right, top, bott = b["x0"] * ZM, b["x1"] * ZM, b["top"] * ZM, b["bottom"] * ZM
+            points.append(np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
+            boxes_to_reg.append(b)
+        del b["txt"]
+    # the orientation trials of the page's tall boxes run as one batch on its device
+    for b, box_image in zip(boxes_to_reg, ocr.get_rotate_crop_images(img_np, points, device_id)):
+        b["box_image"] = box_image
+    texts = ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id)
+    for i in range(len(boxes_to_reg)):
+        boxes_to_reg[i]["text"] = texts[i]
+        del boxes_to_reg[i]["box_image"]
+    logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
+    bxs = [b for b in bxs if b["text"]]
+    if mean_height == 0:
+        mean_height = np.median([b["bottom"] - b["top"] for b in bxs])
+    return bxs, lefted_chars, mean_height
+
+
+_worker_ocr = None
+
+
+def _init_worker(threads):
+    global _worker_ocr
+    # read by load_model when the worker builds its own ORT sessions
+    os.environ["OCR_INTRA_OP_NUM_THREADS"] = str(threads)
+    os.environ["OCR_INTER_OP_NUM_THREADS"] = "1"
+    _worker_ocr = OCR()
+
+
+def _ocr_page_in_worker(pagenum, img, chars, ZM, mean_height, text_layer):
+    return ocr_page(_worker_ocr, pagenum, img, chars, ZM, mean_height, text_layer=text_layer)
+
+
+class OCRProcessPool:
+    """
+    A pool of worker processes, each holding its own `OCR` sessions loaded
+    once, that OCR pages in parallel on CPU.
+
+    Workers are spawned (not forked) so none of them inherits the ORT
+    sessions or thread pools of the parent process.
+    """
+
+    def __init__(self, workers, threads=2):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(threads,),
+        )
+        logging.info(f"OCRProcessPool started {workers} workers with {threads} threads each")
+
+    def map(self, pages):
+        """
+        OCR `pages`, an iterable of (pagenum, img, chars, ZM, mean_height, text_layer),
+        and yield the `ocr_page` results in the same order. At most two pages per
+        worker are in flight, so the iterable is consumed lazily.
+        """
+        pending = deque()
+        for pagenum, img, chars, ZM, mean_height, text_layer in pages:
+            chars = [{k: c[k] for k in CHAR_KEYS if k in c} for c in chars]
+            if text_layer:
+                img = None
+            pending.append(self.executor.submit(_ocr_page_in_worker, pagenum, img, chars, ZM, mean_height, text_layer))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+_shared_pools = {}
+_shared_pools_lock = threading.Lock()
+
+
+def shared_ocr_pool(workers, threads=2):
+    """
+    The OCRProcessPool of this process with `workers` workers of `threads`
+    threads each, started on first use. Parsers share it rather than each
+    spawning workers of its own; it is shut down at exit.
+    """
+    with _shared_pools_lock:
+        pool = _shared_pools.get((workers, threads))
+        if pool is None:
+            pool = _shared_pools[(workers, threads)] = OCRProcessPool(workers, threads)
+        return pool
+
+
+@atexit.register
+def close_shared_ocr_pools():
+    with _shared_pools_lock:
+        pools = list(_shared_pools.values())
+        _shared_pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,143 @@
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pdfplumber
+from PIL import Image
+
+LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
+if LOCK_KEY_pdfplumber not in sys.modules:
+    sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
+
+
+class PageImageWindow:
+    """
+    List-like access to the rendered page images of a PDF which keeps at most
+    `window` images in memory. Evicted pages are rendered again on demand, so
+    the memory held by page images depends on the window, not the page count.
+
+    The underlying pdfplumber document stays open until `close()` is called.
+    """
+
+    def __init__(self, fnm, zoomin=3, page_from=0, page_to=299, window=8):
+        self.zoomin = zoomin
+        self.window = max(1, int(window))
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+        # called with (i, img) whenever page i is rendered, see PageViews
+        self.on_render = None
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            self.pdf = pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm))
+            self.pages = self.pdf.pages[page_from:page_to]
+            self.total_page = len(self.pdf.pages)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError("page index out of range")
+
+        with self._lock:
+            img = self._cache.get(i)
+            if img is not None:
+                self._cache.move_to_end(i)
+                return img
+
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            img = self.pages[i].to_image(resolution=72 * self.zoomin, antialias=True).annotated
+
+        with self._lock:
+            self._sizes[i] = img.size
+            self._cache[i] = img
+            while len(self._cache) > self.window:
+                self._cache.popitem(last=False)
+        if self.on_render is not None:
+            self.on_render(i, img)
+        return img
+
+    def size_of(self, i):
+        """Size of page `i` at the render resolution, rendering it only if it was never seen."""
+        if i not in self._sizes:
+            self[i]
+        return self._sizes[i]
+
+    def release(self, i):
+        """Drop the objects pdfplumber parsed and cached for page `i`."""
+        with sys.modules[LOCK_KEY_pdfplumber]:
+            self.pages[i].flush_cache()
+
+    def close(self):
+        with self._lock:
+            self._cache.clear()
+        if self.pdf is not None:
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                self.pdf.close()
+            self.pdf = None
+            self.pages = []
+
+
+class PageViews:
+    """
+    Reduced-resolution copies of the page images, rendered at `zoomin`, for the
+    layout and table structure models, which shrink their input to a fixed
+    shape anyway. Each view is made once from the full page image: right away
+    for a list of images, and as each page is rendered for a `PageImageWindow`.
+    Views are kept for all pages; at `view_zoomin` one takes
+    (view_zoomin / zoomin)^2 of the memory of its full page image.
+
+    A view is `view_zoomin` / 72 DPI, so model coordinates divided by
+    `view_zoomin` are page coordinates, as full page ones are by `zoomin`.
+    """
+
+    def __init__(self, images, zoomin, view_zoomin):
+        self.images = images
+        self.zoomin = zoomin
+        self.view_zoomin = view_zoomin
+        self._views = {}
+        self._lock = threading.Lock()
+        if isinstance(images, PageImageWindow):
+            images.on_render = self.add
+        else:
+            for i, img in enumerate(images):
+                self.add(i, img)
+
+    def __len__(self):
+        return len(self.images)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        with self._lock:
+            view = self._views.get(i)
+        if view is None:
+            # renders the page if needed, which adds its view
+            self.add(i, self.images[i])
+            with self._lock:
+                view = self._views[i]
+        return view
+
+    def add(self, i, img):
+        with self._lock:
+            if i in self._views:
+                return
+        k = self.zoomin / self.view_zoomin
+        if float(k).is_integer():
+            # block averaging, several times cheaper than resampling
+            view = img.reduce(int(k))
+        else:
+            view = img.resize((max(1, round(img.size[0] / k)), max(1, round(img.size[1] / k))), Image.BOX)
+        with self._lock:
+            self._views.setdefault(i, view)
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+from functools import lru_cache
+
+from common.file_utils import get_project_base_directory
+
+# Bump whenever the layout of the cached state changes.
+CACHE_FORMAT = 3
+
+
+# Files next to the models which are not models the parser loads as such: INT8
+# copies (their mode is a key option of its own), quantization temp and prep
+# files, and ORT optimized graphs.
+DERIVED_MODEL_FILE = re.compile(r"\.int8-|\.prep\.|\.tmp$|\.ort[0-9]")
+
+
+def _fingerprinted(nm):
+    return nm == "ocr.res" or (nm.endswith(".onnx") and not DERIVED_MODEL_FILE.search(nm))
+
+
+@lru_cache(maxsize=8)
+def model_fingerprint(model_dir=None):
+    """
+    Names, sizes and mtimes of the fp32 ONNX models and the recognizer's
+    character table, so replacing a model invalidates the cache.
+    """
+    model_dir = model_dir or os.path.join(get_project_base_directory(), "rag/res/deepdoc")
+    h = hashlib.sha256()
+    if os.path.isdir(model_dir):
+        for nm in sorted(os.listdir(model_dir)):
+            fnm = os.path.join(model_dir, nm)
+            if _fingerprinted(nm) and os.path.isfile(fnm):
+                st = os.stat(fnm)
+                h.update(f"{nm}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()
+
+
+class ParseCache:
+    """
+    On-disk cache of the model-stage results of a PDF parse, one pickle per key.
+
+    Keys are content addressed: the hash of the PDF bytes plus the parse options
+    and the model fingerprint, so a renamed or re-uploaded document hits the same
+    entry while a different page range, zoom or model misses.
+
+    Entries are evicted least recently used first once the directory grows past
+    `max_bytes`; a hit refreshes the entry's mtime.
+    """
+
+    def __init__(self, root, max_bytes=1 << 30):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(fnm, **options):
+        h = hashlib.sha256()
+        if isinstance(fnm, str):
+            with open(fnm, "rb") as f:
+                for blk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(blk)
+        else:
+            h.update(fnm)
+        h.update(f"|format={CACHE_FORMAT}|models={model_fingerprint()}".encode())
+        for k in sorted(options):
+            h.update(f"|{k}={options[k]}".encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], key + ".pkl")
+
+    def get(self, key):
+        fnm = self._path(key)
+        try:
+            with open(fnm, "rb") as f:
+                state = pickle.load(f)
+            os.utime(fnm)
+            return state
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.exception(f"ParseCache drops unreadable entry {fnm}")
+            try:
+                os.remove(fnm)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key, state):
+        fnm = self._path(key)
+        os.makedirs(os.path.dirname(fnm), exist_ok=True)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fnm), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fnm)
+        except Exception:
+            logging.exception(f"ParseCache failed to write {fnm}")
+            return
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries, total = [], 0
+            for dirpath, _, files in os.walk(self.root):
+                for nm in files:
+                    if not nm.endswith(".pkl"):
+                        continue
+                    fnm = os.path.join(dirpath, nm)
+                    try:
+                        st = os.stat(fnm)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, fnm))
+                    total += st.st_size
+            entries.sort()
+            while entries and total > self.max_bytes:
+                _, size, fnm = entries.pop(0)
+                try:
+                    os.remove(fnm)
+                    total -= size
+                    logging.info(f"ParseCache evicted {fnm}")
+                except FileNotFoundError:
+                    pass
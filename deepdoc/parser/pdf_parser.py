@@ -20,11 +20,19 @@ from pypdf import PdfReader as pdf2_read
 
 from common.file_utils import get_project_base_directory
 from common.misc_utils import pip_install_torch
-from deepdoc.vision import OCR, AscendLayoutRecognizer, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision import OCR, AscendLayoutRecognizer, BoxIndex, DeviceScheduler, LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision.layout_recognizer import drop_garbages
+from deepdoc.vision.ocr import session_profile
+from deepdoc.vision.quantize import model_quantization
 from rag.app.picture import vision_llm_chunk as picture_vision_llm_chunk
 from rag.nlp import rag_tokenizer
 from rag.prompts.generator import vision_llm_describe_prompt
-from rag.settings import PARALLEL_DEVICES
+from rag.settings import OCR_CPU_THREADS_PER_WORKER, OCR_CPU_WORKERS, OCR_DET_BATCH_PAGES, PARALLEL_DEVICES, PDF_MODEL_ZOOMIN, PDF_PAGE_WINDOW, PDF_PARSE_CACHE_DIR, PDF_PARSE_CACHE_MAX_MB, PDF_PIPELINE, PDF_PIPELINE_DEPTH, PDF_RULED_TABLES, PDF_TEXT_LAYER_FAST_PATH
+
+from .ocr_pool import ocr_page, shared_ocr_pool, text_layer_healthy
+from .page_window import PageImageWindow, PageViews
+from .parse_cache import ParseCache
+from .table_rulings import page_rulings, ruled_table_components
 
 LOCK_KEY_pdfplumber = "global_shared_lock_pdfplumber"
 if LOCK_KEY_pdfplumber not in sys.modules:
@@ -46,9 +54,12 @@ class RAGFlowPdfParser:
         """
 
         self.ocr = OCR()
-        self.parallel_limiter = None
+        self.device_scheduler = None
         if PARALLEL_DEVICES > 1:
-            self.parallel_limiter = [trio.CapacityLimiter(1) for _ in range(PARALLEL_DEVICES)]
+            self.device_scheduler = DeviceScheduler(range(PARALLEL_DEVICES))
+        # OCR worker processes when there is no GPU; the pool is shared by the parsers of the process, see shared_ocr_pool
+        self.ocr_workers = int(kwargs.get("ocr_workers", OCR_CPU_WORKERS)) if PARALLEL_DEVICES == 0 else 0
+        self.ocr_threads_per_worker = int(kwargs.get("ocr_threads_per_worker", OCR_CPU_THREADS_PER_WORKER))
 
         layout_recognizer_type = os.getenv("LAYOUT_RECOGNIZER_TYPE", "onnx").lower()
         if layout_recognizer_type not in ["onnx", "ascend"]:
@@ -84,6 +95,32 @@ class RAGFlowPdfParser:
 
         self.page_from = 0
         self.column_num = 1
+        self.page_window = int(kwargs.get("page_window", PDF_PAGE_WINDOW))
+        self.pipeline = bool(int(kwargs.get("pipeline", PDF_PIPELINE)))
+        self.pipeline_depth = int(kwargs.get("pipeline_depth", PDF_PIPELINE_DEPTH))
+        self.pipelined_layouts = None
+        self.pipelined_tb_cpns = None
+        self.text_layer_fast_path = bool(int(kwargs.get("text_layer_fast_path", PDF_TEXT_LAYER_FAST_PATH)))
+        self.det_batch_pages = int(kwargs.get("det_batch_pages", OCR_DET_BATCH_PAGES))
+        self.model_zoomin = float(kwargs.get("model_zoomin", PDF_MODEL_ZOOMIN))
+        self.page_views = None
+        self.ruled_tables = bool(int(kwargs.get("ruled_tables", PDF_RULED_TABLES)))
+        self.page_rulings = []
+
+        self.parse_cache = None
+        self.parse_cache_options = {
+            "layouter": type(self.layouter).__name__,
+            "domain": recognizer_domain,
+            "text_layer": self.text_layer_fast_path,
+            "model_zoomin": self.model_zoomin,
+            "ruled_tables": self.ruled_tables,
+            # INT8 and fp32 copies of a model share the model fingerprint, so the modes the sessions run in are keyed too
+            "quantization": {nm: model_quantization(nm) for nm in ("det", "rec", "layout", "tsr")},
+            "session_profile": {nm: session_profile(nm) for nm in ("det", "rec", "layout", "tsr")},
+        }
+        cache_dir = kwargs.get("parse_cache_dir", PDF_PARSE_CACHE_DIR)
+        if cache_dir:
+            self.parse_cache = ParseCache(cache_dir, int(kwargs.get("parse_cache_max_mb", PDF_PARSE_CACHE_MAX_MB)) << 20)
 
     def __char_width(self, c):
         return (c["x1"] - c["x0"]) // max(len(c["text"]), 1)
@@ -175,15 +212,56 @@ class RAGFlowPdfParser:
                     return False
         return True
 
-    def _table_transformer_job(self, ZM):
-        logging.debug("Table processing...")
+    def __page_chars(self, page, pn):
+        try:
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                return [c for c in page.dedupe_chars().chars if self._has_color(c)]
+        except Exception as e:
+            logging.warning(f"Failed to extract characters for page {pn}: {str(e)}")
+            return []
+
+    def __page_rulings(self, page, pn):
+        try:
+            with sys.modules[LOCK_KEY_pdfplumber]:
+                return page_rulings(page)
+        except Exception as e:
+            logging.warning(f"Failed to extract ruling lines for page {pn}: {str(e)}")
+            return [], []
+
+    def _is_english_page(self, chars):
+        return re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(random.choices([c["text"] for c in chars], k=min(100, len(chars)))))
+
+    def _page_size(self, pn):
+        if isinstance(self.page_images, PageImageWindow):
+            return self.page_images.size_of(pn)
+        return self.page_images[pn].size
+
+    def _model_images(self, ZM):
+        """The page images the layout and TSR models run on, and their zoom: the reduced page views when there are any."""
+        if self.page_views is not None:
+            return self.page_views, self.page_views.view_zoomin
+        return self.page_images, ZM
+
+    def _table_components(self, pages, ZM):
+        """
+        Run TSR on the table layouts of `pages` and return the table components of each page, in page coordinates.
+        With ruled_tables, fully ruled tables are read off the page's ruling lines instead.
+        """
+        page_images, ZM = self._model_images(ZM)
         imgs, pos = [], []
         tbcnt = [0]
+        ruled, layoutnos = {}, {}
         MARGIN = 10
-        self.tb_cpns = []
-        assert len(self.page_layout) == len(self.page_images)
-        for p, tbls in enumerate(self.page_layout):  # for page
-            tbls = [f for f in tbls if f["type"] == "table"]
+        for p in pages:  # for page
+            tbls = [f for f in self.page_layout[p] if f["type"] == "table"]
+            if self.ruled_tables and p < len(self.page_rulings):
+                for j, tb in enumerate(tbls):
+                    cpns = ruled_table_components(self.page_rulings[p], tb["x0"], tb["top"], tb["x1"], tb["bottom"], MARGIN)
+                    if cpns is not None:
+                        ruled[p, j] = cpns
+            # layout numbers of the tables left to TSR
+            layoutnos[p] = [j for j in range(len(tbls)) if (p, j) not in ruled]
+            tbls = [tbls[j] for j in layoutnos[p]]
             tbcnt.append(len(tbls))
             if not tbls:
                 continue
@@ -194,14 +272,17 @@ class RAGFlowPdfParser:
                 right *= ZM
                 bott *= ZM
                 pos.append((left, top))
-                imgs.append(self.page_images[p].crop((left, top, right, bott)))
-
-        assert len(self.page_images) == len(tbcnt) - 1
-        if not imgs:
-            return
-        recos = self.tbl_det(imgs)
+                imgs.append(page_images[p].crop((left, top, right, bott)))
+
+        assert len(pages) == len(tbcnt) - 1
+        if ruled:
+            logging.debug(f"{len(ruled)} ruled tables read off their ruling lines, {len(imgs)} left to TSR")
+        if not imgs and not ruled:
+            return [[] for _ in pages]
+        recos = self.tbl_det(imgs) if imgs else []
         tbcnt = np.cumsum(tbcnt)
-        for i in range(len(tbcnt) - 1):  # for page
+        components = []
+        for i, p in enumerate(pages):  # for page
             pg = []
             for j, tb_items in enumerate(recos[tbcnt[i] : tbcnt[i + 1]]):  # for table
                 poss = pos[tbcnt[i] : tbcnt[i + 1]]
@@ -212,16 +293,41 @@ class RAGFlowPdfParser:
                     it["bottom"] = it["bottom"] + poss[j][1]
                     for n in ["x0", "x1", "top", "bottom"]:
                         it[n] /= ZM
-                    it["top"] += self.page_cum_height[i]
-                    it["bottom"] += self.page_cum_height[i]
-                    it["pn"] = i
-                    it["layoutno"] = j
+                    it["pn"] = p
+                    it["layoutno"] = layoutnos[p][j]
                     pg.append(it)
+            for (q, j), cpns in ruled.items():
+                if q == p:
+                    for it in cpns:
+                        it["pn"] = p
+                        it["layoutno"] = j
+                        pg.append(it)
+            components.append(pg)
+        return components
+
+    def _table_transformer_job(self, ZM):
+        logging.debug("Table processing...")
+        self.tb_cpns = []
+        assert len(self.page_layout) == len(self.page_images)
+        if self.pipelined_tb_cpns is not None:
+            # already recognized page by page in the __images__ pipeline
+            components, self.pipelined_tb_cpns = self.pipelined_tb_cpns, None
+        else:
+            components = self._table_components(range(len(self.page_images)), ZM)
+        if not any(components):
+            return
+        for i, pg in enumerate(components):  # for page
+            for it in pg:
+                it["top"] += self.page_cum_height[i]
+                it["bottom"] += self.page_cum_height[i]
             self.tb_cpns.extend(pg)
 
+        # every box is matched against every kind of table component, so index them once
+        boxes_index = BoxIndex(self.boxes)
+
         def gather(kwd, fzy=10, ption=0.6):
             eles = Recognizer.sort_Y_firstly([r for r in self.tb_cpns if re.match(kwd, r["label"])], fzy)
-            eles = Recognizer.layouts_cleanup(self.boxes, eles, 5, ption)
+            eles = Recognizer.layouts_cleanup(boxes_index, eles, 5, ption)
             return Recognizer.sort_Y_firstly(eles, 0)
 
         # add R,H,C,SP tag to boxes within table layout
@@ -229,17 +335,18 @@ class RAGFlowPdfParser:
         rows = gather(r".* (row|header)")
         spans = gather(r".*spanning")
         clmns = sorted([r for r in self.tb_cpns if re.match(r"table column$", r["label"])], key=lambda x: (x["pn"], x["layoutno"], x["x0"]))
-        clmns = Recognizer.layouts_cleanup(self.boxes, clmns, 5, 0.5)
+        clmns = Recognizer.layouts_cleanup(boxes_index, clmns, 5, 0.5)
+        rows_index, headers_index, clmns_index, spans_index = BoxIndex(rows), BoxIndex(headers), BoxIndex(clmns), BoxIndex(spans)
         for b in self.boxes:
             if b.get("layout_type", "") != "table":
                 continue
-            ii = Recognizer.find_overlapped_with_threshold(b, rows, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threshold(b, rows_index, thr=0.3)
             if ii is not None:
                 b["R"] = ii
                 b["R_top"] = rows[ii]["top"]
                 b["R_bott"] = rows[ii]["bottom"]
 
-            ii = Recognizer.find_overlapped_with_threshold(b, headers, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threshold(b, headers_index, thr=0.3)
             if ii is not None:
                 b["H_top"] = headers[ii]["top"]
                 b["H_bott"] = headers[ii]["bottom"]
@@ -247,13 +354,13 @@ class RAGFlowPdfParser:
                 b["H_right"] = headers[ii]["x1"]
                 b["H"] = ii
 
-            ii = Recognizer.find_horizontally_tightest_fit(b, clmns)
+            ii = Recognizer.find_horizontally_tightest_fit(b, clmns_index)
             if ii is not None:
                 b["C"] = ii
                 b["C_left"] = clmns[ii]["x0"]
                 b["C_right"] = clmns[ii]["x1"]
 
-            ii = Recognizer.find_overlapped_with_threshold(b, spans, thr=0.3)
+            ii = Recognizer.find_overlapped_with_threshold(b, spans_index, thr=0.3)
             if ii is not None:
                 b["H_top"] = spans[ii]["top"]
                 b["H_bott"] = spans[ii]["bottom"]
@@ -261,79 +368,46 @@ class RAGFlowPdfParser:
                 b["H_right"] = spans[ii]["x1"]
                 b["SP"] = ii
 
-    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None):
-        start = timer()
-        bxs = self.ocr.detect(np.array(img), device_id)
-        logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
-
-        start = timer()
-        if not bxs:
-            self.boxes.append([])
-            return
-        bxs = [(line[0], line[1][0]) for line in bxs]
-        bxs = Recognizer.sort_Y_firstly(
-            [
-                {"x0": b[0][0] / ZM, "x1": b[1][0] / ZM, "top": b[0][1] / ZM, "text": "", "txt": t, "bottom": b[-1][1] / ZM, "chars": [], "page_number": pagenum}
-                for b, t in bxs
-                if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]
-            ],
-            self.mean_height[pagenum - 1] / 3,
-        )
-
-        # merge chars in the same rect
-        for c in chars:
-            ii = Recognizer.find_overlapped(c, bxs)
-            if ii is None:
-                self.lefted_chars.append(c)
-                continue
-            ch = c["bottom"] - c["top"]
-            bh = bxs[ii]["bottom"] - bxs[ii]["top"]
-            if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != " ":
-                self.lefted_chars.append(c)
-                continue
-            bxs[ii]["chars"].append(c)
+    def __ocr(self, pagenum, img, chars, ZM=3, device_id: int | None = None, text_layer=False, detected=None):
+        bxs, lefted_chars, mean_height = ocr_page(self.ocr, pagenum, img, chars, ZM, self.mean_height[pagenum - 1], device_id, text_layer, detected)
+        self.__ocr_result(pagenum, bxs, lefted_chars, mean_height)
 
-        for b in bxs:
-            if not b["chars"]:
-                del b["chars"]
-                continue
-            m_ht = np.mean([c["height"] for c in b["chars"]])
-            for c in Recognizer.sort_Y_firstly(b["chars"], m_ht):
-                if c["text"] == " " and b["text"]:
-                    if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", b["text"][-1]):
-                        b["text"] += " "
-                else:
-                    b["text"] += c["text"]
-            del b["chars"]
-
-        logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
-        start = timer()
-        boxes_to_reg = []
-        img_np = np.array(img)
-        for b in bxs:
-            if not b["text"]:
-                left, right, top, bott = b["x0"] * ZM, b["x1"] * ZM, b["top"] * ZM, b["bottom"] * ZM
-                b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
-                boxes_to_reg.append(b)
-            del b["txt"]
-        texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg], device_id)
-        for i in range(len(boxes_to_reg)):
-            boxes_to_reg[i]["text"] = texts[i]
-            del boxes_to_reg[i]["box_image"]
-        logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
-        bxs = [b for b in bxs if b["text"]]
-        if self.mean_height[pagenum - 1] == 0:
-            self.mean_height[pagenum - 1] = np.median([b["bottom"] - b["top"] for b in bxs])
-        self.boxes.append(bxs)
+    def __ocr_result(self, pagenum, bxs, lefted_chars, mean_height):
+        self.lefted_chars.extend(lefted_chars)
+        self.mean_height[pagenum - 1] = mean_height
+        # pages may finish out of order, each one has its slot in self.boxes already
+        self.boxes[pagenum - 1] = bxs
 
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
-        self.boxes, self.page_layout = self.layouter(self.page_images, self.boxes, ZM, drop=drop)
+        layouts, self.pipelined_layouts = self.pipelined_layouts, None
+        if layouts is not None and not drop:
+            # the pipeline drops garbage; recognize again from the untouched OCR boxes
+            logging.info("_layouts_rec(drop=False) runs the layouter again over the pipelined pages")
+            layouts, self.layout_garbages = None, {}
+        if layouts is not None:
+            # already recognized page by page in the __images__ pipeline, page_layout included
+            self.boxes = drop_garbages([b for bxs in layouts for b in bxs], self.layout_garbages)
+        elif self.page_window > 0:
+            # keep the layout batches within the page window
+            page_images, zm = self._model_images(ZM)
+            self.boxes, self.page_layout = self.layouter(page_images, self.boxes, zm, drop=drop, batch_size=min(16, self.page_window))
+        else:
+            page_images, zm = self._model_images(ZM)
+            self.boxes, self.page_layout = self.layouter(page_images, self.boxes, zm, drop=drop)
         # cumlative Y
         for i in range(len(self.boxes)):
             self.boxes[i]["top"] += self.page_cum_height[self.boxes[i]["page_number"] - 1]
             self.boxes[i]["bottom"] += self.page_cum_height[self.boxes[i]["page_number"] - 1]
 
+    def __layout_page(self, pn, img, ZM):
+        if self.page_views is not None:
+            img, ZM = self.page_views[pn], self.page_views.view_zoomin
+        # tagged and dropped from copies, so the OCR boxes stay as they were for _layouts_rec(drop=False)
+        bxs, lts = self.layouter([img], [[dict(b) for b in self.boxes[pn]]], ZM, drop=True, page_from=pn, garbages=self.layout_garbages)
+        self.pipelined_layouts[pn] = bxs
+        self.page_layout[pn] = lts[0]
+
     def _assign_column(self, boxes, zoomin=3):
         if not boxes:
             return boxes
@@ -341,30 +415,25 @@ class RAGFlowPdfParser:
         if all("col_id" in b for b in boxes):
             return boxes
 
-        by_page = defaultdict(list)
-        for b in boxes:
-            by_page[b["page_number"]].append(b)
+        # geometry as columns, boxes of each page as index arrays in order of first appearance
+        x0 = np.array([b["x0"] for b in boxes], dtype=np.float64)
+        x1 = np.array([b["x1"] for b in boxes], dtype=np.float64)
+        page_numbers = np.array([b["page_number"] for b in boxes])
+        pgs, first, inverse = np.unique(page_numbers, return_index=True, return_inverse=True)
+        by_page = {int(pgs[k]): np.flatnonzero(inverse == k) for k in np.argsort(first, kind="stable")}
 
         page_info = {}  # pg -> dict(page_w, left_edge, cand_cols)
         counter = Counter()
 
-        for pg, bxs in by_page.items():
-            if not bxs:
-                page_info[pg] = {"page_w": 1.0, "left_edge": 0.0, "cand": 1}
-                counter[1] += 1
-                continue
-
+        for pg, ids in by_page.items():
             if hasattr(self, "page_images") and self.page_images and len(self.page_images) >= pg:
-                page_w = self.page_images[pg - 1].size[0] / max(1, zoomin)
+                page_w = self._page_size(pg - 1)[0] / max(1, zoomin)
                 left_edge = 0.0
             else:
-                xs0 = [box["x0"] for box in bxs]
-                xs1 = [box["x1"] for box in bxs]
-                left_edge = float(min(xs0))
-                page_w = max(1.0, float(max(xs1) - left_edge))
+                left_edge = float(x0[ids].min())
+                page_w = max(1.0, float(x1[ids].max() - left_edge))
 
-            widths = [max(1.0, (box["x1"] - box["x0"])) for box in bxs]
-            median_w = float(np.median(widths)) if widths else 1.0
+            median_w = float(np.median(np.maximum(1.0, x1[ids] - x0[ids])))
 
             raw_cols = int(page_w / max(1.0, median_w))
 
@@ -379,27 +448,16 @@ class RAGFlowPdfParser:
         global_cols = counter.most_common(1)[0][0]
         logging.info(f"Global column_num decided by majority: {global_cols}")
 
-        for pg, bxs in by_page.items():
-            if not bxs:
-                continue
-
-            page_w = page_info[pg]["page_w"]
-            left_edge = page_info[pg]["left_edge"]
-
-            if global_cols == 1:
-                for box in bxs:
-                    box["col_id"] = 0
-                continue
-
-            for box in bxs:
-                w = box["x1"] - box["x0"]
-                if w >= 0.8 * page_w:
-                    box["col_id"] = 0
-                    continue
-                cx = 0.5 * (box["x0"] + box["x1"])
-                norm_cx = (cx - left_edge) / page_w
-                norm_cx = max(0.0, min(norm_cx, 0.999999))
-                box["col_id"] = int(min(global_cols - 1, norm_cx * global_cols))
+        col_ids = np.zeros(len(boxes), dtype=np.int64)
+        if global_cols != 1:
+            for pg, ids in by_page.items():
+                page_w = page_info[pg]["page_w"]
+                left_edge = page_info[pg]["left_edge"]
+                norm_cx = np.clip((0.5 * (x0[ids] + x1[ids]) - left_edge) / page_w, 0.0, 0.999999)
+                cols = np.minimum(global_cols - 1, (norm_cx * global_cols).astype(np.int64))
+                col_ids[ids] = np.where(x1[ids] - x0[ids] >= 0.8 * page_w, 0, cols)
+        for b, col in zip(boxes, col_ids.tolist()):
+            b["col_id"] = col
 
         return boxes
 
@@ -924,8 +982,8 @@ class RAGFlowPdfParser:
         page_images_cnt = len(self.page_images)
         if pn[-1] - 1 >= page_images_cnt:
             return ""
-        while bott * ZM > self.page_images[pn[-1] - 1].size[1]:
-            bott -= self.page_images[pn[-1] - 1].size[1] / ZM
+        while bott * ZM > self._page_size(pn[-1] - 1)[1]:
+            bott -= self._page_size(pn[-1] - 1)[1] / ZM
             pn.append(pn[-1] + 1)
             if pn[-1] - 1 >= page_images_cnt:
                 return ""
@@ -942,7 +1000,7 @@ class RAGFlowPdfParser:
         def usefull(b):
             if b.get("layout_type"):
                 return True
-            if width(b) > self.page_images[b["page_number"] - 1].size[0] / ZM / 3:
+            if width(b) > self._page_size(b["page_number"] - 1)[0] / ZM / 3:
                 return True
             if b["bottom"] - b["top"] > self.mean_height[b["page_number"] - 1]:
                 return True
@@ -952,7 +1010,7 @@ class RAGFlowPdfParser:
         while boxes:
             lines = []
             widths = []
-            pw = self.page_images[boxes[0]["page_number"] - 1].size[0] / ZM
+            pw = self._page_size(boxes[0]["page_number"] - 1)[0] / ZM
             mh = self.mean_height[boxes[0]["page_number"] - 1]
             mj = self.proj_match(boxes[0]["text"]) or boxes[0].get("layout_type", "") == "title"
 
@@ -1012,20 +1070,63 @@ class RAGFlowPdfParser:
         self.page_cum_height = [0]
         self.page_layout = []
         self.page_from = page_from
+        self.layout_garbages = {}
+        self.pipelined_layouts = None
+        self.pipelined_tb_cpns = None
+        self.page_views = None
+        self.page_rulings = []
+        if isinstance(getattr(self, "page_images", None), PageImageWindow):
+            self.page_images.close()
+        windowed = self.page_window > 0 or self.pipeline
+        english_votes, has_text_layer = [], False
         start = timer()
         try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
-                    self.pdf = pdf
-                    self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
-
-                    try:
-                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                    except Exception as e:
-                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-
-                    self.total_page = len(self.pdf.pages)
+            if windowed:
+                # Pages are rendered window by window during OCR. Only the English votes are
+                # taken from the char layer here; chars are extracted again per window.
+                self.page_images = PageImageWindow(fnm, zoomin, page_from, page_to, self.page_window or page_to - page_from)
+                self.total_page = self.page_images.total_page
+                for i, page in enumerate(self.page_images.pages):
+                    chars = self.__page_chars(page, page_from + i)
+                    english_votes.append(self._is_english_page(chars))
+                    has_text_layer = has_text_layer or bool(chars)
+                    if self.ruled_tables:
+                        self.page_rulings.append(self.__page_rulings(page, page_from + i))
+                    self.page_images.release(i)
+                self.page_chars = [[] for _ in range(len(self.page_images))]
+                if self.pipeline:
+                    # filled page by page as pages leave the layout and TSR stages
+                    self.pipelined_layouts = [[] for _ in range(len(self.page_images))]
+                    self.pipelined_tb_cpns = [[] for _ in range(len(self.page_images))]
+                    self.page_layout = [[] for _ in range(len(self.page_images))]
+            else:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    with pdfplumber.open(fnm) if isinstance(fnm, str) else pdfplumber.open(BytesIO(fnm)) as pdf:
+                        self.pdf = pdf
+                        self.page_images = [p.to_image(resolution=72 * zoomin, antialias=True).annotated for i, p in enumerate(self.pdf.pages[page_from:page_to])]
+
+                        try:
+                            self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
+                        except Exception as e:
+                            logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+                            self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
+
+                        if self.ruled_tables:
+                            # the pdfplumber lock is held already
+                            for i, page in enumerate(self.pdf.pages[page_from:page_to]):
+                                try:
+                                    self.page_rulings.append(page_rulings(page))
+                                except Exception as e:
+                                    logging.warning(f"Failed to extract ruling lines for page {page_from + i}: {str(e)}")
+                                    self.page_rulings.append(([], []))
+
+                        self.total_page = len(self.pdf.pages)
+                english_votes = [self._is_english_page(chars) for chars in self.page_chars]
+                has_text_layer = any([c for c in self.page_chars])
+
+            if 0 < self.model_zoomin < zoomin:
+                # reduced copies of the pages for the layout and TSR models, made as the pages are rendered
+                self.page_views = PageViews(self.page_images, zoomin, self.model_zoomin)
 
         except Exception:
             logging.exception("RAGFlowPdfParser __images__")
@@ -1054,16 +1155,13 @@ class RAGFlowPdfParser:
             logging.warning("Miss outlines")
 
         logging.debug("Images converted.")
-        self.is_english = [
-            re.search(r"[a-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join(random.choices([c["text"] for c in self.page_chars[i]], k=min(100, len(self.page_chars[i])))))
-            for i in range(len(self.page_chars))
-        ]
+        self.is_english = english_votes
         if sum([1 if e else 0 for e in self.is_english]) > len(self.page_images) / 2:
             self.is_english = True
         else:
             self.is_english = False
 
-        async def __img_ocr(i, id, img, chars, limiter):
+        def __space_chars(chars):
             j = 0
             while j + 1 < len(chars):
                 if (
@@ -1075,42 +1173,148 @@ class RAGFlowPdfParser:
                     chars[j]["text"] += " "
                 j += 1
 
-            if limiter:
-                async with limiter:
-                    await trio.to_thread.run_sync(lambda: self.__ocr(i + 1, img, chars, zoomin, id))
-            else:
-                self.__ocr(i + 1, img, chars, zoomin, id)
+        def __img_ocr(i, id, img, chars, detected=None):
+            __space_chars(chars)
+            self.__ocr(i + 1, img, chars, zoomin, id, text_layer[i], detected)
 
             if callback and i % 6 == 5:
                 callback((i + 1) * 0.6 / len(self.page_images))
 
-        async def __img_ocr_launcher():
-            def __ocr_preprocess():
-                chars = self.page_chars[i] if not self.is_english else []
-                self.mean_height.append(np.median(sorted([c["height"] for c in chars])) if chars else 0)
-                self.mean_width.append(np.median(sorted([c["width"] for c in chars])) if chars else 8)
-                self.page_cum_height.append(img.size[1] / zoomin)
-                return chars
-
-            if self.parallel_limiter:
-                async with trio.open_nursery() as nursery:
-                    for i, img in enumerate(self.page_images):
-                        chars = __ocr_preprocess()
-
-                        nursery.start_soon(__img_ocr, i, i % PARALLEL_DEVICES, img, chars, self.parallel_limiter[i % PARALLEL_DEVICES])
-                        await trio.sleep(0.1)
+        text_layer = [False] * len(self.page_images)
+
+        def __ocr_preprocess(i, img):
+            # pages with a healthy text layer get their lines from the chars, skipping detection
+            text_layer[i] = self.text_layer_fast_path and text_layer_healthy(self.page_chars[i])
+            chars = self.page_chars[i] if not self.is_english or text_layer[i] else []
+            self.mean_height.append(np.median(sorted([c["height"] for c in chars])) if chars else 0)
+            self.mean_width.append(np.median(sorted([c["width"] for c in chars])) if chars else 8)
+            self.page_cum_height.append(img.size[1] / zoomin)
+            self.boxes.append([])
+            return chars
+
+        async def __img_ocr_pages(pages):
+            if self.device_scheduler:
+
+                def __device_jobs():
+                    for i in pages:
+                        img = self.page_images[i]
+                        yield i, img, __ocr_preprocess(i, img)
+
+                await self.device_scheduler.run(__device_jobs(), lambda job, id: __img_ocr(job[0], id, job[1], job[2]))
+            elif self.ocr_workers > 1:
+
+                def __pool_tasks():
+                    for i in pages:
+                        img = self.page_images[i]
+                        chars = __ocr_preprocess(i, img)
+                        __space_chars(chars)
+                        yield i + 1, img, chars, zoomin, self.mean_height[i], text_layer[i]
+
+                # results come back in page order
+                ocr_pool = shared_ocr_pool(self.ocr_workers, self.ocr_threads_per_worker)
+                for n, res in enumerate(ocr_pool.map(__pool_tasks())):
+                    i = pages[n]
+                    self.__ocr_result(i + 1, *res)
+                    if callback and i % 6 == 5:
+                        callback((i + 1) * 0.6 / len(self.page_images))
+            elif self.det_batch_pages > 1:
+                # detection runs on several pages at once, recognition page by page
+                for st in range(0, len(pages), self.det_batch_pages):
+                    batch = pages[st : st + self.det_batch_pages]
+                    imgs = [self.page_images[i] for i in batch]
+                    chars = [__ocr_preprocess(i, img) for i, img in zip(batch, imgs)]
+                    to_detect = [n for n, i in enumerate(batch) if not text_layer[i]]
+                    start = timer()
+                    detected = dict(zip(to_detect, self.ocr.detect_batch([np.array(imgs[n]) for n in to_detect], 0, self.det_batch_pages)))
+                    if to_detect:
+                        logging.info(f"__ocr detecting boxes of {len(to_detect)} images cost ({timer() - start}s)")
+                    for n, i in enumerate(batch):
+                        __img_ocr(i, 0, imgs[n], chars[n], detected.get(n))
             else:
-                for i, img in enumerate(self.page_images):
-                    chars = __ocr_preprocess()
-                    await __img_ocr(i, 0, img, chars, None)
+                for i in pages:
+                    img = self.page_images[i]
+                    chars = __ocr_preprocess(i, img)
+                    __img_ocr(i, 0, img, chars)
+
+        async def __pipeline_launcher():
+            # render -> OCR -> layout -> TSR, page by page, with at most `depth` pages queued between two stages
+            depth = max(1, self.pipeline_depth)
+            rendered_send, rendered_recv = trio.open_memory_channel(depth)
+            ocred_send, ocred_recv = trio.open_memory_channel(depth)
+            laid_out_send, laid_out_recv = trio.open_memory_channel(depth)
+
+            async def __render():
+                async with rendered_send:
+                    for i in range(len(self.page_images)):
+                        img = await trio.to_thread.run_sync(self.page_images.__getitem__, i)
+                        self.page_chars[i] = await trio.to_thread.run_sync(self.__page_chars, self.page_images.pages[i], page_from + i)
+                        # in page order, since it appends the per-page stats
+                        chars = __ocr_preprocess(i, img)
+                        await rendered_send.send((i, img, chars))
+
+            async def __ocr_stage(id, rendered_recv, ocred_send):
+                async with rendered_recv, ocred_send:
+                    async for i, img, chars in rendered_recv:
+                        await trio.to_thread.run_sync(__img_ocr, i, id, img, chars)
+                        self.page_chars[i] = []
+                        await ocred_send.send((i, img))
+
+            async def __layout_stage():
+                async with ocred_recv, laid_out_send:
+                    async for i, img in ocred_recv:
+                        await trio.to_thread.run_sync(self.__layout_page, i, img, zoomin)
+                        await laid_out_send.send(i)
+
+            async def __tsr_stage():
+                async with laid_out_recv:
+                    async for i in laid_out_recv:
+                        self.pipelined_tb_cpns[i] = (await trio.to_thread.run_sync(self._table_components, [i], zoomin))[0]
+                        self.page_images.release(i)
+
+            async with trio.open_nursery() as nursery:
+                nursery.start_soon(__render)
+                # one OCR lane per device, each pulling the next rendered page when idle
+                async with rendered_recv, ocred_send:
+                    for id in self.device_scheduler.devices if self.device_scheduler else [0]:
+                        nursery.start_soon(__ocr_stage, id, rendered_recv.clone(), ocred_send.clone())
+                nursery.start_soon(__layout_stage)
+                nursery.start_soon(__tsr_stage)
+
+        async def __img_ocr_launcher():
+            if self.pipeline:
+                await __pipeline_launcher()
+                return
+
+            if not windowed:
+                await __img_ocr_pages(range(len(self.page_images)))
+                return
+
+            for st in range(0, len(self.page_images), self.page_window):
+                pages = range(st, min(st + self.page_window, len(self.page_images)))
+                for i in pages:
+                    self.page_chars[i] = self.__page_chars(self.page_images.pages[i], page_from + i)
+                await __img_ocr_pages(pages)
+                for i in pages:
+                    self.page_chars[i] = []
+                    self.page_images.release(i)
 
         start = timer()
+        if self.device_scheduler:
+            self.device_scheduler.reset_stats()
+        for rec in self.ocr.text_recognizer:
+            rec.start_document()
+            rec.reset_stats()
 
         trio.run(__img_ocr_launcher)
 
         logging.info(f"__images__ {len(self.page_images)} pages cost {timer() - start}s")
+        if self.device_scheduler:
+            self.device_scheduler.log_stats("__images__ OCR")
+        for i, rec in enumerate(self.ocr.text_recognizer):
+            if rec.stats()["crops"]:
+                rec.log_stats(f"__images__ text recognizer {i}")
 
-        if not self.is_english and not any([c for c in self.page_chars]) and self.boxes:
+        if not self.is_english and not has_text_layer and self.boxes:
             bxes = [b for bxs in self.boxes for b in bxs]
             self.is_english = re.search(r"[\na-zA-Z0-9,/¸;:'\[\]\(\)!@#$%^&*\"?<>._-]{30,}", "".join([b["text"] for b in random.choices(bxes, k=min(30, len(bxes)))]))
 
@@ -1118,34 +1322,82 @@ class RAGFlowPdfParser:
 
         self.page_cum_height = np.cumsum(self.page_cum_height)
         assert len(self.page_cum_height) == len(self.page_images) + 1
+        self.render_zoomin = zoomin
         if len(self.boxes) == 0 and zoomin < 9:
             self.__images__(fnm, zoomin * 3, page_from, page_to, callback)
 
+    # state left by __images__, _layouts_rec and _table_transformer_job, which is what the parse cache keeps
+    _CACHED_STATE = ["boxes", "page_layout", "tb_cpns", "mean_height", "mean_width", "page_cum_height", "is_english", "total_page", "outlines", "page_from", "render_zoomin"]
+
+    def _parse_cache_key(self, fnm, zoomin, page_from=0, page_to=299):
+        if not self.parse_cache:
+            return None
+        try:
+            return ParseCache.key(fnm, zoomin=zoomin, page_from=page_from, page_to=page_to, **self.parse_cache_options)
+        except Exception:
+            logging.exception("RAGFlowPdfParser parse cache key")
+            return None
+
+    def _load_parse_cache(self, key, fnm, page_from=0, page_to=299):
+        """Restore the model-stage state of a previous parse; page images are then rendered on demand."""
+        if not key:
+            return False
+        state = self.parse_cache.get(key)
+        if state is None:
+            return False
+        for k in self._CACHED_STATE:
+            setattr(self, k, state[k])
+        if isinstance(getattr(self, "page_images", None), PageImageWindow):
+            self.page_images.close()
+        self.page_images = PageImageWindow(fnm, self.render_zoomin, page_from, page_to, self.page_window or page_to - page_from)
+        self.page_views = None
+        self.page_chars = [[] for _ in range(len(self.page_images))]
+        self.lefted_chars = []
+        logging.info(f"RAGFlowPdfParser restored {len(self.page_images)} pages from parse cache {key}")
+        return True
+
+    def _save_parse_cache(self, key):
+        if key and self.boxes:
+            state = {k: getattr(self, k) for k in self._CACHED_STATE}
+            # is_english may hold a re.Match, which does not pickle
+            state["is_english"] = bool(self.is_english)
+            self.parse_cache.put(key, state)
+
     def __call__(self, fnm, need_image=True, zoomin=3, return_html=False):
-        self.__images__(fnm, zoomin)
-        self._layouts_rec(zoomin)
-        self._table_transformer_job(zoomin)
+        key = self._parse_cache_key(fnm, zoomin)
+        if not self._load_parse_cache(key, fnm):
+            self.__images__(fnm, zoomin)
+            self._layouts_rec(zoomin)
+            self._table_transformer_job(zoomin)
+            self._save_parse_cache(key)
         self._text_merge()
         self._concat_downward()
         self._filter_forpages()
         tbls = self._extract_table_figure(need_image, zoomin, return_html, False)
-        return self.__filterout_scraps(deepcopy(self.boxes), zoomin), tbls
+        # __filterout_scraps pops from the list but never changes the boxes
+        return self.__filterout_scraps(list(self.boxes), zoomin), tbls
 
     def parse_into_bboxes(self, fnm, callback=None, zoomin=3):
         start = timer()
-        self.__images__(fnm, zoomin, callback=callback)
-        if callback:
-            callback(0.40, "OCR finished ({:.2f}s)".format(timer() - start))
+        key = self._parse_cache_key(fnm, zoomin)
+        if self._load_parse_cache(key, fnm):
+            if callback:
+                callback(0.83, "Restored OCR, layout and table analysis from cache ({:.2f}s)".format(timer() - start))
+        else:
+            self.__images__(fnm, zoomin, callback=callback)
+            if callback:
+                callback(0.40, "OCR finished ({:.2f}s)".format(timer() - start))
 
-        start = timer()
-        self._layouts_rec(zoomin)
-        if callback:
-            callback(0.63, "Layout analysis ({:.2f}s)".format(timer() - start))
+            start = timer()
+            self._layouts_rec(zoomin)
+            if callback:
+                callback(0.63, "Layout analysis ({:.2f}s)".format(timer() - start))
 
-        start = timer()
-        self._table_transformer_job(zoomin)
-        if callback:
-            callback(0.83, "Table analysis ({:.2f}s)".format(timer() - start))
+            start = timer()
+            self._table_transformer_job(zoomin)
+            if callback:
+                callback(0.83, "Table analysis ({:.2f}s)".format(timer() - start))
+            self._save_parse_cache(key)
 
         start = timer()
         self._text_merge()
@@ -1213,7 +1465,8 @@ class RAGFlowPdfParser:
         insert_table_figures(figs, "figure")
         if callback:
             callback(1, "Structured ({:.2f}s)".format(timer() - start))
-        return deepcopy(self.boxes)
+        # copies the boxes and their nested lists (positions), without duplicating their cropped images
+        return [{k: deepcopy(v) if isinstance(v, (list, dict)) else v for k, v in b.items()} for b in self.boxes]
 
     @staticmethod
     def remove_tag(txt):
@@ -1241,23 +1494,23 @@ class RAGFlowPdfParser:
         pos = poss[0]
         poss.insert(0, ([pos[0][0]], pos[1], pos[2], max(0, pos[3] - 120), max(pos[3] - GAP, 0)))
         pos = poss[-1]
-        poss.append(([pos[0][-1]], pos[1], pos[2], min(self.page_images[pos[0][-1]].size[1] / ZM, pos[4] + GAP), min(self.page_images[pos[0][-1]].size[1] / ZM, pos[4] + 120)))
+        poss.append(([pos[0][-1]], pos[1], pos[2], min(self._page_size(pos[0][-1])[1] / ZM, pos[4] + GAP), min(self._page_size(pos[0][-1])[1] / ZM, pos[4] + 120)))
 
         positions = []
         for ii, (pns, left, right, top, bottom) in enumerate(poss):
             right = left + max_width
             bottom *= ZM
             for pn in pns[1:]:
-                bottom += self.page_images[pn - 1].size[1]
-            imgs.append(self.page_images[pns[0]].crop((left * ZM, top * ZM, right * ZM, min(bottom, self.page_images[pns[0]].size[1]))))
+                bottom += self._page_size(pn - 1)[1]
+            imgs.append(self.page_images[pns[0]].crop((left * ZM, top * ZM, right * ZM, min(bottom, self._page_size(pns[0])[1]))))
             if 0 < ii < len(poss) - 1:
-                positions.append((pns[0] + self.page_from, left, right, top, min(bottom, self.page_images[pns[0]].size[1]) / ZM))
-            bottom -= self.page_images[pns[0]].size[1]
+                positions.append((pns[0] + self.page_from, left, right, top, min(bottom, self._page_size(pns[0])[1]) / ZM))
+            bottom -= self._page_size(pns[0])[1]
             for pn in pns[1:]:
-                imgs.append(self.page_images[pn].crop((left * ZM, 0, right * ZM, min(bottom, self.page_images[pn].size[1]))))
+                imgs.append(self.page_images[pn].crop((left * ZM, 0, right * ZM, min(bottom, self._page_size(pn)[1]))))
                 if 0 < ii < len(poss) - 1:
-                    positions.append((pn + self.page_from, left, right, 0, min(bottom, self.page_images[pn].size[1]) / ZM))
-                bottom -= self.page_images[pn].size[1]
+                    positions.append((pn + self.page_from, left, right, 0, min(bottom, self._page_size(pn)[1]) / ZM))
+                bottom -= self._page_size(pn)[1]
 
         if not imgs:
             if need_position:
@@ -1288,12 +1541,12 @@ class RAGFlowPdfParser:
         pn = bx["page_number"]
         top = bx["top"] - self.page_cum_height[pn - 1]
         bott = bx["bottom"] - self.page_cum_height[pn - 1]
-        poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self.page_images[pn - 1].size[1] / ZM)))
-        while bott * ZM > self.page_images[pn - 1].size[1]:
-            bott -= self.page_images[pn - 1].size[1] / ZM
+        poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self._page_size(pn - 1)[1] / ZM)))
+        while bott * ZM > self._page_size(pn - 1)[1]:
+            bott -= self._page_size(pn - 1)[1] / ZM
             top = 0
             pn += 1
-            poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self.page_images[pn - 1].size[1] / ZM)))
+            poss.append((pn, bx["x0"], bx["x1"], top, min(bott, self._page_size(pn - 1)[1] / ZM)))
         return poss
 
 
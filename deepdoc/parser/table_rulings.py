@@ -0,0 +1,162 @@
+import logging
+
+# Positions of ruling lines closer than SNAP points are the same line; gaps of
+# up to SNAP points along a line are joined.
+SNAP = 3.0
+# Segments shorter than this are ignored: the sides of hairline rects, ticks.
+MIN_SEGMENT = 4.0
+# Share of a cell side a ruling line has to draw for the side to count as ruled.
+SIDE_COVER = 0.8
+# Share of the outer frame that has to be drawn, and of the table layout the grid has to cover.
+FRAME_COVER = 0.95
+LAYOUT_COVER = 0.8
+
+
+def page_rulings(page):
+    """
+    Ruling segments of a pdfplumber page, from its lines, rects and curves:
+    horizontal ones as (y, x0, x1) and vertical ones as (x, top, bottom), in
+    page coordinates, as the page chars are.
+    """
+    hs, vs = [], []
+    for e in page.edges:
+        if e["orientation"] == "h" and e["x1"] - e["x0"] >= MIN_SEGMENT:
+            hs.append(((e["top"] + e["bottom"]) / 2, e["x0"], e["x1"]))
+        elif e["orientation"] == "v" and e["bottom"] - e["top"] >= MIN_SEGMENT:
+            vs.append(((e["x0"] + e["x1"]) / 2, e["top"], e["bottom"]))
+    return hs, vs
+
+
+def _clip(segments, lo, hi, start, end):
+    """Segments with their position within [lo, hi], clipped to [start, end] along the line."""
+    res = []
+    for pos, a, b in segments:
+        if lo <= pos <= hi:
+            a, b = max(a, start), min(b, end)
+            if b - a >= MIN_SEGMENT:
+                res.append((pos, a, b))
+    return res
+
+
+def _snap(segments):
+    """Ruling lines as (position, [(start, end), ...]): segments SNAP apart merged, their spans joined."""
+    lines = []
+    for pos, a, b in sorted(segments):
+        if lines and pos - lines[-1][2] <= SNAP:
+            lines[-1][0].append(pos)
+            lines[-1][1].append((a, b))
+            lines[-1][2] = pos
+        else:
+            lines.append([[pos], [(a, b)], pos])
+    res = []
+    for poss, spans, _ in lines:
+        joined = []
+        for a, b in sorted(spans):
+            if joined and a - joined[-1][1] <= SNAP:
+                joined[-1][1] = max(joined[-1][1], b)
+            else:
+                joined.append([a, b])
+        res.append((sum(poss) / len(poss), joined))
+    return res
+
+
+def _cover(spans, a, b):
+    """Share of [a, b] the joined spans of a line draw."""
+    if b <= a:
+        return 0.0
+    return sum(max(0.0, min(e, b) - max(s, a)) for s, e in spans) / (b - a)
+
+
+def _grid(hlines, vlines):
+    """
+    Drops lines which rule no side of any cell of the grid the other lines
+    make, until every line rules some side.
+    """
+    while True:
+        ys, xs = [p for p, _ in hlines], [p for p, _ in vlines]
+        keep_h = [ln for ln in hlines if any(_cover(ln[1], xs[c] + SNAP, xs[c + 1] - SNAP) >= SIDE_COVER for c in range(len(xs) - 1))]
+        keep_v = [ln for ln in vlines if any(_cover(ln[1], ys[r] + SNAP, ys[r + 1] - SNAP) >= SIDE_COVER for r in range(len(ys) - 1))]
+        if len(keep_h) == len(hlines) and len(keep_v) == len(vlines):
+            return hlines, vlines
+        hlines, vlines = keep_h, keep_v
+
+
+def ruled_table_components(rulings, x0, top, x1, bottom, margin=10):
+    """
+    Table components of the table layout (x0, top, x1, bottom) read off the
+    ruling lines drawn around it, in the shape TableStructureRecognizer
+    returns them: the table, its rows and columns, the first row (with the
+    rows its cells span) as column header and every merged cell as spanning
+    cell, in page coordinates.
+
+    Returns None unless the table is fully ruled: at least two rows and two
+    columns, a closed outer frame covering the layout, and cells merged only
+    into rectangles. Such tables are left to the model.
+    """
+    hs, vs = rulings
+    hs = _clip(hs, top - margin, bottom + margin, x0 - margin, x1 + margin)
+    vs = _clip(vs, x0 - margin, x1 + margin, top - margin, bottom + margin)
+    if len(hs) < 3 or len(vs) < 3:
+        return None
+    hlines, vlines = _grid(_snap(hs), _snap(vs))
+    if len(hlines) < 3 or len(vlines) < 3:
+        return None
+    ys, xs = [p for p, _ in hlines], [p for p, _ in vlines]
+    R, C = len(ys) - 1, len(xs) - 1
+
+    # the outer frame is drawn all around
+    if min(_cover(hlines[0][1], xs[0], xs[-1]), _cover(hlines[-1][1], xs[0], xs[-1])) < FRAME_COVER:
+        return None
+    if min(_cover(vlines[0][1], ys[0], ys[-1]), _cover(vlines[-1][1], ys[0], ys[-1])) < FRAME_COVER:
+        return None
+    # and is the table the layout found, not a box within it or a frame around more
+    iw = min(x1, xs[-1]) - max(x0, xs[0])
+    ih = min(bottom, ys[-1]) - max(top, ys[0])
+    if iw <= 0 or ih <= 0:
+        return None
+    inter = iw * ih
+    if inter < LAYOUT_COVER * (x1 - x0) * (bottom - top) or inter < LAYOUT_COVER * (xs[-1] - xs[0]) * (ys[-1] - ys[0]):
+        return None
+
+    # merge the cells across the sides left unruled
+    parent = list(range(R * C))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for r in range(R):
+        for c in range(1, C):
+            if _cover(vlines[c][1], ys[r] + SNAP, ys[r + 1] - SNAP) < SIDE_COVER:
+                parent[find(r * C + c)] = find(r * C + c - 1)
+    for r in range(1, R):
+        for c in range(C):
+            if _cover(hlines[r][1], xs[c] + SNAP, xs[c + 1] - SNAP) < SIDE_COVER:
+                parent[find(r * C + c)] = find((r - 1) * C + c)
+
+    cells = {}
+    for i in range(R * C):
+        cells.setdefault(find(i), []).append(divmod(i, C))
+    merged = []
+    for grp in cells.values():
+        r0, r1 = min(r for r, _ in grp), max(r for r, _ in grp)
+        c0, c1 = min(c for _, c in grp), max(c for _, c in grp)
+        if (r1 - r0 + 1) * (c1 - c0 + 1) != len(grp):
+            logging.debug("ruled_table_components: cells merged into a non-rectangular shape")
+            return None
+        if len(grp) > 1:
+            merged.append((r0, r1, c0, c1))
+
+    def cpn(label, r0, r1, c0, c1):
+        return {"label": label, "score": 1.0, "x0": xs[c0], "x1": xs[c1 + 1], "top": ys[r0], "bottom": ys[r1 + 1]}
+
+    res = [cpn("table", 0, R - 1, 0, C - 1)]
+    res.extend(cpn("table row", r, r, 0, C - 1) for r in range(R))
+    res.extend(cpn("table column", 0, R - 1, c, c) for c in range(C))
+    header = max([r1 for r0, r1, _, _ in merged if r0 == 0], default=0)
+    if header < R - 1:
+        res.append(cpn("table column header", 0, header, 0, C - 1))
+    res.extend(cpn("table spanning cell", *m) for m in merged)
+    return res
@@ -6,6 +6,8 @@ import pdfplumber
 from PIL import Image
 
 from .ocr import OCR
+from .box_index import BoxIndex
+from .device_scheduler import DeviceScheduler
 from .recognizer import Recognizer
 from .layout_recognizer import AscendLayoutRecognizer
 from .layout_recognizer import LayoutRecognizer4YOLOv10 as LayoutRecognizer
@@ -89,6 +91,8 @@ def init_in_out(args):
 
 __all__ = [
     "OCR",
+    "BoxIndex",
+    "DeviceScheduler",
     "Recognizer",
     "LayoutRecognizer",
     "AscendLayoutRecognizer",
@@ -0,0 +1,165 @@
+import math
+
+import numpy as np
+
+
+class BoxIndex:
+    """
+    A spatial index over boxes with x0/x1/top/bottom, answering the overlap
+    queries of `Recognizer` without scanning every box in Python.
+
+    Boxes are bucketed into the rows of a uniform grid along y; a query reads
+    the buckets its y range covers and filters the candidates with numpy.
+    Results are indices into `boxes` and follow the tie-breaking of the
+    linear scans they replace.
+
+    The index keeps references to the boxes; it must be rebuilt if their
+    coordinates change or boxes are added or removed.
+    """
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+        self.x0 = np.array([b["x0"] for b in boxes], dtype=np.float64)
+        self.x1 = np.array([b["x1"] for b in boxes], dtype=np.float64)
+        self.top = np.array([b["top"] for b in boxes], dtype=np.float64)
+        self.bottom = np.array([b["bottom"] for b in boxes], dtype=np.float64)
+        self._groups = None
+        if not boxes:
+            return
+
+        lo = np.minimum(self.top, self.bottom)
+        hi = np.maximum(self.top, self.bottom)
+        self._ymin = float(lo.min())
+        span = float(hi.max()) - self._ymin
+        # rows about as tall as a typical box, but no more rows than 4 per box
+        self._cell = max(float(np.median(hi - lo)), span / (4 * len(boxes)), 1e-6)
+        r0 = self._row(lo)
+        r1 = self._row(hi)
+        self._nrows = int(r1.max()) + 1
+
+        # CSR layout: ids of the boxes in row r are _ids[_starts[r]:_starts[r + 1]]
+        counts = r1 - r0 + 1
+        ids = np.repeat(np.arange(len(boxes)), counts)
+        rows = np.repeat(r0, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        order = np.argsort(rows, kind="stable")
+        self._ids = ids[order]
+        self._starts = np.searchsorted(rows[order], np.arange(self._nrows + 1))
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def _row(self, y):
+        return np.floor((y - self._ymin) / self._cell).astype(np.int64)
+
+    def overlapping(self, box):
+        """Ascending indices of the boxes sharing at least a point with `box`."""
+        if not self.boxes:
+            return np.empty(0, dtype=np.int64)
+        q0 = math.floor((min(box["top"], box["bottom"]) - self._ymin) / self._cell)
+        q1 = math.floor((max(box["top"], box["bottom"]) - self._ymin) / self._cell)
+        q0, q1 = max(q0, 0), min(q1, self._nrows - 1)
+        if q0 > q1:
+            return np.empty(0, dtype=np.int64)
+        ids = np.unique(self._ids[self._starts[q0] : self._starts[q1 + 1]])
+        hit = ~((self.x0[ids] > box["x1"]) | (self.x1[ids] < box["x0"]) | (self.bottom[ids] < box["top"]) | (self.top[ids] > box["bottom"]))
+        return ids[hit]
+
+    def _overlapped_areas(self, ids, box):
+        """
+        `Recognizer.overlapped_area(box, b)` and `Recognizer.overlapped_area(b, box)`
+        for the boxes `ids`, which must all overlap `box`.
+        """
+        x0, x1, tp, btm = box["x0"], box["x1"], box["top"], box["bottom"]
+        bx0, bx1, btp, bbtm = self.x0[ids], self.x1[ids], self.top[ids], self.bottom[ids]
+        inter = (np.minimum(bbtm, btm) - np.maximum(btp, tp)) * (np.minimum(bx1, x1) - np.maximum(bx0, x0))
+
+        if x1 - x0 != 0 and btm - tp != 0:
+            ov = np.where(inter > 0, inter / ((x1 - x0) * (btm - tp)), inter)
+        else:
+            ov = np.zeros_like(inter)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            b_area = (bx1 - bx0) * (bbtm - btp)
+            _ov = np.where((bx1 - bx0 != 0) & (bbtm - btp != 0), inter, 0.0)
+            _ov = np.where(_ov > 0, _ov / b_area, _ov)
+        return ov, _ov
+
+    def overlap_matrix(self, boxes):
+        """
+        `_overlapped_areas` of every box of `boxes` (rows) against every indexed
+        box (columns) at once, and whether each pair shares at least a point.
+        Returns (hit, ov, _ov); ov and _ov are only meaningful where hit.
+        """
+        shape = (len(boxes), len(self.boxes))
+        if not boxes or not self.boxes:
+            return np.zeros(shape, dtype=bool), np.zeros(shape), np.zeros(shape)
+        x0 = np.array([b["x0"] for b in boxes], dtype=np.float64)[:, None]
+        x1 = np.array([b["x1"] for b in boxes], dtype=np.float64)[:, None]
+        tp = np.array([b["top"] for b in boxes], dtype=np.float64)[:, None]
+        btm = np.array([b["bottom"] for b in boxes], dtype=np.float64)[:, None]
+        bx0, bx1, btp, bbtm = self.x0[None, :], self.x1[None, :], self.top[None, :], self.bottom[None, :]
+        hit = ~((bx0 > x1) | (bx1 < x0) | (bbtm < tp) | (btp > btm))
+        inter = (np.minimum(bbtm, btm) - np.maximum(btp, tp)) * (np.minimum(bx1, x1) - np.maximum(bx0, x0))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            area = (x1 - x0) * (btm - tp)
+            ov = np.where((x1 - x0 != 0) & (btm - tp != 0), inter, 0.0)
+            ov = np.where(ov > 0, ov / area, ov)
+            b_area = (bx1 - bx0) * (bbtm - btp)
+            _ov = np.where((bx1 - bx0 != 0) & (bbtm - btp != 0), inter, 0.0)
+            _ov = np.where(_ov > 0, _ov / b_area, _ov)
+        return hit, ov, _ov
+
+    def best_overlap(self, box, thr=0.3):
+        """Same as `Recognizer.find_overlapped_with_threshold(box, self.boxes, thr)`."""
+        if not self.boxes:
+            return
+        if thr > 0:
+            ids = self.overlapping(box)
+            ov, _ov = self._overlapped_areas(ids, box)
+        else:
+            # with a non-positive threshold even disjoint boxes (0, 0) can win
+            ids = np.arange(len(self.boxes))
+            hit = np.isin(ids, self.overlapping(box))
+            ov, _ov = np.zeros(len(ids)), np.zeros(len(ids))
+            ov[hit], _ov[hit] = self._overlapped_areas(ids[hit], box)
+
+        ok = (ov > thr) | ((ov == thr) & (_ov >= 0))
+        if not ok.any():
+            return
+        ids, ov, _ov = ids[ok], ov[ok], _ov[ok]
+        best = ov == ov.max()
+        best &= _ov == _ov[best].max()
+        # the linear scan keeps the last of equal candidates
+        return int(ids[np.flatnonzero(best)[-1]])
+
+    def tightest_fit(self, box):
+        """Same as `Recognizer.find_horizontally_tightest_fit(box, self.boxes)`."""
+        if not self.boxes:
+            return
+        if self._groups is None:
+            groups = {}
+            for i, b in enumerate(self.boxes):
+                groups.setdefault(b.get("layoutno", "0"), []).append(i)
+            self._groups = {k: np.array(v) for k, v in groups.items()}
+        ids = self._groups.get(box.get("layoutno", "0"))
+        if ids is None:
+            return
+        bx0, bx1 = self.x0[ids], self.x1[ids]
+        dis = np.minimum(np.minimum(np.abs(box["x0"] - bx0), np.abs(box["x1"] - bx1)), np.abs(box["x0"] + box["x1"] - bx1 - bx0) / 2)
+        k = int(np.argmin(dis))
+        if not dis[k] < 1000000:
+            return
+        return int(ids[k])
+
+    def covered_area(self, box):
+        """Sum of `Recognizer.overlapped_area(b, box, False)` over the boxes overlapping `box`."""
+        ids = self.overlapping(box)
+        if not len(ids):
+            return 0
+        x0, x1, tp, btm = box["x0"], box["x1"], box["top"], box["bottom"]
+        bx0, bx1, btp, bbtm = self.x0[ids], self.x1[ids], self.top[ids], self.bottom[ids]
+        inter = (np.minimum(bbtm, btm) - np.maximum(btp, tp)) * (np.minimum(bx1, x1) - np.maximum(bx0, x0))
+        inter = np.where((bx1 - bx0 != 0) & (bbtm - btp != 0), inter, 0.0)
+        # summed in box order, like the loop it replaces
+        return sum(inter.tolist())
@@ -0,0 +1,65 @@
+import logging
+from timeit import default_timer as timer
+
+import trio
+
+
+class DeviceScheduler:
+    """
+    Run jobs on a set of devices from one shared queue.
+
+    Each device has a single worker which pulls the next job as soon as it is
+    idle, so a slow job only delays its own device and no device waits while
+    jobs are queued. Jobs are handed out in the order they are produced.
+
+    Busy time and job counts are kept per device; see `stats()`.
+    """
+
+    def __init__(self, devices):
+        self.devices = list(devices)
+        self.reset_stats()
+
+    async def run(self, jobs, fn):
+        """
+        Call `fn(job, device_id)` in a worker thread for every job of the
+        iterable `jobs`. The iterable is consumed lazily: the next job is only
+        produced when a device is free to take it.
+        """
+        start = timer()
+        send_channel, receive_channel = trio.open_memory_channel(0)
+        async with trio.open_nursery() as nursery:
+            async with receive_channel:
+                for device_id in self.devices:
+                    nursery.start_soon(self._worker, device_id, receive_channel.clone(), fn)
+            async with send_channel:
+                for job in jobs:
+                    await send_channel.send(job)
+        self._wall += timer() - start
+
+    async def _worker(self, device_id, receive_channel, fn):
+        async with receive_channel:
+            async for job in receive_channel:
+                start = timer()
+                await trio.to_thread.run_sync(fn, job, device_id)
+                self._busy[device_id] += timer() - start
+                self._jobs[device_id] += 1
+
+    def reset_stats(self):
+        self._jobs = {d: 0 for d in self.devices}
+        self._busy = {d: 0.0 for d in self.devices}
+        self._wall = 0.0
+
+    def stats(self):
+        """Jobs, busy seconds and utilization (busy / wall time of `run`) of every device."""
+        return {
+            d: {
+                "jobs": self._jobs[d],
+                "busy": self._busy[d],
+                "utilization": self._busy[d] / self._wall if self._wall else 0.0,
+            }
+            for d in self.devices
+        }
+
+    def log_stats(self, prefix="DeviceScheduler"):
+        for d, s in self.stats().items():
+            logging.info(f"{prefix} device {d}: {s['jobs']} jobs, busy {s['busy']:.2f}s, utilization {s['utilization']:.0%}")
@@ -27,9 +27,87 @@ from huggingface_hub import snapshot_download
 
 from common.file_utils import get_project_base_directory
 from .recognizer import Recognizer
+from .box_index import BoxIndex
 from .operators import nms
 
 
+def drop_garbages(boxes, garbages):
+    """Drop the boxes whose text was dropped more than once as a header, footer or reference."""
+    garbag_set = set()
+    for k in garbages.keys():
+        for g, c in Counter(garbages[k]).items():
+            if c > 1:
+                garbag_set.add(g)
+    return [b for b in boxes if b["text"].strip() not in garbag_set]
+
+
+# Layout types in the order OCR boxes are matched against them: a box takes the first type it overlaps.
+LAYOUT_PRIORITY = ["footer", "header", "reference", "figure caption", "table caption", "title", "table", "text", "figure", "equation"]
+GARBAGE_TEXT = [re.compile(p) for p in [r"^•+$", r"^[0-9]{1,2} / ?[0-9]{1,2}$", r"^[0-9]{1,2} of [0-9]{1,2}$", r"^http://[^ ]{12,}", r"\(cid *: *[0-9]+ *\)"]]
+
+
+def tag_layouts(bxs, lts, image_height, scale_factor, garbage_layouts, drop, garbages, thr=0.4):
+    """
+    Tag the OCR boxes `bxs` of a page with the layouts `lts` of the page, in place.
+
+    An untagged box takes the layout overlapping it the most (as
+    `Recognizer.find_overlapped_with_threshold` picks it) among those of the
+    first type of LAYOUT_PRIORITY it overlaps by `thr`, and "" when there is
+    none. Boxes with garbage text are removed, and so are boxes in a
+    `garbage_layouts` layout away from the page edge when `drop`, their text
+    appended to `garbages`. Matched layouts are marked visited.
+
+    The overlaps of all boxes with all layouts are computed as one matrix, so
+    each box is matched once instead of once per layout type.
+    """
+    todo = [i for i, b in enumerate(bxs) if not b.get("layout_type")]
+    garbage = {i for i in todo if any(p.search(bxs[i].get("text", "")) for p in GARBAGE_TEXT)}
+    todo = [i for i in todo if i not in garbage]
+
+    # the position of each layout in its type's list, and its type's priority
+    prio = np.array([LAYOUT_PRIORITY.index(lt["type"]) if lt["type"] in LAYOUT_PRIORITY else len(LAYOUT_PRIORITY) for lt in lts], dtype=np.int64)
+    seen = Counter()
+    pos_in_type = []
+    for lt in lts:
+        pos_in_type.append(seen[lt["type"]])
+        seen[lt["type"]] += 1
+
+    hit, ov, _ov = BoxIndex(lts).overlap_matrix([bxs[i] for i in todo])
+    ok = hit & ((ov > thr) | ((ov == thr) & (_ov >= 0))) & (prio < len(LAYOUT_PRIORITY))[None, :]
+    rows, cols = np.nonzero(ok)
+    # per box: the first type, then the largest ov, then the largest _ov, then the last layout
+    order = np.lexsort((-cols, -_ov[rows, cols], -ov[rows, cols], prio[cols], rows))
+    rows, cols = rows[order], cols[order]
+    first = np.r_[True, rows[1:] != rows[:-1]] if len(rows) else np.zeros(0, dtype=bool)
+    match = dict(zip(rows[first].tolist(), cols[first].tolist()))
+
+    dropped = set(garbage)
+    dropped_texts = []
+    for r, i in enumerate(todo):
+        b = bxs[i]
+        if r not in match:
+            b["layout_type"] = ""
+            continue
+        lt = lts[match[r]]
+        lt["visited"] = True
+        keep_feats = [
+            lt["type"] == "footer" and b["bottom"] < image_height * 0.9 / scale_factor,
+            lt["type"] == "header" and b["top"] > image_height * 0.1 / scale_factor,
+        ]
+        if drop and lt["type"] in garbage_layouts and not any(keep_feats):
+            dropped.add(i)
+            dropped_texts.append((prio[match[r]], lt["type"], b.get("text", "")))
+            continue
+        b["layoutno"] = f"{lt['type']}-{pos_in_type[match[r]]}"
+        b["layout_type"] = lt["type"] if lt["type"] != "equation" else "figure"
+
+    # in type order, as the texts were collected type by type
+    for _, ty, text in sorted(dropped_texts, key=lambda d: d[0]):
+        garbages.setdefault(ty, []).append(text)
+    if dropped:
+        bxs[:] = [b for i, b in enumerate(bxs) if i not in dropped]
+
+
 class LayoutRecognizer(Recognizer):
     labels = [
         "_background_",
@@ -60,101 +138,66 @@ class LayoutRecognizer(Recognizer):
 
             self.client = DLAClient(os.environ["TENSORRT_DLA_SVR"])
 
-    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True):
-        def __is_garbage(b):
-            patt = [r"^•+$", "^[0-9]{1,2} / ?[0-9]{1,2}$", r"^[0-9]{1,2} of [0-9]{1,2}$", "^http://[^ ]{12,}", "\\(cid *: *[0-9]+ *\\)"]
-            return any([re.search(p, b["text"]) for p in patt])
+    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True, page_from=0, garbages=None):
+        """
+        Recognize the layouts of `image_list` and tag the OCR boxes of each page with them.
 
-        if self.client:
-            layouts = self.client.predict(image_list)
-        else:
-            layouts = super().__call__(image_list, thr, batch_size)
-        # save_results(image_list, layouts, self.labels, output_dir='output/', threshold=0.7)
+        `page_from` is the page index of `image_list[0]`. When a `garbages` dict is
+        passed, dropped header/footer/reference texts are collected into it and the
+        caller applies `drop_garbages` once all pages are in; otherwise it is done here.
+        """
         assert len(image_list) == len(ocr_res)
         # Tag layout type
         boxes = []
-        assert len(image_list) == len(layouts)
-        garbages = {}
+        collect_garbages = garbages is not None
+        garbages = {} if garbages is None else garbages
         page_layout = []
-        for pn, lts in enumerate(layouts):
-            bxs = ocr_res[pn]
-            lts = [
-                {
-                    "type": b["type"],
-                    "score": float(b["score"]),
-                    "x0": b["bbox"][0] / scale_factor,
-                    "x1": b["bbox"][2] / scale_factor,
-                    "top": b["bbox"][1] / scale_factor,
-                    "bottom": b["bbox"][-1] / scale_factor,
-                    "page_number": pn,
-                }
-                for b in lts
-                if float(b["score"]) >= 0.4 or b["type"] not in self.garbage_layouts
-            ]
-            lts = self.sort_Y_firstly(lts, np.mean([lt["bottom"] - lt["top"] for lt in lts]) / 2)
-            lts = self.layouts_cleanup(bxs, lts)
-            page_layout.append(lts)
-
-            def findLayout(ty):
-                nonlocal bxs, lts, self
-                lts_ = [lt for lt in lts if lt["type"] == ty]
-                i = 0
-                while i < len(bxs):
-                    if bxs[i].get("layout_type"):
-                        i += 1
-                        continue
-                    if __is_garbage(bxs[i]):
-                        bxs.pop(i)
-                        continue
-
-                    ii = self.find_overlapped_with_threshold(bxs[i], lts_, thr=0.4)
-                    if ii is None:
-                        bxs[i]["layout_type"] = ""
-                        i += 1
-                        continue
-                    lts_[ii]["visited"] = True
-                    keep_feats = [
-                        lts_[ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].size[1] * 0.9 / scale_factor,
-                        lts_[ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].size[1] * 0.1 / scale_factor,
-                    ]
-                    if drop and lts_[ii]["type"] in self.garbage_layouts and not any(keep_feats):
-                        if lts_[ii]["type"] not in garbages:
-                            garbages[lts_[ii]["type"]] = []
-                        garbages[lts_[ii]["type"]].append(bxs[i]["text"])
-                        bxs.pop(i)
+        # Pages are recognized and tagged batch by batch so that only one batch of page images is held at a time
+        for st in range(0, len(image_list), batch_size):
+            batch_images = [image_list[pn] for pn in range(st, min(st + batch_size, len(image_list)))]
+            if self.client:
+                layouts = self.client.predict(batch_images)
+            else:
+                layouts = super().__call__(batch_images, thr, batch_size)
+            # save_results(batch_images, layouts, self.labels, output_dir='output/', threshold=0.7)
+            assert len(batch_images) == len(layouts)
+            for pn, lts in enumerate(layouts, start=st):
+                bxs = ocr_res[pn]
+                lts = [
+                    {
+                        "type": b["type"],
+                        "score": float(b["score"]),
+                        "x0": b["bbox"][0] / scale_factor,
+                        "x1": b["bbox"][2] / scale_factor,
+                        "top": b["bbox"][1] / scale_factor,
+                        "bottom": b["bbox"][-1] / scale_factor,
+                        "page_number": pn + page_from,
+                    }
+                    for b in lts
+                    if float(b["score"]) >= 0.4 or b["type"] not in self.garbage_layouts
+                ]
+                lts = self.sort_Y_firstly(lts, np.mean([lt["bottom"] - lt["top"] for lt in lts]) / 2)
+                lts = self.layouts_cleanup(bxs, lts)
+                page_layout.append(lts)
+
+                tag_layouts(bxs, lts, batch_images[pn - st].size[1], scale_factor, self.garbage_layouts, drop, garbages)
+
+                # add box to figure layouts which has not text box
+                for i, lt in enumerate([lt for lt in lts if lt["type"] in ["figure", "equation"]]):
+                    if lt.get("visited"):
                         continue
+                    lt = deepcopy(lt)
+                    del lt["type"]
+                    lt["text"] = ""
+                    lt["layout_type"] = "figure"
+                    lt["layoutno"] = f"figure-{i}"
+                    bxs.append(lt)
 
-                    bxs[i]["layoutno"] = f"{ty}-{ii}"
-                    bxs[i]["layout_type"] = lts_[ii]["type"] if lts_[ii]["type"] != "equation" else "figure"
-                    i += 1
+                boxes.extend(bxs)
 
-            for lt in ["footer", "header", "reference", "figure caption", "table caption", "title", "table", "text", "figure", "equation"]:
-                findLayout(lt)
-
-            # add box to figure layouts which has not text box
-            for i, lt in enumerate([lt for lt in lts if lt["type"] in ["figure", "equation"]]):
-                if lt.get("visited"):
-                    continue
-                lt = deepcopy(lt)
-                del lt["type"]
-                lt["text"] = ""
-                lt["layout_type"] = "figure"
-                lt["layoutno"] = f"figure-{i}"
-                bxs.append(lt)
-
-            boxes.extend(bxs)
-
-        ocr_res = boxes
-
-        garbag_set = set()
-        for k in garbages.keys():
-            garbages[k] = Counter(garbages[k])
-            for g, c in garbages[k].items():
-                if c > 1:
-                    garbag_set.add(g)
-
-        ocr_res = [b for b in ocr_res if b["text"].strip() not in garbag_set]
-        return ocr_res, page_layout
+        if collect_garbages:
+            return boxes, page_layout
+        return drop_garbages(boxes, garbages), page_layout
 
     def forward(self, image_list, thr=0.7, batch_size=16):
         return super().__call__(image_list, thr, batch_size)
@@ -225,14 +268,7 @@ class LayoutRecognizer4YOLOv10(LayoutRecognizer):
         input_shape = np.array([inputs["scale_factor"][0], inputs["scale_factor"][1], inputs["scale_factor"][0], inputs["scale_factor"][1]])
         boxes = np.multiply(boxes, input_shape, dtype=np.float32)
 
-        unique_class_ids = np.unique(class_ids)
-        indices = []
-        for class_id in unique_class_ids:
-            class_indices = np.where(class_ids == class_id)[0]
-            class_boxes = boxes[class_indices, :]
-            class_scores = scores[class_indices]
-            class_keep_boxes = nms(class_boxes, class_scores, 0.45)
-            indices.extend(class_indices[class_keep_boxes])
+        indices = nms(boxes, scores, 0.45, class_ids)
 
         return [{"type": self.label_list[class_ids[i]].lower(), "bbox": [float(t) for t in boxes[i].tolist()], "score": float(scores[i])} for i in indices]
 
@@ -321,11 +357,7 @@ class AscendLayoutRecognizer(Recognizer):
                 sx, sy = inputs["scale_factor"]
                 xyxy *= np.array([sx, sy, sx, sy], dtype=np.float32)
 
-            keep_indices = []
-            for c in np.unique(cls_ids):
-                idx = np.where(cls_ids == c)[0]
-                k = nms(xyxy[idx], scores[idx], 0.45)
-                keep_indices.extend(idx[k])
+            keep_indices = nms(xyxy, scores, 0.45, cls_ids)
 
             for i in keep_indices:
                 cid = int(cls_ids[i])
@@ -335,22 +367,18 @@ class AscendLayoutRecognizer(Recognizer):
 
         raise ValueError(f"Unexpected output shape: {arr.shape}")
 
-    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True):
-        import re
-        from collections import Counter
-
+    def __call__(self, image_list, ocr_res, scale_factor=3, thr=0.2, batch_size=16, drop=True, page_from=0, garbages=None):
         assert len(image_list) == len(ocr_res)
 
-        images = [np.array(im) if not isinstance(im, np.ndarray) else im for im in image_list]
         layouts_all_pages = []  # list of list[{"type","score","bbox":[x1,y1,x2,y2]}]
 
         conf_thr = max(thr, 0.08)
 
-        batch_loop_cnt = math.ceil(float(len(images)) / batch_size)
+        batch_loop_cnt = math.ceil(float(len(image_list)) / batch_size)
         for bi in range(batch_loop_cnt):
             s = bi * batch_size
-            e = min((bi + 1) * batch_size, len(images))
-            batch_images = images[s:e]
+            e = min((bi + 1) * batch_size, len(image_list))
+            batch_images = [np.array(image_list[i]) if not isinstance(image_list[i], np.ndarray) else image_list[i] for i in range(s, e)]
 
             inputs_list = self.preprocess(batch_images)
             logging.debug("preprocess done")
@@ -374,18 +402,15 @@ class AscendLayoutRecognizer(Recognizer):
                                     "x1": float(x1) / scale_factor,
                                     "top": float(y0) / scale_factor,
                                     "bottom": float(y1) / scale_factor,
-                                    "page_number": len(layouts_all_pages),
+                                    "page_number": len(layouts_all_pages) + page_from,
                                 }
                             )
                     layouts_all_pages.append(page_lts)
 
-        def _is_garbage_text(box):
-            patt = [r"^•+$", r"^[0-9]{1,2} / ?[0-9]{1,2}$", r"^[0-9]{1,2} of [0-9]{1,2}$", r"^http://[^ ]{12,}", r"\(cid *: *[0-9]+ *\)"]
-            return any(re.search(p, box.get("text", "")) for p in patt)
-
         boxes_out = []
         page_layout = []
-        garbages = {}
+        collect_garbages = garbages is not None
+        garbages = {} if garbages is None else garbages
 
         for pn, lts in enumerate(layouts_all_pages):
             if lts:
@@ -396,41 +421,7 @@ class AscendLayoutRecognizer(Recognizer):
             lts = self.layouts_cleanup(bxs, lts)
             page_layout.append(lts)
 
-            def _tag_layout(ty):
-                nonlocal bxs, lts
-                lts_of_ty = [lt for lt in lts if lt["type"] == ty]
-                i = 0
-                while i < len(bxs):
-                    if bxs[i].get("layout_type"):
-                        i += 1
-                        continue
-                    if _is_garbage_text(bxs[i]):
-                        bxs.pop(i)
-                        continue
-
-                    ii = self.find_overlapped_with_threshold(bxs[i], lts_of_ty, thr=0.4)
-                    if ii is None:
-                        bxs[i]["layout_type"] = ""
-                        i += 1
-                        continue
-
-                    lts_of_ty[ii]["visited"] = True
-
-                    keep_feats = [
-                        lts_of_ty[ii]["type"] == "footer" and bxs[i]["bottom"] < image_list[pn].shape[0] * 0.9 / scale_factor,
-                        lts_of_ty[ii]["type"] == "header" and bxs[i]["top"] > image_list[pn].shape[0] * 0.1 / scale_factor,
-                    ]
-                    if drop and lts_of_ty[ii]["type"] in self.garbage_layouts and not any(keep_feats):
-                        garbages.setdefault(lts_of_ty[ii]["type"], []).append(bxs[i].get("text", ""))
-                        bxs.pop(i)
-                        continue
-
-                    bxs[i]["layoutno"] = f"{ty}-{ii}"
-                    bxs[i]["layout_type"] = lts_of_ty[ii]["type"] if lts_of_ty[ii]["type"] != "equation" else "figure"
-                    i += 1
-
-            for ty in ["footer", "header", "reference", "figure caption", "table caption", "title", "table", "text", "figure", "equation"]:
-                _tag_layout(ty)
+            tag_layouts(bxs, lts, image_list[pn].shape[0], scale_factor, self.garbage_layouts, drop, garbages)
 
             figs = [lt for lt in lts if lt["type"] in ["figure", "equation"]]
             for i, lt in enumerate(figs):
@@ -445,12 +436,6 @@ class AscendLayoutRecognizer(Recognizer):
 
             boxes_out.extend(bxs)
 
-        garbag_set = set()
-        for k, lst in garbages.items():
-            cnt = Counter(lst)
-            for g, c in cnt.items():
-                if c > 1:
-                    garbag_set.add(g)
-
-        ocr_res_new = [b for b in boxes_out if b["text"].strip() not in garbag_set]
-        return ocr_res_new, page_layout
\ No newline at end of file
+        if collect_garbages:
+            return boxes_out, page_layout
+        return drop_garbages(boxes_out, garbages), page_layout
\ No newline at end of file
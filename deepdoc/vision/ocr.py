@@ -1,6 +1,7 @@
 import gc
 import logging
 import copy
+import threading
 import time
 import os
 
@@ -8,7 +9,7 @@ from huggingface_hub import snapshot_download
 
 from common.file_utils import get_project_base_directory
 from common.misc_utils import pip_install_torch
-from rag.settings import PARALLEL_DEVICES
+from rag.settings import OCR_REC_BATCH_MAX, OCR_REC_BATCH_PIXELS, OCR_REC_CACHE_SCOPE, OCR_REC_CACHE_SIZE, ORT_OPTIMIZED_MODEL_DIR, ORT_SESSION_PROFILE, PARALLEL_DEVICES
 from .operators import *  # noqa: F403
 from . import operators
 import math
@@ -17,6 +18,8 @@ import cv2
 import onnxruntime as ort
 
 from .postprocess import build_post_process
+from .quantize import ensure_quantized, model_quantization
+from .rec_cache import RecognitionCache
 
 loaded_models = {}
 
@@ -53,9 +56,101 @@ def create_operators(op_param_list, global_config=None):
     return ops
 
 
-def load_model(model_dir, nm, device_id: int | None = None):
+# Session settings of each profile. A thread count of 0 lets ONNX Runtime use
+# one thread per physical core; OCR_INTRA_OP_NUM_THREADS and
+# OCR_INTER_OP_NUM_THREADS override the profile's counts.
+SESSION_PROFILES = {
+    # what load_model has always set up: two threads each way, no arena
+    "default": {"intra_op": 2, "inter_op": 2, "cpu_mem_arena": False, "mem_pattern": True, "graph_opt": "all", "shrink_arena": False},
+    # one page at a time as fast as possible: every core on each operator
+    "latency": {"intra_op": 0, "inter_op": 1, "cpu_mem_arena": True, "mem_pattern": True, "graph_opt": "all", "shrink_arena": False},
+    # many sessions busy at once (OCR workers, pipelined pages): one thread each, allocations kept for reuse
+    "throughput": {"intra_op": 1, "inter_op": 1, "cpu_mem_arena": True, "mem_pattern": True, "graph_opt": "all", "shrink_arena": False},
+    # smallest resident set: no arena and no memory pattern planning
+    "low-memory": {"intra_op": 1, "inter_op": 1, "cpu_mem_arena": False, "mem_pattern": False, "graph_opt": "basic", "shrink_arena": False},
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def session_profile(nm):
+    """Profile name of the model `nm`: ORT_SESSION_PROFILE_<DET|REC|LAYOUT|TSR>, else ORT_SESSION_PROFILE."""
+    family = nm.split(".")[0].upper()
+    profile = os.environ.get(f"ORT_SESSION_PROFILE_{family}", ORT_SESSION_PROFILE)
+    if profile not in SESSION_PROFILES:
+        raise ValueError(f"Unknown ONNX Runtime session profile {profile}, not one of {list(SESSION_PROFILES)}")
+    return profile
+
+
+def session_options(profile):
+    conf = SESSION_PROFILES[profile]
+    options = ort.SessionOptions()
+    options.enable_cpu_mem_arena = conf["cpu_mem_arena"]
+    options.enable_mem_pattern = conf["mem_pattern"]
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[conf["graph_opt"]]
+    options.intra_op_num_threads = int(os.environ.get("OCR_INTRA_OP_NUM_THREADS", conf["intra_op"]))
+    options.inter_op_num_threads = int(os.environ.get("OCR_INTER_OP_NUM_THREADS", conf["inter_op"]))
+    return options
+
+
+def optimized_model_path(model_file_path, profile, provider, optimized_dir=None):
+    """
+    Where the graph ONNX Runtime optimized from `model_file_path` under `profile`
+    is kept, or None when caching is off. The name carries the source model's
+    size and mtime and the ORT version, so neither a new model nor an upgrade
+    picks up a stale graph.
+    """
+    optimized_dir = ORT_OPTIMIZED_MODEL_DIR if optimized_dir is None else optimized_dir
+    if not optimized_dir:
+        return None
+    st = os.stat(model_file_path)
+    nm = os.path.splitext(os.path.basename(model_file_path))[0]
+    return os.path.join(optimized_dir, f"{nm}.{profile}.{provider}.ort{ort.__version__}.{st.st_size}.{st.st_mtime_ns}.onnx")
+
+
+def create_session(model_file_path, options, providers, provider_options=None, optimized_path=None):
+    """
+    An InferenceSession of `model_file_path`. With `optimized_path`, a graph
+    optimized by an earlier process is loaded as is, skipping the optimization
+    passes; otherwise the graph this session optimizes is saved there.
+    """
+    if optimized_path and os.path.exists(optimized_path):
+        level = options.graph_optimization_level
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return ort.InferenceSession(optimized_path, sess_options=options, providers=providers, provider_options=provider_options)
+        except Exception:
+            logging.exception(f"load_model drops unreadable optimized model {optimized_path}")
+            try:
+                os.remove(optimized_path)
+            except OSError:
+                pass
+            options.graph_optimization_level = level
+
+    tmp = None
+    if optimized_path:
+        os.makedirs(os.path.dirname(optimized_path), exist_ok=True)
+        # written under a private name and renamed, so no process loads a partial file
+        tmp = f"{optimized_path}.{os.getpid()}.tmp"
+        options.optimized_model_filepath = tmp
+    sess = ort.InferenceSession(model_file_path, sess_options=options, providers=providers, provider_options=provider_options)
+    if tmp and os.path.exists(tmp):
+        os.replace(tmp, optimized_path)
+        logging.info(f"load_model saved optimized model {optimized_path}")
+    return sess
+
+
+def load_model(model_dir, nm, device_id: int | None = None, profile: str | None = None, quantization: str | None = None):
     model_file_path = os.path.join(model_dir, nm + ".onnx")
+    profile = profile or session_profile(nm)
+    quantization = model_quantization(nm) if quantization is None else quantization
     model_cached_tag = model_file_path + str(device_id) if device_id is not None else model_file_path
+    model_cached_tag += "@" + profile + (f"@int8-{quantization}" if quantization else "")
 
     global loaded_models
     loaded_model = loaded_models.get(model_cached_tag)
@@ -78,11 +173,7 @@ def load_model(model_dir, nm, device_id: int | None = None):
             return False
         return False
 
-    options = ort.SessionOptions()
-    options.enable_cpu_mem_arena = False
-    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
-    options.intra_op_num_threads = 2
-    options.inter_op_num_threads = 2
+    options = session_options(profile)
 
     # https://github.com/microsoft/onnxruntime/issues/9509#issuecomment-951546580
     # Shrink GPU memory after execution
@@ -96,30 +187,57 @@ def load_model(model_dir, nm, device_id: int | None = None):
             "gpu_mem_limit": max(gpu_mem_limit_mb, 0) * 1024 * 1024,
             "arena_extend_strategy": arena_strategy,  # gpu memory allocation strategy
         }
-        sess = ort.InferenceSession(
+        sess = create_session(
             model_file_path,
-            options=options,
+            options,
             providers=['CUDAExecutionProvider'],
-            provider_options=[cuda_provider_options]
+            provider_options=[cuda_provider_options],
+            optimized_path=optimized_model_path(model_file_path, profile, "cuda"),
             )
         run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "gpu:" + str(provider_device_id))
-        logging.info(f"load_model {model_file_path} uses GPU (device {provider_device_id}, gpu_mem_limit={cuda_provider_options['gpu_mem_limit']}, arena_strategy={arena_strategy})")
+        logging.info(f"load_model {model_file_path} uses GPU (device {provider_device_id}, gpu_mem_limit={cuda_provider_options['gpu_mem_limit']}, arena_strategy={arena_strategy}, profile={profile})")
     else:
-        sess = ort.InferenceSession(
+        # INT8 copies only pay off on CPU; GPUs keep the fp32 model
+        if quantization:
+            model_file_path = ensure_quantized(model_dir, nm, quantization) or model_file_path
+        sess = create_session(
             model_file_path,
-            options=options,
-            providers=['CPUExecutionProvider'])
-        run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "cpu")
-        logging.info(f"load_model {model_file_path} uses CPU")
+            options,
+            providers=['CPUExecutionProvider'],
+            optimized_path=optimized_model_path(model_file_path, profile, "cpu"),
+            )
+        # only valid with an arena to shrink
+        if SESSION_PROFILES[profile]["shrink_arena"] and SESSION_PROFILES[profile]["cpu_mem_arena"]:
+            run_options.add_run_config_entry("memory.enable_memory_arena_shrinkage", "cpu")
+        logging.info(f"load_model {model_file_path} uses CPU (profile={profile})")
     loaded_model = (sess, run_options)
     loaded_models[model_cached_tag] = loaded_model
     return loaded_model
 
 
 class TextRecognizer:
+    """
+    Crops are recognized in batches of similar width: sorted by aspect ratio, a
+    batch is closed when the next crop is wider than `rec_bucket_growth` times
+    its narrowest one, when its padded pixels would exceed `rec_batch_pixels`,
+    or at `rec_batch_max` crops. A long line thus only pads crops about as long
+    as itself. The share of padded pixels is kept in `stats()`.
+
+    With OCR_REC_CACHE_SIZE set, results are kept in a `RecognitionCache` of
+    that many entries, so crops repeated across pages only reach the model
+    once; `start_document` empties it unless OCR_REC_CACHE_SCOPE is "process".
+    """
+
     def __init__(self, model_dir, device_id: int | None = None):
         self.rec_image_shape = [int(v) for v in "3, 48, 320".split(",")]
-        self.rec_batch_num = 16
+        self.rec_batch_pixels = OCR_REC_BATCH_PIXELS
+        self.rec_batch_max = OCR_REC_BATCH_MAX
+        self.rec_bucket_growth = 1.25
+        # per-thread batch buffer reused across batches, see `_batch_tensor`
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.cache = RecognitionCache(OCR_REC_CACHE_SIZE) if OCR_REC_CACHE_SIZE > 0 else None
+        self.reset_stats()
         postprocess_params = {
             'name': 'CTCLabelDecode',
             "character_dict_path": os.path.join(model_dir, "ocr.res"),
@@ -346,35 +464,123 @@ class TextRecognizer:
             del self.predictor
         gc.collect()
 
+    def _batch_width(self, max_wh_ratio):
+        """Padded width of a batch whose widest crop has aspect ratio `max_wh_ratio`, as in `resize_norm_img`."""
+        imgC, imgH, imgW = self.rec_image_shape
+        w = self.input_tensor.shape[3:][0]
+        if not isinstance(w, str) and w is not None and w > 0:
+            return w
+        return int(imgH * max(max_wh_ratio, imgW / imgH))
+
+    def _plan_batches(self, ratios):
+        """Batches of indices into `ratios`, the aspect ratios of the crops, in ascending ratio."""
+        imgH = self.rec_image_shape[1]
+        batches, batch, bucket_hi = [], [], 0
+        for i in np.argsort(ratios, kind="stable").tolist():
+            w = self._batch_width(ratios[i])
+            if batch and (len(batch) >= self.rec_batch_max or w > bucket_hi or (len(batch) + 1) * w * imgH > self.rec_batch_pixels):
+                batches.append(batch)
+                batch = []
+            if not batch:
+                bucket_hi = w * self.rec_bucket_growth
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _batch_tensor(self, imgs, max_wh_ratio):
+        """
+        The NCHW input of a batch of crops, as `resize_norm_img` would build it
+        crop by crop. Resized pixels are normalized straight into a buffer kept
+        across batches, and only their padding is zeroed; the returned array is
+        a view of that buffer, valid until the next call from the same thread.
+        """
+        imgC, imgH, _ = self.rec_image_shape
+        imgW = self._batch_width(max_wh_ratio)
+        size = len(imgs) * imgC * imgH * imgW
+        buf = getattr(self._local, "buf", None)
+        if buf is None or buf.size < size:
+            buf = self._local.buf = np.empty(size, dtype=np.float32)
+        batch = buf[:size].reshape(len(imgs), imgC, imgH, imgW)
+
+        for j, img in enumerate(imgs):
+            assert imgC == img.shape[2]
+            h, w = img.shape[:2]
+            resized_w = min(math.ceil(imgH * w / float(h)), imgW)
+            dst = batch[j, :, :, :resized_w]
+            # (x / 255 - 0.5) / 0.5 in one multiply-add, written in CHW order
+            np.multiply(cv2.resize(img, (resized_w, imgH)).transpose((2, 0, 1)), np.float32(2 / 255), out=dst, casting="unsafe")
+            dst -= 1
+            batch[j, :, :, resized_w:] = 0
+        return batch
+
+    def start_document(self):
+        """Called before each document: empties a document-scoped recognition cache."""
+        if self.cache is not None and OCR_REC_CACHE_SCOPE != "process":
+            self.cache.clear()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = {"crops": 0, "batches": 0, "pixels": 0, "padded_pixels": 0}
+        if self.cache is not None:
+            self.cache.reset_stats()
+
+    def stats(self):
+        """Crops and batches recognized, and the share of the batch pixels which were padding."""
+        with self._stats_lock:
+            s = dict(self._stats)
+        s["padding_waste"] = s["padded_pixels"] / s["pixels"] if s["pixels"] else 0.0
+        return s
+
+    def log_stats(self, prefix="TextRecognizer"):
+        s = self.stats()
+        logging.info(f"{prefix}: {s['crops']} crops in {s['batches']} batches, padding waste {s['padding_waste']:.1%}")
+        if self.cache is not None:
+            self.cache.log_stats(f"{prefix} cache")
+
     def __call__(self, img_list):
+        if self.cache is None:
+            return self._recognize(img_list)
+
+        st = time.time()
+        rec_res = [None] * len(img_list)
+        # crops missing from the cache, by key; a crop repeated within the call is recognized once
+        pending = {}
+        for i, img in enumerate(img_list):
+            key = self.cache.key(img)
+            res = self.cache.get(key)
+            if res is None:
+                pending.setdefault(key, []).append(i)
+            else:
+                rec_res[i] = res
+        if pending:
+            keys = list(pending)
+            results, _ = self._recognize([img_list[pending[k][0]] for k in keys])
+            for key, res in zip(keys, results):
+                self.cache.put(key, res)
+                for i in pending[key]:
+                    rec_res[i] = res
+        return rec_res, time.time() - st
+
+    def _recognize(self, img_list):
         img_num = len(img_list)
         # Calculate the aspect ratio of all text bars
         width_list = []
         for img in img_list:
             width_list.append(img.shape[1] / float(img.shape[0]))
-        # Sorting can speed up the recognition process
-        indices = np.argsort(np.array(width_list))
         rec_res = [['', 0.0]] * img_num
-        batch_num = self.rec_batch_num
         st = time.time()
+        imgC, imgH, imgW = self.rec_image_shape[:3]
+        batches = self._plan_batches(width_list)
+        pixels = padded = 0
+
+        for batch in batches:
+            max_wh_ratio = max(imgW / imgH, max(width_list[i] for i in batch))
+            norm_img_batch = self._batch_tensor([img_list[i] for i in batch], max_wh_ratio)
 
-        for beg_img_no in range(0, img_num, batch_num):
-            end_img_no = min(img_num, beg_img_no + batch_num)
-            norm_img_batch = []
-            imgC, imgH, imgW = self.rec_image_shape[:3]
-            max_wh_ratio = imgW / imgH
-            # max_wh_ratio = 0
-            for ino in range(beg_img_no, end_img_no):
-                h, w = img_list[indices[ino]].shape[0:2]
-                wh_ratio = w * 1.0 / h
-                max_wh_ratio = max(max_wh_ratio, wh_ratio)
-            for ino in range(beg_img_no, end_img_no):
-                norm_img = self.resize_norm_img(img_list[indices[ino]],
-                                                max_wh_ratio)
-                norm_img = norm_img[np.newaxis, :]
-                norm_img_batch.append(norm_img)
-            norm_img_batch = np.concatenate(norm_img_batch)
-            norm_img_batch = norm_img_batch.copy()
+            batch_w = norm_img_batch.shape[3]
+            pixels += len(batch) * batch_w * imgH
+            padded += sum(batch_w - min(math.ceil(imgH * width_list[i]), batch_w) for i in batch) * imgH
 
             input_dict = {}
             input_dict[self.input_tensor.name] = norm_img_batch
@@ -389,7 +595,13 @@ class TextRecognizer:
             preds = outputs[0]
             rec_result = self.postprocess_op(preds)
             for rno in range(len(rec_result)):
-                rec_res[indices[beg_img_no + rno]] = rec_result[rno]
+                rec_res[batch[rno]] = rec_result[rno]
+
+        with self._stats_lock:
+            self._stats["crops"] += img_num
+            self._stats["batches"] += len(batches)
+            self._stats["pixels"] += pixels
+            self._stats["padded_pixels"] += padded
 
         return rec_res, time.time() - st
 
@@ -424,6 +636,9 @@ class TextDetector:
         self.postprocess_op = build_post_process(postprocess_params)
         self.predictor, self.run_options = load_model(model_dir, 'det', device_id)
         self.input_tensor = self.predictor.get_inputs()[0]
+        # a model exported with a fixed batch dimension only takes that many images per run
+        batch_dim = self.input_tensor.shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
 
         img_h, img_w = self.input_tensor.shape[2:]
         if isinstance(img_h, str) or isinstance(img_w, str):
@@ -486,6 +701,23 @@ class TextDetector:
             del self.predictor
         gc.collect()
 
+    def _run(self, batch):
+        input_dict = {}
+        input_dict[self.input_tensor.name] = batch
+        for i in range(100000):
+            try:
+                outputs = self.predictor.run(None, input_dict, self.run_options)
+                break
+            except Exception as e:
+                if i >= 3:
+                    raise e
+                time.sleep(5)
+        return outputs[0]
+
+    def _postprocess(self, maps, shape_list, images):
+        post_result = self.postprocess_op({"maps": maps}, shape_list)
+        return [self.filter_tag_det_res(res['points'], img.shape) for res, img in zip(post_result, images)]
+
     def __call__(self, img):
         ori_im = img.copy()
         data = {'image': img}
@@ -498,23 +730,51 @@ class TextDetector:
         img = np.expand_dims(img, axis=0)
         shape_list = np.expand_dims(shape_list, axis=0)
         img = img.copy()
-        input_dict = {}
-        input_dict[self.input_tensor.name] = img
-        for i in range(100000):
-            try:
-                outputs = self.predictor.run(None, input_dict, self.run_options)
-                break
-            except Exception as e:
-                if i >= 3:
-                    raise e
-                time.sleep(5)
-
-        post_result = self.postprocess_op({"maps": outputs[0]}, shape_list)
-        dt_boxes = post_result[0]['points']
-        dt_boxes = self.filter_tag_det_res(dt_boxes, ori_im.shape)
+        dt_boxes = self._postprocess(self._run(img), shape_list, [ori_im])[0]
 
         return dt_boxes, time.time() - st
 
+    def detect_batch(self, images, batch_size=None):
+        """
+        Detect the text boxes of several images, e.g. pages, with as few runs
+        as possible. Images resized by `DetResizeForTest` to the same input
+        shape (all pages of the same size do) share runs of up to `batch_size`
+        images. A model which rejects batches falls back to one image per run.
+
+        Returns the boxes of each image (None where preprocessing failed) and
+        the elapsed time.
+        """
+        st = time.time()
+        batch_size = min(batch_size or len(images), self.max_batch or len(images))
+        prepared = [transform({'image': img}, self.preprocess_op) for img in images]
+        res = [None] * len(images)
+        buckets = {}
+        for i, data in enumerate(prepared):
+            if data is not None and data[0] is not None:
+                buckets.setdefault(data[0].shape, []).append(i)
+
+        for ids in buckets.values():
+            for start in range(0, len(ids), max(batch_size, 1)):
+                chunk = ids[start: start + batch_size]
+                shape_list = np.stack([prepared[i][1] for i in chunk])
+                imgs = [images[i] for i in chunk]
+                boxes = None
+                if len(chunk) > 1 and self.max_batch != 1:
+                    try:
+                        # not retried like `_run`: a model which rejects batches fails every time
+                        maps = self.predictor.run(None, {self.input_tensor.name: np.stack([prepared[i][0] for i in chunk])}, self.run_options)[0]
+                        boxes = self._postprocess(maps, shape_list, imgs)
+                    except Exception:
+                        logging.exception("TextDetector failed a batched run")
+                        logging.warning("TextDetector runs one image per session run from now on")
+                        self.max_batch = 1
+                if boxes is None:
+                    boxes = [self._postprocess(self._run(prepared[i][0][np.newaxis].copy()), shape_list[n:n + 1], imgs[n:n + 1])[0]
+                             for n, i in enumerate(chunk)]
+                for i, b in zip(chunk, boxes):
+                    res[i] = b
+        return res, time.time() - st
+
     def __del__(self):
         self.close()
 
@@ -567,7 +827,49 @@ class OCR:
         self.drop_score = 0.5
         self.crop_image_res_index = 0
 
-    def get_rotate_crop_image(self, img, points):
+    def get_rotate_crop_image(self, img, points, device_id: int | None = None):
+        return self.get_rotate_crop_images(img, [points], device_id)[0]
+
+    def get_rotate_crop_images(self, img, points_list, device_id: int | None = None):
+        """
+        Crops of `img` for the boxes of `points_list`. Tall crops (height / width
+        >= 1.5) are turned to the orientation the text recognizer reads best, all
+        trials of the page scored in one batch on its own device.
+        """
+        crops = [self._warp_crop(img, points) for points in points_list]
+        return self._resolve_orientations(crops, device_id)
+
+    @staticmethod
+    def _aligned_crop(img, points, eps=1e-3):
+        """
+        Crop of an axis-aligned quad (clockwise from top-left) by slicing, or
+        None for any other quad. On whole pixel corners it is the same crop the
+        perspective warp makes, border replication included; fractional corners
+        are rounded and the slice resized to the warp's size when they differ.
+        """
+        (x0, y0), (x1, y1), (x2, y2), (x3, y3) = points
+        if abs(y0 - y1) > eps or abs(y2 - y3) > eps or abs(x0 - x3) > eps or abs(x1 - x2) > eps:
+            return None
+        w = int(max(abs(x1 - x0), abs(x2 - x3)))
+        h = int(max(abs(y3 - y0), abs(y2 - y1)))
+        if x1 <= x0 or y3 <= y0 or w == 0 or h == 0:
+            return None
+        left, top = int(round(x0)), int(round(y0))
+        right, bottom = int(round(x1)), int(round(y3))
+        height, width = img.shape[:2]
+        if 0 <= left and right <= width and 0 <= top and bottom <= height:
+            crop = img[top:bottom, left:right].copy()
+        else:
+            # the warp replicates the border pixels
+            rows = np.clip(np.arange(top, bottom), 0, height - 1)
+            cols = np.clip(np.arange(left, right), 0, width - 1)
+            crop = img[rows[:, None], cols]
+        if crop.shape[:2] != (h, w):
+            crop = cv2.resize(crop, (w, h), interpolation=cv2.INTER_CUBIC)
+        return crop
+
+    @staticmethod
+    def _warp_crop(img, points):
         '''
         img_height, img_width = img.shape[0:2]
         left = int(np.min(points[:, 0]))
@@ -579,6 +881,9 @@ class OCR:
         points[:, 1] = points[:, 1] - top
         '''
         assert len(points) == 4, "shape of points must be 4*2"
+        dst_img = OCR._aligned_crop(img, points)
+        if dst_img is not None:
+            return dst_img
         img_crop_width = int(
             max(
                 np.linalg.norm(points[0] - points[1]),
@@ -596,33 +901,28 @@ class OCR:
             M, (img_crop_width, img_crop_height),
             borderMode=cv2.BORDER_REPLICATE,
             flags=cv2.INTER_CUBIC)
-        dst_img_height, dst_img_width = dst_img.shape[0:2]
-        if dst_img_height * 1.0 / dst_img_width >= 1.5:
-            # Try original orientation
-            rec_result = self.text_recognizer[0]([dst_img])
-            text, score = rec_result[0][0]
-            best_score = score
-            best_img = dst_img
-
-            # Try clockwise 90° rotation
-            rotated_cw = np.rot90(dst_img, k=3)
-            rec_result = self.text_recognizer[0]([rotated_cw])
-            rotated_cw_text, rotated_cw_score = rec_result[0][0]
-            if rotated_cw_score > best_score:
-                best_score = rotated_cw_score
-                best_img = rotated_cw
-
-            # Try counter-clockwise 90° rotation
-            rotated_ccw = np.rot90(dst_img, k=1)
-            rec_result = self.text_recognizer[0]([rotated_ccw])
-            rotated_ccw_text, rotated_ccw_score = rec_result[0][0]
-            if rotated_ccw_score > best_score:
-                best_img = rotated_ccw
-
-            # Use the best image
-            dst_img = best_img
         return dst_img
 
+    def _resolve_orientations(self, crops, device_id: int | None = None):
+        if device_id is None:
+            device_id = 0
+        tall = [i for i, c in enumerate(crops) if c.shape[0] * 1.0 / c.shape[1] >= 1.5]
+        if not tall:
+            return crops
+
+        # original, clockwise 90° and counter-clockwise 90° of every tall crop
+        trials = []
+        for i in tall:
+            trials.extend([crops[i], np.rot90(crops[i], k=3), np.rot90(crops[i], k=1)])
+        rec_res, _ = self.text_recognizer[device_id](trials)
+
+        crops = list(crops)
+        for n, i in enumerate(tall):
+            # the first of equally scored orientations wins
+            scores = [score for _, score in rec_res[3 * n: 3 * n + 3]]
+            crops[i] = trials[3 * n + int(np.argmax(scores))]
+        return crops
+
     def sorted_boxes(self, dt_boxes):
         """
         Sort text boxes in order from top to bottom, left to right
@@ -667,11 +967,19 @@ class OCR:
         return zip(self.sorted_boxes(dt_boxes), [
                    ("", 0) for _ in range(len(dt_boxes))])
 
+    def detect_batch(self, imgs, device_id: int | None = None, batch_size=None):
+        """`detect` for several images with batched detection runs: the (box, ("", 0)) pairs of each image."""
+        if device_id is None:
+            device_id = 0
+        results, _ = self.text_detector[device_id].detect_batch(imgs, batch_size)
+        return [[] if dt_boxes is None else list(zip(self.sorted_boxes(dt_boxes), [("", 0) for _ in range(len(dt_boxes))]))
+                for dt_boxes in results]
+
     def recognize(self, ori_im, box, device_id: int | None = None):
         if device_id is None:
             device_id = 0
 
-        img_crop = self.get_rotate_crop_image(ori_im, box)
+        img_crop = self.get_rotate_crop_image(ori_im, box, device_id)
 
         rec_res, elapse = self.text_recognizer[device_id]([img_crop])
         text, score = rec_res[0]
@@ -709,14 +1017,9 @@ class OCR:
             time_dict['all'] = end - start
             return None, None, time_dict
 
-        img_crop_list = []
-
         dt_boxes = self.sorted_boxes(dt_boxes)
 
-        for bno in range(len(dt_boxes)):
-            tmp_box = copy.deepcopy(dt_boxes[bno])
-            img_crop = self.get_rotate_crop_image(ori_im, tmp_box)
-            img_crop_list.append(img_crop)
+        img_crop_list = self.get_rotate_crop_images(ori_im, [copy.deepcopy(box) for box in dt_boxes], device_id)
 
         rec_res, elapse = self.text_recognizer[device_id](img_crop_list)
 
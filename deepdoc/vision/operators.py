@@ -663,27 +663,78 @@ def preprocess(im, preprocess_ops):
     return im, im_info
 
 
-def nms(bboxes, scores, iou_thresh):
-    import numpy as np
-    x1 = bboxes[:, 0]
-    y1 = bboxes[:, 1]
-    x2 = bboxes[:, 2]
-    y2 = bboxes[:, 3]
+def nms(bboxes, scores, iou_thresh, class_ids=None, batch_ids=None, offset=1, suppress_equal=False):
+    """
+    Greedy non-maximum suppression of the xyxy `bboxes`, vectorized.
+
+    Boxes are only suppressed by higher scored boxes of the same class
+    (`class_ids`) and image (`batch_ids`, for the outputs of several images
+    at once). Each (image, class) group is moved to its own band of x (or y,
+    whichever gives fewer pairs) by an offset, so one sweep over the boxes
+    sorted by their start pairs every box with the boxes of its group it
+    overlaps along that axis. The IoU of all these pairs is computed in one
+    pass and suppression walks the overlapping pairs in score order. No loop
+    runs per class or per image.
+
+    `offset` is added to the intersection width and height (1 counts pixel
+    edges inclusively). A box is suppressed when its IoU with a kept box is
+    over `iou_thresh`, or equal to it with `suppress_equal`.
+
+    Returns the indices of the kept boxes, by image, then class, then
+    descending score.
+    """
+    n = len(scores)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    class_ids = np.zeros(n, dtype=np.int64) if class_ids is None else np.asarray(class_ids)
+    batch_ids = np.zeros(n, dtype=np.int64) if batch_ids is None else np.asarray(batch_ids)
+    rank = np.empty(n, dtype=np.int64)
+    rank[np.argsort(scores, kind="stable")[::-1]] = np.arange(n)
+    # by image, class and descending score: a box may only suppress boxes after it
+    order = np.lexsort((rank, class_ids, batch_ids))
+    boxes = bboxes[order]
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
     areas = (y2 - y1) * (x2 - x1)
-
-    indices = []
-    index = scores.argsort()[::-1]
-    while index.size > 0:
-        i = index[0]
-        indices.append(i)
-        x11 = np.maximum(x1[i], x1[index[1:]])
-        y11 = np.maximum(y1[i], y1[index[1:]])
-        x22 = np.minimum(x2[i], x2[index[1:]])
-        y22 = np.minimum(y2[i], y2[index[1:]])
-        w = np.maximum(0, x22 - x11 + 1)
-        h = np.maximum(0, y22 - y11 + 1)
-        overlaps = w * h
-        ious = overlaps / (areas[i] + areas[index[1:]] - overlaps)
-        idx = np.where(ious <= iou_thresh)[0]
-        index = index[idx + 1]
-    return indices
\ No newline at end of file
+    cls, img = class_ids[order], batch_ids[order]
+    group = np.cumsum(np.r_[False, (cls[1:] != cls[:-1]) | (img[1:] != img[:-1])])
+
+    if (areas > 0).all():
+        # groups side by side along an axis, each band wider than any box; every box is
+        # paired with the later boxes its extent reaches, along the axis giving fewer pairs
+        sweeps = []
+        for lo, hi in ((x1, x2), (y1, y2)):
+            band = float(hi.max()) - float(lo.min()) + abs(offset) + 1
+            start = lo.astype(np.float64) + group * band
+            by_start = np.argsort(start, kind="stable")
+            reach = np.searchsorted(start[by_start], hi[by_start].astype(np.float64) + offset + group[by_start] * band, side="right")
+            partners = np.maximum(reach - np.arange(n) - 1, 0)
+            sweeps.append((int(partners.sum()), by_start, partners))
+        _, by_start, partners = min(sweeps, key=lambda sweep: sweep[0])
+        p = np.repeat(np.arange(n), partners)
+        q = p + 1 + np.arange(len(p)) - np.repeat(np.cumsum(partners) - partners, partners)
+        a, b = by_start[p], by_start[q]
+        i, j = np.minimum(a, b), np.maximum(a, b)
+    else:
+        # an empty box has a NaN IoU with every disjoint empty box, which suppresses: compare all pairs
+        ends = np.r_[np.flatnonzero(np.diff(group)) + 1, n]
+        partners = ends[group] - np.arange(n) - 1
+        i = np.repeat(np.arange(n), partners)
+        j = i + 1 + np.arange(len(i)) - np.repeat(np.cumsum(partners) - partners, partners)
+
+    w = np.maximum(0, np.minimum(x2[i], x2[j]) - np.maximum(x1[i], x1[j]) + offset)
+    h = np.maximum(0, np.minimum(y2[i], y2[j]) - np.maximum(y1[i], y1[j]) + offset)
+    overlaps = w * h
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ious = overlaps / (areas[i] + areas[j] - overlaps)
+    # written as negations so that a NaN IoU suppresses, as it always did
+    over = ~(ious < iou_thresh) if suppress_equal else ~(ious <= iou_thresh)
+    i, j = i[over], j[over]
+    by_suppressor = np.argsort(i, kind="stable")
+    i, j = i[by_suppressor], j[by_suppressor]
+
+    keep = np.ones(n, dtype=bool)
+    bounds = np.r_[np.flatnonzero(np.r_[True, i[1:] != i[:-1]]), len(i)] if len(i) else []
+    for s, e in zip(bounds[:-1], bounds[1:]):
+        if keep[i[s]]:
+            keep[j[s:e]] = False
+    return order[keep]
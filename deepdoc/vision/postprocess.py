@@ -114,11 +114,35 @@ class DBPostProcess:
             contours, _ = outs[0], outs[1]
 
         num_contours = min(len(contours), self.max_candidates)
-
+        if self.score_mode != "fast":
+            return self.boxes_from_contours(pred, contours[:num_contours], width, height, dest_width, dest_height)
+
+        rects = [cv2.minAreaRect(contour) for contour in contours[:num_contours]]
+        rects = [r for r in rects if min(r[1]) >= self.min_size]
+        points = self.order_points(np.array([cv2.boxPoints(r) for r in rects], dtype=np.float32).reshape(-1, 4, 2))
+        scores = self.box_scores_fast(pred, points)
+        keep = scores >= self.box_thresh
+        points, scores = points[keep], scores[keep]
+
+        boxes, sside, aligned = self.unclip_aligned(points, self.unclip_ratio)
+        for i in np.flatnonzero(~aligned):
+            box = self.unclip(points[i], self.unclip_ratio).reshape(-1, 1, 2)
+            box, sside[i] = self.get_mini_boxes(box)
+            boxes[i] = np.array(box)
+        keep = sside >= self.min_size + 2
+        boxes, scores = boxes[keep], scores[keep]
+        if not len(boxes):
+            return np.array([], dtype="int32"), []
+
+        boxes[:, :, 0] = np.clip(np.round(boxes[:, :, 0] / width * dest_width), 0, dest_width)
+        boxes[:, :, 1] = np.clip(np.round(boxes[:, :, 1] / height * dest_height), 0, dest_height)
+        return boxes.astype("int32"), scores.tolist()
+
+    def boxes_from_contours(self, pred, contours, width, height, dest_width, dest_height):
+        """Box of each contour one at a time, with shapely/pyclipper unclipping; used for the slow score mode."""
         boxes = []
         scores = []
-        for index in range(num_contours):
-            contour = contours[index]
+        for contour in contours:
             points, sside = self.get_mini_boxes(contour)
             if sside < self.min_size:
                 continue
@@ -144,6 +168,38 @@ class DBPostProcess:
             scores.append(score)
         return np.array(boxes, dtype="int32"), scores
 
+    @staticmethod
+    def unclip_aligned(boxes, unclip_ratio):
+        """
+        `unclip` followed by `get_mini_boxes` for the axis-aligned ones of the
+        quads `boxes`, in closed form: pyclipper truncates the corners to
+        integers, and offsetting that rectangle by d with round joins leaves
+        the rectangle grown by d on every side, rounded half away from zero,
+        as its minimum area box. Returns the expanded boxes, their short sides
+        and which boxes were aligned; the other rows are left untouched.
+        """
+        out = boxes.astype(np.float32)
+        sside = np.zeros(len(boxes), dtype=np.float64)
+        if not len(boxes):
+            return out, sside, np.zeros(0, dtype=bool)
+        xs, ys = np.sort(boxes[:, :, 0], axis=1), np.sort(boxes[:, :, 1], axis=1)
+        aligned = (xs[:, 0] == xs[:, 1]) & (xs[:, 2] == xs[:, 3]) & (ys[:, 0] == ys[:, 1]) & (ys[:, 2] == ys[:, 3])
+        aligned &= (xs[:, 0] < xs[:, 3]) & (ys[:, 0] < ys[:, 3])
+
+        # shapely measures the float quad, pyclipper offsets the truncated one
+        w, h = (xs[:, 3] - xs[:, 0]).astype(np.float64), (ys[:, 3] - ys[:, 0]).astype(np.float64)
+        d = w * h * unclip_ratio / (2 * (w + h))
+
+        def clipper_round(v):
+            return np.where(v < 0, np.trunc(v - 0.5), np.trunc(v + 0.5))
+
+        x0, x1 = clipper_round(np.trunc(xs[:, 0]) - d), clipper_round(np.trunc(xs[:, 3]) + d)
+        y0, y1 = clipper_round(np.trunc(ys[:, 0]) - d), clipper_round(np.trunc(ys[:, 3]) + d)
+        expanded = np.stack([np.stack([x0, y0], 1), np.stack([x1, y0], 1), np.stack([x1, y1], 1), np.stack([x0, y1], 1)], axis=1)
+        out[aligned] = expanded[aligned]
+        sside[aligned] = np.minimum(x1 - x0, y1 - y0)[aligned]
+        return out, sside, aligned
+
     def unclip(self, box, unclip_ratio):
         poly = Polygon(box)
         distance = poly.area * unclip_ratio / poly.length
@@ -175,6 +231,54 @@ class DBPostProcess:
         ]
         return box, min(bounding_box[1])
 
+    @staticmethod
+    def order_points(pts):
+        """
+        The corners `pts` (n, 4, 2) of rotated rectangles, as returned by
+        `cv2.boxPoints`, in the order `get_mini_boxes` puts them: top-left,
+        top-right, bottom-right, bottom-left.
+        """
+        pts = np.take_along_axis(pts, np.argsort(pts[:, :, 0], axis=1, kind="stable")[:, :, None], axis=1)
+        left_down = pts[:, 1, 1] > pts[:, 0, 1]
+        right_down = pts[:, 3, 1] > pts[:, 2, 1]
+        order = np.stack([np.where(left_down, 0, 1), np.where(right_down, 2, 3), np.where(right_down, 3, 2), np.where(left_down, 1, 0)], axis=1)
+        return np.take_along_axis(pts, order[:, :, None], axis=1)
+
+    def box_scores_fast(self, bitmap, boxes):
+        """
+        `box_score_fast` of each of the quads `boxes`. Axis-aligned ones, the
+        common case for text lines, are summed from one integral image of
+        `bitmap`; rotated ones are rasterized one by one.
+        """
+        scores = np.zeros(len(boxes), dtype=np.float64)
+        if not len(boxes):
+            return scores
+        h, w = bitmap.shape[:2]
+        xs, ys = np.sort(boxes[:, :, 0], axis=1), np.sort(boxes[:, :, 1], axis=1)
+        aligned = (xs[:, 0] == xs[:, 1]) & (xs[:, 2] == xs[:, 3]) & (ys[:, 0] == ys[:, 1]) & (ys[:, 2] == ys[:, 3])
+
+        for i in np.flatnonzero(~aligned):
+            scores[i] = self.box_score_fast(bitmap, boxes[i])
+
+        if aligned.any():
+            xs, ys = xs[aligned].astype(np.float64), ys[aligned].astype(np.float64)
+            xmin = np.clip(np.floor(xs[:, 0]), 0, w - 1)
+            xmax = np.clip(np.ceil(xs[:, 3]), 0, w - 1)
+            ymin = np.clip(np.floor(ys[:, 0]), 0, h - 1)
+            ymax = np.clip(np.ceil(ys[:, 3]), 0, h - 1)
+            # the pixels fillPoly sets in the mask of box_score_fast
+            c0 = np.maximum(np.trunc(xs[:, 0] - xmin), 0) + xmin
+            c1 = np.minimum(np.trunc(xs[:, 3] - xmin), xmax - xmin) + xmin
+            r0 = np.maximum(np.trunc(ys[:, 0] - ymin), 0) + ymin
+            r1 = np.minimum(np.trunc(ys[:, 3] - ymin), ymax - ymin) + ymin
+            empty = (c0 > c1) | (r0 > r1)
+            c0, c1, r0, r1 = (np.where(empty, 0, v).astype(np.int64) for v in (c0, c1, r0, r1))
+
+            integral = cv2.integral(np.ascontiguousarray(bitmap, dtype=np.float32), sdepth=cv2.CV_64F)
+            total = integral[r1 + 1, c1 + 1] - integral[r0, c1 + 1] - integral[r1 + 1, c0] + integral[r0, c0]
+            scores[aligned] = np.where(empty, 0.0, total / ((c1 - c0 + 1) * (r1 - r0 + 1)))
+        return scores
+
     def box_score_fast(self, bitmap, _box):
         '''
         box_score_fast: use bbox mean score as the mean score
@@ -272,6 +376,8 @@ class BaseRecLabelDecode:
         for i, char in enumerate(dict_character):
             self.dict[char] = i
         self.character = dict_character
+        # the charset as an array, to gather the characters of a whole batch at once
+        self.character_array = np.array(dict_character, dtype=object)
 
     def pred_reverse(self, pred):
         pred_re = []
@@ -294,34 +400,38 @@ class BaseRecLabelDecode:
 
     def decode(self, text_index, text_prob=None, is_remove_duplicate=False):
         """ convert text-index into text-label. """
-        result_list = []
-        ignored_tokens = self.get_ignored_tokens()
-        batch_size = len(text_index)
-        for batch_idx in range(batch_size):
-            selection = np.ones(len(text_index[batch_idx]), dtype=bool)
-            if is_remove_duplicate:
-                selection[1:] = text_index[batch_idx][1:] != text_index[
-                    batch_idx][:-1]
-            for ignored_token in ignored_tokens:
-                selection &= text_index[batch_idx] != ignored_token
-
-            char_list = [
-                self.character[text_id]
-                for text_id in text_index[batch_idx][selection]
+        if not isinstance(text_index, np.ndarray) or text_index.ndim != 2:
+            # rows of different lengths, e.g. labels: decode them one by one
+            return [
+                self.decode(np.asarray(row)[np.newaxis], None if text_prob is None else np.asarray(text_prob[i])[np.newaxis], is_remove_duplicate)[0]
+                for i, row in enumerate(text_index)
             ]
-            if text_prob is not None:
-                conf_list = text_prob[batch_idx][selection]
-            else:
-                conf_list = [1] * len(selection)
-            if len(conf_list) == 0:
-                conf_list = [0]
 
-            text = ''.join(char_list)
+        batch_size, steps = text_index.shape
+        selection = np.ones((batch_size, steps), dtype=bool)
+        if is_remove_duplicate:
+            selection[:, 1:] = text_index[:, 1:] != text_index[:, :-1]
+        selection &= ~np.isin(text_index, self.get_ignored_tokens())
 
+        counts = selection.sum(axis=1)
+        # selected positions of all rows, row after row
+        chars = self.character_array[text_index[selection]].tolist()
+        ends = np.cumsum(counts).tolist()
+
+        if text_prob is not None:
+            sums = np.where(selection, text_prob, 0).sum(axis=1, dtype=np.float64)
+            confs = np.divide(sums, counts, out=np.zeros(batch_size), where=counts > 0).tolist()
+        else:
+            confs = [1.0 if steps else 0.0] * batch_size
+
+        result_list = []
+        start = 0
+        for end, conf in zip(ends, confs):
+            text = ''.join(chars[start:end])
+            start = end
             if self.reverse:  # for arabic rec
                 text = self.pred_reverse(text)
-
-            result_list.append((text, np.mean(conf_list).tolist()))
+            result_list.append((text, conf))
         return result_list
 
     def get_ignored_tokens(self):
@@ -342,7 +452,7 @@ class CTCLabelDecode(BaseRecLabelDecode):
         if not isinstance(preds, np.ndarray):
             preds = preds.numpy()
         preds_idx = preds.argmax(axis=2)
-        preds_prob = preds.max(axis=2)
+        preds_prob = np.take_along_axis(preds, preds_idx[:, :, np.newaxis], axis=2)[:, :, 0]
         text = self.decode(preds_idx, preds_prob, is_remove_duplicate=True)
         if label is None:
             return text
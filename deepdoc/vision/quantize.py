@@ -0,0 +1,108 @@
+import logging
+import os
+
+from rag.settings import ORT_QUANTIZATION
+
+QUANTIZATION_MODES = ("dynamic", "static")
+
+# Dynamic quantization only pays off on the matrix products; integer convolutions
+# run slower than fp32 ones on most CPUs, so the conv layers stay fp32.
+DYNAMIC_OP_TYPES = ["MatMul", "Gemm", "LSTM", "GRU", "Attention"]
+
+
+def model_quantization(nm):
+    """Quantization mode of the model `nm` on CPU: ORT_QUANTIZATION_<DET|REC|LAYOUT|TSR>, else ORT_QUANTIZATION; "" keeps fp32."""
+    family = nm.split(".")[0].upper()
+    mode = os.environ.get(f"ORT_QUANTIZATION_{family}", ORT_QUANTIZATION).lower()
+    if mode and mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode}, not one of {list(QUANTIZATION_MODES)}")
+    return mode
+
+
+def quantized_model_path(model_dir, nm, mode):
+    return os.path.join(model_dir, f"{nm}.int8-{mode}.onnx")
+
+
+def quantize_model(model_dir, nm, mode="dynamic", calibration_feeds=None):
+    """
+    Write the INT8 copy of `model_dir/nm.onnx` next to it and return its path.
+
+    Dynamic quantization stores weights as INT8 and quantizes activations on
+    the fly. Static quantization also fixes the activation ranges, observed
+    by running `calibration_feeds` (input dicts, as fed to the session) on
+    the fp32 model, and inserts QDQ pairs around every supported operator.
+
+    Needs the `onnx` package, which parsing with fp32 models does not.
+    """
+    try:
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+    except ImportError as e:
+        raise RuntimeError("Quantizing models needs the onnx package: pip install onnx") from e
+
+    src = os.path.join(model_dir, nm + ".onnx")
+    dst = quantized_model_path(model_dir, nm, mode)
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    prep = f"{dst}.{os.getpid()}.prep.onnx"
+    try:
+        # shape inference and graph cleanups the quantizer relies on
+        try:
+            quant_pre_process(src, prep, skip_symbolic_shape=True)
+        except Exception:
+            logging.warning(f"quantize_model pre-processing {src} failed, quantizing it as is")
+            prep = src
+
+        if mode == "dynamic":
+            quantize_dynamic(prep, tmp, op_types_to_quantize=DYNAMIC_OP_TYPES, weight_type=QuantType.QInt8)
+        elif mode == "static":
+            if not calibration_feeds:
+                raise ValueError("Static quantization needs calibration inputs")
+
+            class FeedsReader(CalibrationDataReader):
+                def __init__(self, feeds):
+                    self.feeds = iter(feeds)
+
+                def get_next(self):
+                    return next(self.feeds, None)
+
+            quantize_static(
+                prep,
+                tmp,
+                FeedsReader(calibration_feeds),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+        else:
+            raise ValueError(f"Unknown quantization mode {mode}, not one of {list(QUANTIZATION_MODES)}")
+        # renamed into place, so no process loads a partial file
+        os.replace(tmp, dst)
+    finally:
+        for fnm in (tmp, prep):
+            if fnm != src and os.path.exists(fnm):
+                os.remove(fnm)
+    logging.info(f"quantize_model wrote {dst}")
+    return dst
+
+
+def ensure_quantized(model_dir, nm, mode):
+    """
+    Path of the INT8 copy of the model `nm` in `mode`, or None to use fp32.
+
+    Dynamic copies are made on first use and remade when the fp32 model is
+    newer. Static copies need calibration data, so they are only used once
+    built beforehand (see runparser/bench_quantization.py).
+    """
+    src = os.path.join(model_dir, nm + ".onnx")
+    dst = quantized_model_path(model_dir, nm, mode)
+    if os.path.exists(dst) and os.path.getmtime(dst) >= os.path.getmtime(src):
+        return dst
+    if mode == "static":
+        logging.warning(f"No static INT8 copy of {src} was built, using the fp32 model")
+        return None
+    try:
+        return quantize_model(model_dir, nm, mode)
+    except Exception:
+        logging.exception(f"Quantizing {src} failed, using the fp32 model")
+        return None
@@ -0,0 +1,92 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+# Height, in pixels, of the thumbnail a crop is hashed from, and its grey levels.
+KEY_HEIGHT = 32
+KEY_LEVELS = 16
+KEY_MAX_WIDTH = 2048
+
+
+def crop_key(img):
+    """
+    Perceptual key of a text line crop: the crop scaled to KEY_HEIGHT pixels
+    high at its aspect ratio, contrast-stretched and reduced to KEY_LEVELS
+    grey levels, then hashed. Renders of the same text at the same size map
+    to the same key however they are offset on the page; one glyph of
+    difference changes the thumbnail and so the key.
+    """
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY if img.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+    h, w = img.shape[:2]
+    kw = int(min(max(round(KEY_HEIGHT * w / max(h, 1)), 1), KEY_MAX_WIDTH))
+    thumb = cv2.resize(img, (kw, KEY_HEIGHT), interpolation=cv2.INTER_AREA).astype(np.float32)
+    lo, hi = float(thumb.min()), float(thumb.max())
+    if hi > lo:
+        thumb = (thumb - lo) * ((KEY_LEVELS - 1) / (hi - lo))
+    else:
+        thumb[:] = 0
+    levels = np.rint(thumb).astype(np.uint8)
+    return kw, hashlib.blake2b(levels.tobytes(), digest_size=16).digest()
+
+
+class RecognitionCache:
+    """
+    Bounded LRU of text recognition results keyed by `crop_key`, so repeated
+    crops (headers, footers, table header rows) are recognized once. Safe to
+    share between threads. Hits, misses and evictions are kept in `stats()`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    key = staticmethod(crop_key)
+
+    def get(self, key):
+        """The cached result of `key`, or None."""
+        with self._lock:
+            res = self._entries.get(key)
+            if res is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return res
+
+    def put(self, key, res):
+        with self._lock:
+            self._entries[key] = res
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = self._misses = self._evictions = 0
+
+    def stats(self):
+        """Lookups that hit and missed, entries evicted, entries held, and the hit rate."""
+        with self._lock:
+            s = {"hits": self._hits, "misses": self._misses, "evictions": self._evictions, "size": len(self._entries)}
+        lookups = s["hits"] + s["misses"]
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
+
+    def log_stats(self, prefix="RecognitionCache"):
+        s = self.stats()
+        logging.info(f"{prefix}: {s['hits']} hits, {s['misses']} misses ({s['hit_rate']:.1%} hit rate), {s['evictions']} evictions, {s['size']} entries")
@@ -2,16 +2,20 @@ import gc
 import logging
 import os
 import math
+import re
 import numpy as np
 import cv2
-from functools import cmp_to_key
 
 
 from common.file_utils import get_project_base_directory
 from .operators import *  # noqa: F403
-from .operators import preprocess
+from .operators import nms, preprocess
 from . import operators
 from .ocr import load_model
+from .box_index import BoxIndex
+
+# Errors onnxruntime raises when a model takes no other batch size than the one it was exported with.
+FIXED_BATCH_ERROR = re.compile(r"invalid dimensions|invalid rank|shape", re.IGNORECASE)
 
 class Recognizer:
     def __init__(self, label_list, task_name, model_dir=None):
@@ -35,65 +39,68 @@ class Recognizer:
         self.output_names = [node.name for node in self.ort_sess.get_outputs()]
         self.input_shape = self.ort_sess.get_inputs()[0].shape[2:4]
         self.label_list = label_list
+        # a model exported with a fixed batch dimension only takes that many images per run
+        batch_dim = self.ort_sess.get_inputs()[0].shape[0]
+        self.max_batch = batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+        # until a batched run succeeds, a failing one may just mean the model does not batch
+        self.batched = False
+
+    @staticmethod
+    def _sort_by_lines(arr, major, minor, threshold):
+        """
+        Order boxes by `major`, grouping boxes whose `major` is within `threshold`
+        of the previous one into a line ordered by `minor`. Stable: boxes equal
+        on both keep their order in `arr`. A threshold that is not positive (or
+        NaN) orders by `major` alone.
+        """
+        if len(arr) < 2:
+            return list(arr)
+        a = np.array([b[major] for b in arr], dtype=np.float64)
+        order = np.argsort(a, kind="stable")
+        if threshold > 0:
+            line = np.empty(len(arr), dtype=np.int64)
+            line[order] = np.concatenate(([0], np.cumsum(np.diff(a[order]) >= threshold)))
+            order = np.lexsort((np.array([b[minor] for b in arr], dtype=np.float64), line))
+        return [arr[i] for i in order]
+
+    @staticmethod
+    def _sort_runs(arr, key, minor):
+        """
+        Stable-sort every run of consecutive boxes having `key` by (`key`, `minor`).
+        Boxes without `key` stay where they are and split the runs.
+        """
+        has = np.array([key in b for b in arr], dtype=bool)
+        if not has.any():
+            return arr
+        pos = np.flatnonzero(has)
+        run = np.cumsum(~has)[pos]
+        order = np.lexsort((np.array([arr[i][minor] for i in pos]), np.array([arr[i][key] for i in pos]), run))
+        res = list(arr)
+        for p, i in zip(pos, pos[order]):
+            res[p] = arr[i]
+        return res
 
     @staticmethod
     def sort_Y_firstly(arr, threshold):
-        def cmp(c1, c2):
-            diff = c1["top"] - c2["top"]
-            if abs(diff) < threshold:
-                diff = c1["x0"] - c2["x0"]
-            return diff
-        arr = sorted(arr, key=cmp_to_key(cmp))
-        return arr
+        # lines from top to bottom, left to right within a line
+        return Recognizer._sort_by_lines(arr, "top", "x0", threshold)
 
     @staticmethod
     def sort_X_firstly(arr, threshold):
-        def cmp(c1, c2):
-            diff = c1["x0"] - c2["x0"]
-            if abs(diff) < threshold:
-                diff = c1["top"] - c2["top"]
-            return diff
-        arr = sorted(arr, key=cmp_to_key(cmp))
-        return arr
+        # columns from left to right, top to bottom within a column
+        return Recognizer._sort_by_lines(arr, "x0", "top", threshold)
 
     @staticmethod
     def sort_C_firstly(arr, thr=0):
-        # sort using y1 first and then x1
-        # sorted(arr, key=lambda r: (r["x0"], r["top"]))
+        # sort by column, then by top within the column
         arr = Recognizer.sort_X_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                # restore the order using th
-                if "C" not in arr[j] or "C" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["C"] < arr[j]["C"] \
-                        or (
-                        arr[j + 1]["C"] == arr[j]["C"]
-                        and arr[j + 1]["top"] < arr[j]["top"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        return Recognizer._sort_runs(arr, "C", "top")
 
     @staticmethod
     def sort_R_firstly(arr, thr=0):
-        # sort using y1 first and then x1
-        # sorted(arr, key=lambda r: (r["top"], r["x0"]))
+        # sort by row, then by x0 within the row
         arr = Recognizer.sort_Y_firstly(arr, thr)
-        for i in range(len(arr) - 1):
-            for j in range(i, -1, -1):
-                if "R" not in arr[j] or "R" not in arr[j + 1]:
-                    continue
-                if arr[j + 1]["R"] < arr[j]["R"] \
-                        or (
-                        arr[j + 1]["R"] == arr[j]["R"]
-                        and arr[j + 1]["x0"] < arr[j]["x0"]
-                ):
-                    tmp = arr[j]
-                    arr[j] = arr[j + 1]
-                    arr[j + 1] = tmp
-        return arr
+        return Recognizer._sort_runs(arr, "R", "x0")
 
     @staticmethod
     def overlapped_area(a, b, ratio=True):
@@ -118,6 +125,7 @@ class Recognizer:
 
     @staticmethod
     def layouts_cleanup(boxes, layouts, far=2, thr=0.7):
+        """`boxes` may be a list or a `BoxIndex` over it, which callers cleaning several layout lists against the same boxes should build once."""
         def not_overlapped(a, b):
             return any([a["x1"] < b["x0"],
                         a["x0"] > b["x1"],
@@ -146,12 +154,10 @@ class Recognizer:
                     layouts.pop(i)
                 continue
 
-            area_i, area_i_1 = 0, 0
-            for b in boxes:
-                if not not_overlapped(b, layouts[i]):
-                    area_i += Recognizer.overlapped_area(b, layouts[i], False)
-                if not not_overlapped(b, layouts[j]):
-                    area_i_1 += Recognizer.overlapped_area(b, layouts[j], False)
+            if not isinstance(boxes, BoxIndex):
+                boxes = BoxIndex(boxes)
+            area_i = boxes.covered_area(layouts[i])
+            area_i_1 = boxes.covered_area(layouts[j])
 
             if area_i > area_i_1:
                 layouts.pop(j)
@@ -236,34 +242,21 @@ class Recognizer:
 
     @staticmethod
     def find_horizontally_tightest_fit(box, boxes):
+        """`boxes` may be a list or a `BoxIndex` over it; pass the index when querying the same boxes repeatedly."""
         if not boxes:
             return
-        min_dis, min_i = 1000000, None
-        for i,b in enumerate(boxes):
-            if box.get("layoutno", "0") != b.get("layoutno", "0"):
-                continue
-            dis = min(abs(box["x0"] - b["x0"]), abs(box["x1"] - b["x1"]), abs(box["x0"]+box["x1"] - b["x1"] - b["x0"])/2)
-            if dis < min_dis:
-                min_i = i
-                min_dis = dis
-        return min_i
+        if not isinstance(boxes, BoxIndex):
+            boxes = BoxIndex(boxes)
+        return boxes.tightest_fit(box)
 
     @staticmethod
     def find_overlapped_with_threshold(box, boxes, thr=0.3):
+        """`boxes` may be a list or a `BoxIndex` over it; pass the index when querying the same boxes repeatedly."""
         if not boxes:
             return
-        max_overlapped_i, max_overlapped, _max_overlapped = None, thr, 0
-        s, e = 0, len(boxes)
-        for i in range(s, e):
-            ov = Recognizer.overlapped_area(box, boxes[i])
-            _ov = Recognizer.overlapped_area(boxes[i], box)
-            if (ov, _ov) < (max_overlapped, _max_overlapped):
-                continue
-            max_overlapped_i = i
-            max_overlapped = ov
-            _max_overlapped = _ov
-
-        return max_overlapped_i
+        if not isinstance(boxes, BoxIndex):
+            boxes = BoxIndex(boxes)
+        return boxes.best_overlap(box, thr)
 
     def preprocess(self, image_list):
         inputs = []
@@ -321,46 +314,6 @@ class Recognizer:
             y[:, 3] = x[:, 1] + x[:, 3] / 2
             return y
 
-        def compute_iou(box, boxes):
-            # Compute xmin, ymin, xmax, ymax for both boxes
-            xmin = np.maximum(box[0], boxes[:, 0])
-            ymin = np.maximum(box[1], boxes[:, 1])
-            xmax = np.minimum(box[2], boxes[:, 2])
-            ymax = np.minimum(box[3], boxes[:, 3])
-
-            # Compute intersection area
-            intersection_area = np.maximum(0, xmax - xmin) * np.maximum(0, ymax - ymin)
-
-            # Compute union area
-            box_area = (box[2] - box[0]) * (box[3] - box[1])
-            boxes_area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
-            union_area = box_area + boxes_area - intersection_area
-
-            # Compute IoU
-            iou = intersection_area / union_area
-
-            return iou
-
-        def iou_filter(boxes, scores, iou_threshold):
-            sorted_indices = np.argsort(scores)[::-1]
-
-            keep_boxes = []
-            while sorted_indices.size > 0:
-                # Pick the last box
-                box_id = sorted_indices[0]
-                keep_boxes.append(box_id)
-
-                # Compute IoU of the picked box with the rest
-                ious = compute_iou(boxes[box_id, :], boxes[sorted_indices[1:], :])
-
-                # Remove boxes with IoU over the threshold
-                keep_indices = np.where(ious < iou_threshold)[0]
-
-                # print(keep_indices.shape, sorted_indices.shape)
-                sorted_indices = sorted_indices[keep_indices + 1]
-
-            return keep_boxes
-
         boxes = np.squeeze(boxes).T
         # Filter out object confidence scores below threshold
         scores = np.max(boxes[:, 4:], axis=1)
@@ -376,14 +329,7 @@ class Recognizer:
         boxes = np.multiply(boxes, input_shape, dtype=np.float32)
         boxes = xywh2xyxy(boxes)
 
-        unique_class_ids = np.unique(class_ids)
-        indices = []
-        for class_id in unique_class_ids:
-            class_indices = np.where(class_ids == class_id)[0]
-            class_boxes = boxes[class_indices, :]
-            class_scores = scores[class_indices]
-            class_keep_boxes = iou_filter(class_boxes, class_scores, 0.2)
-            indices.extend(class_indices[class_keep_boxes])
+        indices = nms(boxes, scores, 0.2, class_ids, offset=0, suppress_equal=True)
 
         return [{
             "type": self.label_list[class_ids[i]].lower(),
@@ -397,25 +343,95 @@ class Recognizer:
             del self.ort_sess
         gc.collect()
 
+    def _stack_inputs(self, inputs):
+        """
+        Feed of one session run over the preprocessed `inputs`. Images are stacked
+        into one NCHW tensor, zero padded at the bottom and right to the largest of
+        them as `create_inputs` does, which leaves the scale factors valid.
+        """
+        name = "image" if "scale_factor" in self.input_names else self.input_names[0]
+        imgs = [ins[name] for ins in inputs]
+        if len(imgs) == 1:
+            image = imgs[0]
+        else:
+            c = imgs[0].shape[1]
+            h = max(im.shape[2] for im in imgs)
+            w = max(im.shape[3] for im in imgs)
+            image = np.zeros((len(imgs), c, h, w), dtype=np.float32)
+            for j, im in enumerate(imgs):
+                image[j, :, : im.shape[2], : im.shape[3]] = im[0]
+        feed = {name: image}
+        if "scale_factor" in self.input_names:
+            feed["scale_factor"] = np.concatenate([ins["scale_factor"] for ins in inputs], axis=0)
+        return feed
+
+    def _split_outputs(self, outs, n):
+        """
+        Per-image outputs of a run over `n` images. Detection models with a
+        `scale_factor` input return the boxes of all images in one array, with the
+        box count of each image as the second output; the others return one
+        row per image.
+        """
+        if n == 1:
+            return [outs[0]]
+        if "scale_factor" not in self.input_names:
+            return [outs[0][j : j + 1] for j in range(n)]
+        if len(outs) < 2:
+            return None
+        counts = np.asarray(outs[1]).reshape(-1)
+        if len(counts) != n or int(counts.sum()) != len(outs[0]):
+            return None
+        return np.split(outs[0], np.cumsum(counts)[:-1])
+
+    def _run_batch(self, inputs, thr):
+        """Recognize the preprocessed `inputs` of one batch, one session run per group of same-shaped images."""
+        res = [None] * len(inputs)
+        if "scale_factor" in self.input_names:
+            # padded to a common size, so all images of the batch can share a run
+            groups = {None: list(range(len(inputs)))}
+        else:
+            groups = {}
+            for i, ins in enumerate(inputs):
+                groups.setdefault(ins[self.input_names[0]].shape, []).append(i)
+
+        for ids in groups.values():
+            step = self.max_batch or len(ids)
+            for st in range(0, len(ids), step):
+                chunk = ids[st : st + step]
+                ins = [inputs[i] for i in chunk]
+                outs = None
+                if len(chunk) > 1 and self.max_batch != 1:
+                    fixed = False
+                    try:
+                        outs = self._split_outputs(self.ort_sess.run(None, self._stack_inputs(ins), self.run_options), len(chunk))
+                        fixed = outs is None
+                    except Exception as e:
+                        logging.exception(f"{self.__class__.__name__} failed a batched run")
+                        fixed = FIXED_BATCH_ERROR.search(str(e)) is not None
+                    if outs is not None:
+                        self.batched = True
+                    elif fixed and not self.batched:
+                        logging.warning(f"{self.__class__.__name__} runs one image per session run from now on")
+                        self.max_batch = 1
+                    else:
+                        logging.warning(f"{self.__class__.__name__} runs the images of this batch one per session run")
+                if outs is None:
+                    outs = [self.ort_sess.run(None, self._stack_inputs([x]), self.run_options)[0] for x in ins]
+                for i, x, out in zip(chunk, ins, outs):
+                    res[i] = self.postprocess(out, x, thr)
+        return res
+
     def __call__(self, image_list, thr=0.7, batch_size=16):
         res = []
-        images = []
-        for i in range(len(image_list)):
-            if not isinstance(image_list[i], np.ndarray):
-                images.append(np.array(image_list[i]))
-            else:
-                images.append(image_list[i])
-
-        batch_loop_cnt = math.ceil(float(len(images)) / batch_size)
+        batch_loop_cnt = math.ceil(float(len(image_list)) / batch_size)
         for i in range(batch_loop_cnt):
             start_index = i * batch_size
-            end_index = min((i + 1) * batch_size, len(images))
-            batch_image_list = images[start_index:end_index]
+            end_index = min((i + 1) * batch_size, len(image_list))
+            # convert per batch so only one batch of page arrays is alive at a time
+            batch_image_list = [np.array(image_list[j]) if not isinstance(image_list[j], np.ndarray) else image_list[j] for j in range(start_index, end_index)]
             inputs = self.preprocess(batch_image_list)
             logging.debug("preprocess")
-            for ins in inputs:
-                bb = self.postprocess(self.ort_sess.run(None, {k:v for k,v in ins.items() if k in self.input_names}, self.run_options)[0], ins, thr)
-                res.append(bb)
+            res.extend(self._run_batch(inputs, thr))
 
         #seeit.save_results(image_list, res, self.label_list, threshold=thr)
 
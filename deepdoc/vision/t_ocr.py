@@ -9,7 +9,7 @@ sys.path.insert(
             '../../')))
 
 from vision.seeit import draw_box
-from vision import OCR, init_in_out
+from vision import OCR, DeviceScheduler, init_in_out
 import argparse
 import numpy as np
 import trio
@@ -23,7 +23,7 @@ def main(args):
     import torch.cuda
 
     cuda_devices = torch.cuda.device_count()
-    limiter = [trio.CapacityLimiter(1) for _ in range(cuda_devices)] if cuda_devices > 1 else None
+    scheduler = DeviceScheduler(range(cuda_devices)) if cuda_devices > 1 else None
     ocr = OCR()
     images, outputs = init_in_out(args)
 
@@ -43,26 +43,25 @@ def main(args):
 
         print("Task {} done".format(i))
 
-    async def __ocr_thread(i, id, img, limiter = None):
-        if limiter:
-            async with limiter:
-                print("Task {} use device {}".format(i, id))
-                await trio.to_thread.run_sync(lambda: __ocr(i, id, img))
-        else:
-            __ocr(i, id, img)
-
     async def __ocr_launcher():
-        if cuda_devices > 1:
-            async with trio.open_nursery() as nursery:
-                for i, img in enumerate(images):
-                    nursery.start_soon(__ocr_thread, i, i % cuda_devices, img, limiter[i % cuda_devices])
-                    await trio.sleep(0.1)
+        if scheduler:
+            # idle devices pull the next image from a shared queue
+            await scheduler.run(enumerate(images), lambda job, id: __ocr(job[0], id, job[1]))
+            for id, s in scheduler.stats().items():
+                print("Device {}: {} tasks, busy {:.2f}s, utilization {:.0%}".format(id, s["jobs"], s["busy"], s["utilization"]))
         else:
             for i, img in enumerate(images):
-                await __ocr_thread(i, 0, img)
+                __ocr(i, 0, img)
 
     trio.run(__ocr_launcher)
 
+    for id, rec in enumerate(ocr.text_recognizer):
+        s = rec.stats()
+        if s["crops"]:
+            print("Recognizer {}: {} crops in {} batches, padding waste {:.1%}".format(id, s["crops"], s["batches"], s["padding_waste"]))
+        if rec.cache is not None:
+            c = rec.cache.stats()
+            print("Recognizer {} cache: {} hits, {} misses, hit rate {:.1%}".format(id, c["hits"], c["misses"], c["hit_rate"]))
     print("OCR tasks are all done")
 
 
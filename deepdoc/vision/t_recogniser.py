@@ -11,7 +11,7 @@ sys.path.insert(
             '../../')))
 
 from vision.seeit import draw_box
-from vision import LayoutRecognizer, TableStructureRecognizer, OCR, init_in_out
+from vision import BoxIndex, LayoutRecognizer, TableStructureRecognizer, OCR, init_in_out
 import argparse
 import re
 import numpy as np
@@ -53,11 +53,12 @@ def get_table_html(img, tb_cpns, ocr):
         np.mean([b[-1][1] - b[0][1] for b, _ in boxes]) / 3
     )
 
+    boxes_index = BoxIndex(boxes)
+
     def gather(kwd, fzy=10, ption=0.6):
-        nonlocal boxes
         eles = LayoutRecognizer.sort_Y_firstly(
             [r for r in tb_cpns if re.match(kwd, r["label"])], fzy)
-        eles = LayoutRecognizer.layouts_cleanup(boxes, eles, 5, ption)
+        eles = LayoutRecognizer.layouts_cleanup(boxes_index, eles, 5, ption)
         return LayoutRecognizer.sort_Y_firstly(eles, 0)
 
     headers = gather(r".*header$")
@@ -65,16 +66,17 @@ def get_table_html(img, tb_cpns, ocr):
     spans = gather(r".*spanning")
     clmns = sorted([r for r in tb_cpns if re.match(
         r"table column$", r["label"])], key=lambda x: x["x0"])
-    clmns = LayoutRecognizer.layouts_cleanup(boxes, clmns, 5, 0.5)
+    clmns = LayoutRecognizer.layouts_cleanup(boxes_index, clmns, 5, 0.5)
+    rows_index, headers_index, clmns_index, spans_index = BoxIndex(rows), BoxIndex(headers), BoxIndex(clmns), BoxIndex(spans)
 
     for b in boxes:
-        ii = LayoutRecognizer.find_overlapped_with_threshold(b, rows, thr=0.3)
+        ii = LayoutRecognizer.find_overlapped_with_threshold(b, rows_index, thr=0.3)
         if ii is not None:
             b["R"] = ii
             b["R_top"] = rows[ii]["top"]
             b["R_bott"] = rows[ii]["bottom"]
 
-        ii = LayoutRecognizer.find_overlapped_with_threshold(b, headers, thr=0.3)
+        ii = LayoutRecognizer.find_overlapped_with_threshold(b, headers_index, thr=0.3)
         if ii is not None:
             b["H_top"] = headers[ii]["top"]
             b["H_bott"] = headers[ii]["bottom"]
@@ -82,13 +84,13 @@ def get_table_html(img, tb_cpns, ocr):
             b["H_right"] = headers[ii]["x1"]
             b["H"] = ii
 
-        ii = LayoutRecognizer.find_horizontally_tightest_fit(b, clmns)
+        ii = LayoutRecognizer.find_horizontally_tightest_fit(b, clmns_index)
         if ii is not None:
             b["C"] = ii
             b["C_left"] = clmns[ii]["x0"]
             b["C_right"] = clmns[ii]["x1"]
 
-        ii = LayoutRecognizer.find_overlapped_with_threshold(b, spans, thr=0.3)
+        ii = LayoutRecognizer.find_overlapped_with_threshold(b, spans_index, thr=0.3)
         if ii is not None:
             b["H_top"] = spans[ii]["top"]
             b["H_bott"] = spans[ii]["bottom"]
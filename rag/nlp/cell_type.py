@@ -0,0 +1,73 @@
+import re
+from functools import lru_cache
+
+from rag.nlp import rag_tokenizer
+
+# Cell texts whose type is remembered, per classifier.
+CACHE_SIZE = 1 << 16
+
+# (pattern, type) in priority order: a cell gets the type of the first pattern its text matches.
+CELL_PATTERNS = [
+    ("^(?:20|19)[0-9]{2}[年/-][0-9]{1,2}[月/-][0-9]{1,2}日*$", "Dt"),
+    (r"^(?:20|19)[0-9]{2}年$", "Dt"),
+    (r"^(?:20|19)[0-9]{2}[年-][0-9]{1,2}月*$", "Dt"),
+    ("^[0-9]{1,2}[月-][0-9]{1,2}日*$", "Dt"),
+    (r"^第*[一二三四1-4]季度$", "Dt"),
+    (r"^(?:20|19)[0-9]{2}年*[一二三四1-4]季度$", "Dt"),
+    (r"^(?:20|19)[0-9]{2}[ABCDE]$", "Dt"),
+    ("^[0-9.,+%/ -]+$", "Nu"),
+    (r"^[0-9A-Z/\._~-]+$", "Ca"),
+    (r"^[A-Z]*[a-z' -]+$", "En"),
+    (r"^[0-9.,+-]+[0-9A-Za-z/$￥%<>（）()' -]+$", "NE"),
+    (r"^.{1}$", "Sg"),
+]
+
+# The docx parser takes "/" in year-month and month-day dates too, and has always typed "2019A" cells "DT".
+DOCX_CELL_PATTERNS = list(CELL_PATTERNS)
+DOCX_CELL_PATTERNS[2] = (r"^(?:20|19)[0-9]{2}[年/-][0-9]{1,2}月*$", "Dt")
+DOCX_CELL_PATTERNS[3] = ("^[0-9]{1,2}[月/-][0-9]{1,2}日*$", "Dt")
+DOCX_CELL_PATTERNS[6] = (r"^(?:20|19)[0-9]{2}[ABCDE]$", "DT")
+
+
+def _token_type(text):
+    """Type of a cell no pattern matched, from its tokens: text, long text, a person's name or other."""
+    tks = [t for t in rag_tokenizer.tokenize(text).split() if len(t) > 1]
+    if len(tks) > 3:
+        if len(tks) < 12:
+            return "Tx"
+        else:
+            return "Lx"
+
+    if len(tks) == 1 and rag_tokenizer.tag(tks[0]) == "nr":
+        return "Nr"
+
+    return "Ot"
+
+
+def _classifier(patterns, strip):
+    """
+    A cached classifier of cell texts by `patterns`, all tried in one regex
+    pass: every pattern is anchored at the start, so the first alternative
+    which matches is the first pattern which does. Patterns are matched
+    against the stripped text if `strip`, tokens are taken from it as is.
+    """
+    for p, _ in patterns:
+        assert re.compile(p).groups == 0, f"capturing group in cell pattern {p}"
+    combined = re.compile("|".join(f"({p})" for p, _ in patterns))
+    types = [None] + [t for _, t in patterns]
+
+    @lru_cache(maxsize=CACHE_SIZE)
+    def classify(text):
+        m = combined.match(text.strip() if strip else text)
+        if m:
+            return types[m.lastindex]
+        return _token_type(text)
+
+    return classify
+
+
+# Type of the text of a table cell: date, number, code, English, number with
+# unit, single char, text, long text, name or other. Call cache_clear() on
+# these after loading a user dictionary into rag_tokenizer.
+cell_type = _classifier(CELL_PATTERNS, strip=True)
+docx_cell_type = _classifier(DOCX_CELL_PATTERNS, strip=False)
@@ -1,4 +1,5 @@
 import logging
+import os
 from common.misc_utils import pip_install_torch
 
 PARALLEL_DEVICES = 0
@@ -8,4 +9,49 @@ try:
     PARALLEL_DEVICES = torch.cuda.device_count()
     logging.info(f"found {PARALLEL_DEVICES} gpus")
 except Exception:
-    logging.info("can't import package 'torch'")
\ No newline at end of file
+    logging.info("can't import package 'torch'")
+
+# Pages rendered and OCR'd together by RAGFlowPdfParser; 0 renders the whole document up front.
+PDF_PAGE_WINDOW = int(os.environ.get("PDF_PAGE_WINDOW", "0"))
+# Build the text lines of pages with a healthy PDF text layer from their chars instead of running OCR detection.
+PDF_TEXT_LAYER_FAST_PATH = int(os.environ.get("PDF_TEXT_LAYER_FAST_PATH", "0"))
+# Overlap rendering, OCR, layout and TSR of consecutive pages instead of running each stage over all pages.
+PDF_PIPELINE = int(os.environ.get("PDF_PIPELINE", "0"))
+# Pages queued between two pipeline stages.
+PDF_PIPELINE_DEPTH = int(os.environ.get("PDF_PIPELINE_DEPTH", "2"))
+# Zoom of the reduced page views layout and table structure recognition run on; 0 runs them on the OCR page images.
+# The models resize pages to their input shape anyway: keep pages at least that large (about 1.5 for A4 pages).
+PDF_MODEL_ZOOMIN = float(os.environ.get("PDF_MODEL_ZOOMIN", "0"))
+# Read the structure of tables fully ruled with PDF vector lines off those lines instead of running table structure recognition.
+PDF_RULED_TABLES = int(os.environ.get("PDF_RULED_TABLES", "0"))
+
+# Worker processes OCR'ing pages in parallel when no GPU is found; 0 or 1 keeps OCR in-process.
+OCR_CPU_WORKERS = int(os.environ.get("OCR_CPU_WORKERS", "0"))
+# ONNX Runtime intra-op threads of each OCR worker process.
+OCR_CPU_THREADS_PER_WORKER = int(os.environ.get("OCR_CPU_THREADS_PER_WORKER", "2"))
+# Pages whose text detection runs as one batch when RAGFlowPdfParser OCRs in-process on CPU; 1 detects page by page.
+OCR_DET_BATCH_PAGES = int(os.environ.get("OCR_DET_BATCH_PAGES", "4"))
+# ONNX Runtime session profile of the models: default, latency, throughput or low-memory.
+# ORT_SESSION_PROFILE_DET, _REC, _LAYOUT and _TSR override it for one model.
+ORT_SESSION_PROFILE = os.environ.get("ORT_SESSION_PROFILE", "default")
+# Directory ONNX Runtime saves optimized model graphs to, for later processes to load; empty disables it.
+# Keep it per host: fully optimized CPU graphs may hold kernels specific to the CPU they were built on.
+ORT_OPTIMIZED_MODEL_DIR = os.environ.get("ORT_OPTIMIZED_MODEL_DIR", "")
+# INT8 copies of the models to run on CPU: "dynamic", "static" or "" for fp32.
+# ORT_QUANTIZATION_DET, _REC, _LAYOUT and _TSR override it for one model.
+ORT_QUANTIZATION = os.environ.get("ORT_QUANTIZATION", "")
+# Padded input pixels (height x width, one channel) of a text recognition batch.
+OCR_REC_BATCH_PIXELS = int(os.environ.get("OCR_REC_BATCH_PIXELS", str(48 * 320 * 64)))
+# Crops of a text recognition batch at most, however narrow they are.
+OCR_REC_BATCH_MAX = int(os.environ.get("OCR_REC_BATCH_MAX", "64"))
+# Text recognition results kept for repeated crops (headers, footers, table header rows); 0 disables the cache.
+# Crops are matched by a perceptual key, so two crops with the same thumbnail get the same text: opt-in, 4096 is a fair size.
+OCR_REC_CACHE_SIZE = int(os.environ.get("OCR_REC_CACHE_SIZE", "0"))
+# Lifetime of the recognition cache: "document" empties it for every parsed PDF, "process" keeps it across documents.
+# OCR worker processes keep theirs for their own lifetime, bounded by OCR_REC_CACHE_SIZE.
+OCR_REC_CACHE_SCOPE = os.environ.get("OCR_REC_CACHE_SCOPE", "document")
+
+# Directory of the on-disk cache of RAGFlowPdfParser OCR/layout/table results; empty disables it.
+PDF_PARSE_CACHE_DIR = os.environ.get("PDF_PARSE_CACHE_DIR", "")
+# Size the parse cache is trimmed to, least recently used entries first.
+PDF_PARSE_CACHE_MAX_MB = int(os.environ.get("PDF_PARSE_CACHE_MAX_MB", "1024"))
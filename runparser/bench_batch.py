@@ -0,0 +1,95 @@
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision import LayoutRecognizer, Recognizer, TableStructureRecognizer
+from deepdoc.vision.layout_recognizer import LayoutRecognizer4YOLOv10
+
+
+def load_pages(pdf, pages, zoomin=3):
+    import pdfplumber
+
+    with pdfplumber.open(pdf) as doc:
+        return [p.to_image(resolution=72 * zoomin).annotated.convert("RGB") for p in doc.pages[:pages]]
+
+
+def make_pages(n, size=(1785, 2526), seed=0):
+    """Synthetic pages: a title, two columns of text lines and a ruled table."""
+    rng = np.random.default_rng(seed)
+    pages = []
+    w, h = size
+    for _ in range(n):
+        img = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(img)
+        draw.rectangle((w * 0.2, 120, w * 0.8, 180), fill="black")
+        for col in range(2):
+            x0 = 100 + col * (w // 2)
+            for y in range(260, int(h * 0.55), 45):
+                draw.rectangle((x0, y, x0 + rng.integers(w // 4, w // 2 - 150), y + 22), fill=(40, 40, 40))
+        top, rows, cols = int(h * 0.6), 8, 5
+        for r in range(rows + 1):
+            draw.line((100, top + r * 80, w - 100, top + r * 80), fill="black", width=3)
+        for c in range(cols + 1):
+            x = 100 + c * (w - 200) // cols
+            draw.line((x, top, x, top + rows * 80), fill="black", width=3)
+        pages.append(img)
+    return pages
+
+
+def same_results(a, b, tol=1.0):
+    if len(a) != len(b):
+        return False
+    for pa, pb in zip(a, b):
+        if len(pa) != len(pb):
+            return False
+        for x, y in zip(pa, pb):
+            if x["type"] != y["type"] or np.abs(np.subtract(x["bbox"], y["bbox"])).max() > tol:
+                return False
+    return True
+
+
+def main(args):
+    if args.model == "layout":
+        detr = LayoutRecognizer("layout")
+    elif args.model == "yolov10":
+        detr = LayoutRecognizer4YOLOv10("layout")
+    else:
+        detr = TableStructureRecognizer()
+
+    images = load_pages(args.pdf, args.pages) if args.pdf else make_pages(args.pages)
+    print(f"{args.model}: {len(images)} pages, model batch dimension {detr.max_batch or 'dynamic'}")
+
+    # one warm-up run so session initialisation is not timed
+    Recognizer.__call__(detr, images[:1], args.threshold, 1)
+
+    reference = None
+    for bs in [int(b) for b in args.batch_sizes.split(",")]:
+        cost = 0.0
+        for _ in range(args.repeat):
+            start = timer()
+            res = Recognizer.__call__(detr, images, args.threshold, bs)
+            cost += timer() - start
+        cost /= args.repeat
+        if reference is None:
+            reference = res
+        print(f"batch {bs:>3}: {cost:8.2f} s   {len(images) / cost:7.2f} pages/s   same as first: {same_results(reference, res)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", choices=["layout", "yolov10", "tsr"], default="layout")
+    parser.add_argument("--pdf", help="Benchmark on the pages of this PDF instead of synthetic pages")
+    parser.add_argument("--pages", type=int, default=16, help="Pages to recognize. Default: 16")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16", help="Comma separated batch sizes. Default: 1,2,4,8,16")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per batch size. Default: 1")
+    args = parser.parse_args()
+    main(args)
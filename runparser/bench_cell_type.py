@@ -0,0 +1,141 @@
+import argparse
+import re
+import sys
+from collections import Counter
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from rag.nlp import rag_tokenizer
+from rag.nlp.cell_type import CELL_PATTERNS, DOCX_CELL_PATTERNS, cell_type, docx_cell_type
+
+
+def legacy_block_type(b, patterns, strip):
+    """The per-cell classifier TableStructureRecognizer.blockType and the docx parser each ran before."""
+    for p, n in patterns:
+        if re.search(p, b.strip() if strip else b):
+            return n
+    tks = [t for t in rag_tokenizer.tokenize(b).split() if len(t) > 1]
+    if len(tks) > 3:
+        if len(tks) < 12:
+            return "Tx"
+        else:
+            return "Lx"
+
+    if len(tks) == 1 and rag_tokenizer.tag(tks[0]) == "nr":
+        return "Nr"
+
+    return "Ot"
+
+
+def legacy_docx_header_rows(rows):
+    """How the docx parser typed a table before: every cell, then each row's cells again on numeric tables."""
+    max_type = Counter([legacy_block_type(v, DOCX_CELL_PATTERNS, False) for row in rows[1:] for v in row])
+    max_type = max(max_type.items(), key=lambda x: x[1])[0]
+    hdrows = [0]
+    if max_type == "Nu":
+        for r in range(1, len(rows)):
+            tys = Counter([legacy_block_type(v, DOCX_CELL_PATTERNS, False) for v in rows[r]])
+            if max(tys.items(), key=lambda x: x[1])[0] != max_type:
+                hdrows.append(r)
+    return max_type, hdrows
+
+
+def docx_header_rows(rows):
+    types = [[docx_cell_type(v) for v in row] for row in rows]
+    max_type = Counter([t for row in types[1:] for t in row])
+    max_type = max(max_type.items(), key=lambda x: x[1])[0]
+    hdrows = [0]
+    if max_type == "Nu":
+        for r in range(1, len(rows)):
+            if max(Counter(types[r]).items(), key=lambda x: x[1])[0] != max_type:
+                hdrows.append(r)
+    return max_type, hdrows
+
+
+WORDS = "revenue cost profit total net gross margin operating income tax expense asset liability equity cash".split()
+HANZI = "营业收入成本利润总额净资产负债现金流量合计本期上年同期变动比例说明"
+
+
+def make_cell(rng, column):
+    """Cell text of a table column of some type, as reports have them."""
+    kind = column % 8
+    if kind == 0:
+        y, m, d = rng.integers(1990, 2030), rng.integers(1, 13), rng.integers(1, 29)
+        return str(rng.choice([f"{y}-{m}-{d}", f"{y}年{m}月{d}日", f"{y}/{m}", f"{m}月{d}日", f"{y}年", f"{y}A", f"{m}/{d}"]))
+    if kind in (1, 2, 3):
+        v = rng.normal(0, 1e4)
+        return str(rng.choice([f"{v:,.2f}", f"{v / 1e4:.1%}", f"{int(v)}", f" {v:.1f} "]))
+    if kind == 4:
+        return str(rng.choice([f"AB-{rng.integers(100, 999)}", f"{rng.integers(1, 99)}.{rng.integers(1, 9)}kg", str(rng.choice(list(HANZI)))]))
+    if kind == 5:
+        return " ".join(rng.choice(WORDS, rng.integers(1, 14)))
+    if kind == 6:
+        return "".join(rng.choice(list(HANZI), rng.integers(2, 12)))
+    return str(rng.choice(["Total", "合计", "本期", "-", "", "N/A", "张三"]))
+
+
+def make_tables(rng, tables, rows, cols):
+    return [[[make_cell(rng, c) for c in range(cols)] for _ in range(rows)] for _ in range(tables)]
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    tables = make_tables(rng, args.tables, args.rows, args.cols)
+    cells = [v for tbl in tables for row in tbl for v in row]
+    print(f"{len(tables)} tables of {args.rows}x{args.cols} cells, {len(set(cells)) / len(cells):.0%} distinct texts")
+
+    for v in cells:
+        assert legacy_block_type(v, CELL_PATTERNS, True) == cell_type(v), f"{v!r} typed otherwise"
+        assert legacy_block_type(v, DOCX_CELL_PATTERNS, False) == docx_cell_type(v), f"{v!r} typed otherwise for docx"
+    for tbl in tables:
+        assert legacy_docx_header_rows(tbl) == docx_header_rows(tbl), "docx header rows differ"
+    print("cell types and docx header rows identical to the per-pattern classifiers")
+
+    per_table = args.rows * args.cols
+    start = timer()
+    for v in cells:
+        legacy_block_type(v, CELL_PATTERNS, True)
+    legacy = (timer() - start) / len(tables)
+
+    cell_type.cache_clear()
+    start = timer()
+    for tbl in tables:
+        # a cold cache per table, as documents mostly repeat texts within their tables
+        cell_type.cache_clear()
+        for row in tbl:
+            for v in row:
+                cell_type(v)
+    cold = (timer() - start) / len(tables)
+
+    start = timer()
+    for v in cells:
+        cell_type(v)
+    warm = (timer() - start) / len(tables)
+    print(f"{'pdf cells':<12} per-pattern {legacy * 1000:8.1f} ms/table   combined {cold * 1000:8.1f} ms/table (x{legacy / cold:.1f})   cached {warm * 1000:6.1f} ms/table   {per_table} cells")
+
+    start = timer()
+    for tbl in tables:
+        legacy_docx_header_rows(tbl)
+    legacy = (timer() - start) / len(tables)
+    start = timer()
+    for tbl in tables:
+        docx_cell_type.cache_clear()
+        docx_header_rows(tbl)
+    new = (timer() - start) / len(tables)
+    print(f"{'docx tables':<12} per-pattern {legacy * 1000:8.1f} ms/table   combined {new * 1000:8.1f} ms/table (x{legacy / new:.1f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tables", type=int, default=3)
+    parser.add_argument("--rows", type=int, default=1250)
+    parser.add_argument("--cols", type=int, default=8, help="Columns; rows x cols cells per table. Default: 8, 10k cells")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
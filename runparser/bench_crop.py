@@ -0,0 +1,72 @@
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision.ocr import OCR
+
+
+def legacy_crop(img, points):
+    """The perspective warp OCR cropped every box with before."""
+    img_crop_width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    img_crop_height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    pts_std = np.float32([[0, 0], [img_crop_width, 0], [img_crop_width, img_crop_height], [0, img_crop_height]])
+    M = cv2.getPerspectiveTransform(points, pts_std)
+    return cv2.warpPerspective(img, M, (img_crop_width, img_crop_height), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+
+
+def make_page(rng, lines, rotated, height=3508, width=2480):
+    """
+    A page rendered at zoomin 3 with `lines` text line boxes, clockwise from
+    top-left as DBPostProcess returns them; a share of them rotated.
+    """
+    page = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    boxes = []
+    for _ in range(lines):
+        w, h = float(rng.uniform(30, 1500)), float(rng.uniform(25, 60))
+        x, y = float(rng.uniform(0, width - w)), float(rng.uniform(0, height - h))
+        if rng.random() < rotated:
+            pts = cv2.boxPoints(((x + w / 2, y + h / 2), (w, h), float(rng.uniform(-15, 15))))
+            pts = pts[np.argsort(pts.sum(axis=1))]
+            tl, br = pts[0], pts[3]
+            tr, bl = sorted(pts[1:3], key=lambda p: p[1])
+            boxes.append(np.float32([tl, tr, br, bl]))
+        else:
+            x, y, w, h = int(x), int(y), int(w), int(h)
+            boxes.append(np.float32([[x, y], [x + w, y], [x + w, y + h], [x, y + h]]))
+    return page, boxes
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    page, boxes = make_page(rng, args.lines, args.rotated)
+    aligned = sum(OCR._aligned_crop(page, b) is not None for b in boxes)
+
+    for b in boxes:
+        assert np.array_equal(legacy_crop(page, b), OCR._warp_crop(page, b)), "crop differs from the warp"
+    print(f"{len(boxes)} boxes, {aligned} axis-aligned, crops identical to the warp")
+
+    for name, fn in [("warp", legacy_crop), ("sliced", OCR._warp_crop)]:
+        start = timer()
+        for _ in range(args.repeat):
+            for b in boxes:
+                fn(page, b)
+        cost = (timer() - start) / args.repeat
+        print(f"{name:<8} {cost * 1000:8.2f} ms/page   {cost / len(boxes) * 1e6:7.1f} us/crop")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=400, help="Text line boxes on the page. Default: 400")
+    parser.add_argument("--rotated", type=float, default=0.05, help="Share of rotated boxes. Default: 0.05")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,75 @@
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision.postprocess import DBPostProcess
+
+
+def make_map(rng, height=960, width=704, lines=150, rotated=0.1):
+    """
+    A DB probability map of text lines: filled rectangles, a share of them
+    rotated, blurred like the network output and scaled by a random confidence.
+    """
+    m = np.zeros((height, width), np.float32)
+    for _ in range(lines):
+        x0, y0 = rng.uniform(0, width - 20), rng.uniform(0, height - 10)
+        w, h = rng.uniform(6, 300), rng.uniform(5, 16)
+        if rng.random() < rotated:
+            pts = cv2.boxPoints(((x0 + w / 2, y0 + h / 2), (w, h), rng.uniform(-20, 20))).astype(np.int32)
+            cv2.fillPoly(m, [pts], 1.0)
+        else:
+            cv2.rectangle(m, (int(x0), int(y0)), (int(x0 + w), int(y0 + h)), 1.0, -1)
+    m = cv2.GaussianBlur(m, (0, 0), 1.5)
+    return np.clip(m * rng.uniform(0.7, 1.0), 0, 1)
+
+
+def legacy(pp, pred, bitmap, dest_width, dest_height):
+    """The per-contour boxes_from_bitmap DBPostProcess used before."""
+    contours, _ = cv2.findContours((bitmap * 255).astype(np.uint8), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    height, width = bitmap.shape
+    return pp.boxes_from_contours(pred, contours[: pp.max_candidates], width, height, dest_width, dest_height)
+
+
+def main(args):
+    # the parameters TextDetector builds its DBPostProcess with
+    pp = DBPostProcess(thresh=0.3, box_thresh=0.5, max_candidates=1000, unclip_ratio=1.5, use_dilation=False, score_mode="fast", box_type="quad")
+    rng = np.random.default_rng(args.seed)
+    maps = [make_map(rng, lines=args.lines, rotated=args.rotated) for _ in range(args.maps)]
+    dest = (2112, 2880)
+
+    boxes = 0
+    for pred in maps:
+        bitmap = pred > pp.thresh
+        a, sa = legacy(pp, pred, bitmap, *dest)
+        b, sb = pp.boxes_from_bitmap(pred, bitmap, *dest)
+        assert np.array_equal(a, b), "boxes differ from the per-contour path"
+        assert np.allclose(sa, sb, atol=1e-9), "scores differ from the per-contour path"
+        boxes += len(a)
+    print(f"{len(maps)} maps, {boxes} boxes, identical to the per-contour path")
+
+    for name, fn in [("legacy", lambda p, bm: legacy(pp, p, bm, *dest)), ("batched", lambda p, bm: pp.boxes_from_bitmap(p, bm, *dest))]:
+        start = timer()
+        for _ in range(args.repeat):
+            for pred in maps:
+                fn(pred, pred > pp.thresh)
+        cost = (timer() - start) / args.repeat / len(maps)
+        print(f"{name:<8} {cost * 1000:8.2f} ms/map")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--maps", type=int, default=20, help="Probability maps in the fixture set. Default: 20")
+    parser.add_argument("--lines", type=int, default=150, help="Text lines per map. Default: 150")
+    parser.add_argument("--rotated", type=float, default=0.1, help="Share of rotated lines. Default: 0.1")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
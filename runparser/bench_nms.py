@@ -0,0 +1,116 @@
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision.operators import nms
+
+
+def legacy_nms(bboxes, scores, iou_thresh):
+    """The single-class loop operators.nms ran before (pixel-inclusive, suppresses IoU > thresh)."""
+    x1, y1, x2, y2 = bboxes[:, 0], bboxes[:, 1], bboxes[:, 2], bboxes[:, 3]
+    areas = (y2 - y1) * (x2 - x1)
+    indices = []
+    index = scores.argsort()[::-1]
+    while index.size > 0:
+        i = index[0]
+        indices.append(i)
+        w = np.maximum(0, np.minimum(x2[i], x2[index[1:]]) - np.maximum(x1[i], x1[index[1:]]) + 1)
+        h = np.maximum(0, np.minimum(y2[i], y2[index[1:]]) - np.maximum(y1[i], y1[index[1:]]) + 1)
+        overlaps = w * h
+        ious = overlaps / (areas[i] + areas[index[1:]] - overlaps)
+        index = index[np.where(ious <= iou_thresh)[0] + 1]
+    return indices
+
+
+def legacy_iou_filter(boxes, scores, iou_threshold):
+    """The single-class loop of Recognizer.postprocess before (suppresses IoU >= thresh)."""
+    sorted_indices = np.argsort(scores)[::-1]
+    keep_boxes = []
+    while sorted_indices.size > 0:
+        box_id = sorted_indices[0]
+        keep_boxes.append(box_id)
+        box, rest = boxes[box_id], boxes[sorted_indices[1:]]
+        inter = np.maximum(0, np.minimum(box[2], rest[:, 2]) - np.maximum(box[0], rest[:, 0])) * np.maximum(0, np.minimum(box[3], rest[:, 3]) - np.maximum(box[1], rest[:, 1]))
+        union = (box[2] - box[0]) * (box[3] - box[1]) + (rest[:, 2] - rest[:, 0]) * (rest[:, 3] - rest[:, 1]) - inter
+        sorted_indices = sorted_indices[np.where(inter / union < iou_threshold)[0] + 1]
+    return keep_boxes
+
+
+def legacy_per_class(fn, boxes, scores, class_ids, thresh):
+    indices = []
+    for class_id in np.unique(class_ids):
+        class_indices = np.where(class_ids == class_id)[0]
+        indices.extend(class_indices[fn(boxes[class_indices], scores[class_indices], thresh)])
+    return indices
+
+
+def make_candidates(rng, regions, per_region, classes, width=1024, height=1024):
+    """Layout candidates as detectors emit them: jittered copies of each region, with random scores and classes."""
+    boxes, class_ids = [], []
+    for _ in range(regions):
+        x, y = rng.uniform(0, width - 100), rng.uniform(0, height - 40)
+        w, h = rng.uniform(20, 600), rng.uniform(10, 300)
+        cls = rng.integers(0, classes)
+        for _ in range(per_region):
+            j = rng.normal(0, 6, 4)
+            boxes.append([x + j[0], y + j[1], x + w + j[2], y + h + j[3]])
+            class_ids.append(cls if rng.random() < 0.8 else rng.integers(0, classes))
+    scores = rng.uniform(0.2, 1.0, len(boxes)).astype(np.float32)
+    return np.array(boxes, dtype=np.float32), scores, np.array(class_ids)
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    pages = [make_candidates(rng, args.regions, args.per_region, args.classes) for _ in range(args.pages)]
+    cases = [
+        ("nms 0.45", legacy_nms, 0.45, {}),
+        ("iou_filter 0.2", legacy_iou_filter, 0.2, {"offset": 0, "suppress_equal": True}),
+    ]
+
+    for name, fn, thresh, kw in cases:
+        for boxes, scores, cls in pages:
+            # compared as sets: the order of equally scored boxes was never defined
+            assert sorted(legacy_per_class(fn, boxes, scores, cls, thresh)) == sorted(nms(boxes, scores, thresh, cls, **kw)), f"{name} keeps other boxes"
+    print(f"{len(pages)} pages of {len(pages[0][1])} candidates, kept boxes identical to the per-class loops")
+
+    all_boxes = np.concatenate([p[0] for p in pages])
+    all_scores = np.concatenate([p[1] for p in pages])
+    all_cls = np.concatenate([p[2] for p in pages])
+    batch = np.repeat(np.arange(len(pages)), [len(p[1]) for p in pages])
+    offsets = np.cumsum([0] + [len(p[1]) for p in pages])
+    batched = nms(all_boxes, all_scores, 0.45, all_cls, batch)
+    per_page = np.concatenate([nms(p[0], p[1], 0.45, p[2]) + o for p, o in zip(pages, offsets)])
+    assert np.array_equal(batched, per_page), "batched call keeps other boxes"
+
+    for name, fn, thresh, kw in cases:
+        start = timer()
+        for boxes, scores, cls in pages:
+            legacy_per_class(fn, boxes, scores, cls, thresh)
+        legacy = (timer() - start) / len(pages)
+        start = timer()
+        for boxes, scores, cls in pages:
+            nms(boxes, scores, thresh, cls, **kw)
+        vectorized = (timer() - start) / len(pages)
+        print(f"{name:<16} per-class loop {legacy * 1000:7.2f} ms/page   vectorized {vectorized * 1000:7.2f} ms/page   x{legacy / vectorized:.1f}")
+
+    start = timer()
+    nms(all_boxes, all_scores, 0.45, all_cls, batch)
+    print(f"{'batched':<16} {len(pages)} pages in one call {(timer() - start) / len(pages) * 1000:7.2f} ms/page")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--regions", type=int, default=60, help="Layout regions per page. Default: 60")
+    parser.add_argument("--per-region", type=int, default=8, help="Overlapping candidates per region. Default: 8")
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
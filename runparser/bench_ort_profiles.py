@@ -0,0 +1,127 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+# Input height and width fed for symbolic dimensions, per model family.
+INPUT_HW = {"det": (960, 736), "rec": (48, 320), "layout": (1024, 768), "tsr": (1024, 768)}
+
+
+def make_feed(sess, family, batch):
+    feed = {}
+    h, w = INPUT_HW.get(family, (640, 640))
+    for node in sess.get_inputs():
+        shape = [d if isinstance(d, int) and d > 0 else None for d in node.shape]
+        if len(shape) == 4:
+            shape = [shape[0] or batch, shape[1] or 3, shape[2] or h, shape[3] or w]
+        else:
+            # scale_factor style side inputs
+            shape = [shape[0] or batch] + [d or 2 for d in shape[1:]]
+        feed[node.name] = np.random.rand(*shape).astype(np.float32)
+    return feed
+
+
+def child(args):
+    """Measure one model under one profile in this fresh process and print the results as JSON."""
+    from deepdoc.vision import ocr
+
+    ocr.ORT_OPTIMIZED_MODEL_DIR = args.cache_dir or ""
+    family = args.model.split(".")[0]
+
+    start = timer()
+    sess, run_options = ocr.load_model(args.model_dir, args.model, profile=args.profile)
+    load = timer() - start
+    feed = make_feed(sess, family, args.batch)
+
+    sess.run(None, feed, run_options)
+    latencies = []
+    for _ in range(args.runs):
+        start = timer()
+        sess.run(None, feed, run_options)
+        latencies.append(timer() - start)
+
+    # concurrent callers sharing the session, as the pipelined parser does
+    def worker():
+        for _ in range(args.runs):
+            sess.run(None, feed, run_options)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    start = timer()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    throughput = args.concurrency * args.runs * args.batch / (timer() - start)
+
+    print(
+        json.dumps(
+            {
+                "load": load,
+                "latency": float(np.median(latencies)),
+                "throughput": throughput,
+                "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            }
+        )
+    )
+
+
+def run_child(args, model, profile, cache_dir):
+    cmd = [sys.executable, __file__, "--child", "--model-dir", args.model_dir, "--model", model, "--profile", profile]
+    cmd += ["--batch", str(args.batch), "--runs", str(args.runs), "--concurrency", str(args.concurrency)]
+    if cache_dir:
+        cmd += ["--cache-dir", cache_dir]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(args):
+    from deepdoc.vision.ocr import SESSION_PROFILES
+
+    profiles = args.profiles.split(",") if args.profiles else list(SESSION_PROFILES)
+    cache_dir = tempfile.mkdtemp(prefix="ort_optimized_")
+    try:
+        for model in args.models.split(","):
+            print(f"{model} (batch {args.batch}, {args.concurrency} concurrent callers)")
+            print(f"  {'profile':<12}{'load':>9}{'cached load':>13}{'latency':>11}{'throughput':>14}{'peak RSS':>11}")
+            for profile in profiles:
+                # cold: no optimized graph yet, this run writes it; warm: a later process loads it
+                cold = run_child(args, model, profile, cache_dir)
+                warm = run_child(args, model, profile, cache_dir)
+                print(
+                    f"  {profile:<12}{cold['load'] * 1000:7.0f}ms{warm['load'] * 1000:11.0f}ms"
+                    f"{warm['latency'] * 1000:9.1f}ms{warm['throughput']:10.1f} im/s{warm['rss_mb']:8.0f} MB"
+                )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", default=os.path.join(PROJECT_ROOT, "rag/res/deepdoc"))
+    parser.add_argument("--models", default="det,rec,layout,tsr", help="Comma separated models. Default: det,rec,layout,tsr")
+    parser.add_argument("--profiles", default="", help="Comma separated profiles. Default: all of them")
+    parser.add_argument("--batch", type=int, default=1, help="Images per run. Default: 1")
+    parser.add_argument("--runs", type=int, default=10, help="Runs per measurement. Default: 10")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads sharing the session in the throughput run. Default: 4")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--model", help=argparse.SUPPRESS)
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    parser.add_argument("--cache-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+    else:
+        main(args)
@@ -0,0 +1,176 @@
+import argparse
+import os
+import sys
+from difflib import SequenceMatcher
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+from PIL import Image
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision import OCR, LayoutRecognizer, TableStructureRecognizer
+from deepdoc.vision.quantize import quantize_model
+
+MODEL_DIR = os.path.join(PROJECT_ROOT, "rag/res/deepdoc")
+FAMILIES = ("DET", "REC", "LAYOUT", "TSR")
+
+
+def load_fixtures(inputs, max_pages, zoomin=3):
+    """Page images of the images and PDFs under `inputs`."""
+    import pdfplumber
+
+    paths = [inputs] if os.path.isfile(inputs) else sorted(os.path.join(inputs, f) for f in os.listdir(inputs))
+    pages = []
+    for fnm in paths:
+        if fnm.lower().endswith(".pdf"):
+            with pdfplumber.open(fnm) as pdf:
+                pages.extend(p.to_image(resolution=72 * zoomin).annotated.convert("RGB") for p in pdf.pages[: max_pages - len(pages)])
+        elif fnm.lower().endswith((".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")):
+            pages.append(Image.open(fnm).convert("RGB"))
+        if len(pages) >= max_pages:
+            break
+    return pages[:max_pages]
+
+
+class RecordingSession:
+    """Wraps an ORT session and keeps the inputs it is run on, as calibration data."""
+
+    def __init__(self, sess, limit):
+        self.sess = sess
+        self.limit = limit
+        self.feeds = []
+
+    def run(self, output_names, feed, run_options=None):
+        if len(self.feeds) < self.limit:
+            self.feeds.append({k: np.array(v) for k, v in feed.items()})
+        return self.sess.run(output_names, feed, run_options)
+
+    def __getattr__(self, name):
+        return getattr(self.sess, name)
+
+
+def build_models(quantization):
+    for family in FAMILIES:
+        os.environ[f"ORT_QUANTIZATION_{family}"] = quantization
+    return OCR(), LayoutRecognizer("layout"), TableStructureRecognizer()
+
+
+def run_all(models, pages, costs, tag):
+    ocr, layouter, _ = models
+    texts = []
+    start = timer()
+    for img in pages:
+        texts.append("\n".join(t for _, (t, _) in (ocr(np.array(img)) or [])))
+    costs[("ocr", tag)] = timer() - start
+
+    start = timer()
+    layouts = layouter.forward(pages, thr=0.2)
+    costs[("layout", tag)] = timer() - start
+    return texts, layouts
+
+
+def table_crops(pages, layouts):
+    crops = []
+    for img, lts in zip(pages, layouts):
+        for b in lts:
+            if b["type"] == "table":
+                crops.append(img.crop(tuple(int(v) for v in b["bbox"])))
+    return crops
+
+
+def iou(a, b):
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+
+def box_agreement(reference, candidate):
+    """Mean best IoU of the reference boxes against same-typed candidate boxes, and the share above 0.5."""
+    ious = []
+    for ref, cand in zip(reference, candidate):
+        for r in ref:
+            same = [c["bbox"] for c in cand if c["type"] == r["type"]]
+            ious.append(max((iou(r["bbox"], c) for c in same), default=0.0))
+    if not ious:
+        return 1.0, 1.0
+    return float(np.mean(ious)), float(np.mean(np.array(ious) >= 0.5))
+
+
+def tsr_as_boxes(tbls):
+    return [[{"type": b["label"], "bbox": [b["x0"], b["top"], b["x1"], b["bottom"]]} for b in tbl] for tbl in tbls]
+
+
+def main(args):
+    pages = load_fixtures(args.inputs, args.pages)
+    print(f"{len(pages)} fixture pages from {args.inputs}")
+
+    fp32 = build_models("")
+    if args.build:
+        if args.mode == "static":
+            # calibrate on the inputs the fp32 models see on the fixture pages
+            ocr, layouter, tsr = fp32
+            rec_det = ocr.text_detector[0].predictor = RecordingSession(ocr.text_detector[0].predictor, args.calibration)
+            rec_rec = ocr.text_recognizer[0].predictor = RecordingSession(ocr.text_recognizer[0].predictor, args.calibration)
+            rec_lay = layouter.ort_sess = RecordingSession(layouter.ort_sess, args.calibration)
+            rec_tsr = tsr.ort_sess = RecordingSession(tsr.ort_sess, args.calibration)
+            _, layouts = run_all(fp32, pages, {}, "fp32")
+            crops = table_crops(pages, layouts)
+            if crops:
+                tsr(crops)
+            for nm, recorder in [("det", rec_det), ("rec", rec_rec), ("layout", rec_lay), ("tsr", rec_tsr)]:
+                if recorder.feeds:
+                    quantize_model(MODEL_DIR, nm, "static", recorder.feeds)
+                else:
+                    print(f"no calibration inputs for {nm}, not quantized")
+            ocr.text_detector[0].predictor, ocr.text_recognizer[0].predictor = rec_det.sess, rec_rec.sess
+            layouter.ort_sess, tsr.ort_sess = rec_lay.sess, rec_tsr.sess
+        else:
+            for nm in ("det", "rec", "layout", "tsr"):
+                quantize_model(MODEL_DIR, nm, "dynamic")
+    int8 = build_models(args.mode)
+
+    costs = {}
+    texts32, layouts32 = run_all(fp32, pages, costs, "fp32")
+    texts8, layouts8 = run_all(int8, pages, costs, "int8")
+
+    crops = table_crops(pages, layouts32)
+    if crops:
+        start = timer()
+        tbl32 = fp32[2](crops)
+        costs[("tsr", "fp32")] = timer() - start
+        start = timer()
+        tbl8 = int8[2](crops)
+        costs[("tsr", "int8")] = timer() - start
+
+    sim = [SequenceMatcher(None, a, b).ratio() for a, b in zip(texts32, texts8)]
+    print(f"OCR     text similarity {np.mean(sim):.4f} (worst page {min(sim):.4f})")
+    mean_iou, recall = box_agreement(layouts32, layouts8)
+    print(f"layout  mean IoU {mean_iou:.4f}, boxes matched at IoU 0.5: {recall:.1%}")
+    if crops:
+        mean_iou, recall = box_agreement(tsr_as_boxes(tbl32), tsr_as_boxes(tbl8))
+        print(f"tsr     mean IoU {mean_iou:.4f}, boxes matched at IoU 0.5: {recall:.1%} over {len(crops)} tables")
+    else:
+        print("tsr     no tables found on the fixture pages")
+
+    for stage in ("ocr", "layout", "tsr"):
+        if (stage, "fp32") in costs:
+            a, b = costs[(stage, "fp32")], costs[(stage, "int8")]
+            print(f"{stage:<7} fp32 {a:7.2f}s   int8-{args.mode} {b:7.2f}s   x{a / max(b, 1e-9):.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inputs", default=os.path.join(PROJECT_ROOT, "input"), help="Image/PDF file or directory of fixtures. Default: input/")
+    parser.add_argument("--pages", type=int, default=10, help="Fixture pages at most. Default: 10")
+    parser.add_argument("--mode", choices=["dynamic", "static"], default="dynamic")
+    parser.add_argument("--build", action="store_true", help="(Re)build the INT8 copies first; static ones are calibrated on the fixture pages")
+    parser.add_argument("--calibration", type=int, default=64, help="Calibration inputs kept per model. Default: 64")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+from timeit import default_timer as timer
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision.ocr import TextRecognizer
+
+
+def legacy_batch(rec, imgs, max_wh_ratio):
+    """The per-crop resize_norm_img + concatenate + copy construction TextRecognizer used before."""
+    norm_img_batch = []
+    for img in imgs:
+        norm_img = rec.resize_norm_img(img, max_wh_ratio)
+        norm_img = norm_img[np.newaxis, :]
+        norm_img_batch.append(norm_img)
+    norm_img_batch = np.concatenate(norm_img_batch)
+    return norm_img_batch.copy()
+
+
+def make_crops(n, seed=0):
+    """Text line crops with the heights and aspect ratios of OCR detections."""
+    rng = np.random.default_rng(seed)
+    crops = []
+    for _ in range(n):
+        h = int(rng.integers(24, 64))
+        w = int(h * rng.lognormal(2.0, 0.8)) + 8
+        crops.append(rng.integers(0, 255, (h, w, 3), dtype=np.uint8))
+    return crops
+
+
+def measure(fn, rec, batches):
+    """
+    Seconds for all batches, and the transient memory of the largest batch
+    call in multiples of the batch tensor it builds. Numpy traces its data
+    buffers through tracemalloc, so temporaries freed inside the call count.
+    """
+    start = timer()
+    for imgs, ratio in batches:
+        fn(rec, imgs, ratio)
+    cost = timer() - start
+
+    worst = 0.0
+    tracemalloc.start()
+    for imgs, ratio in batches:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        out = fn(rec, imgs, ratio)
+        _, peak = tracemalloc.get_traced_memory()
+        worst = max(worst, (peak - base) / out.nbytes)
+        del out
+    tracemalloc.stop()
+    return cost, worst
+
+
+def main(args):
+    rec = TextRecognizer(os.path.join(PROJECT_ROOT, "rag/res/deepdoc"))
+    crops = make_crops(args.crops)
+    imgC, imgH, imgW = rec.rec_image_shape
+    batches = []
+    for batch in rec._plan_batches([c.shape[1] / c.shape[0] for c in crops]):
+        imgs = [crops[i] for i in batch]
+        batches.append((imgs, max(imgW / imgH, max(c.shape[1] / c.shape[0] for c in imgs))))
+
+    for imgs, ratio in batches:
+        assert np.allclose(legacy_batch(rec, imgs, ratio), rec._batch_tensor(imgs, ratio), atol=1e-5)
+
+    # warm up, so the reused buffer is already allocated
+    for imgs, ratio in batches:
+        rec._batch_tensor(imgs, ratio)
+
+    print(f"{len(crops)} crops in {len(batches)} batches")
+    for name, fn in [("legacy", legacy_batch), ("buffer", TextRecognizer._batch_tensor)]:
+        cost, worst = measure(fn, rec, batches)
+        print(f"{name:<8} {cost * 1000:9.2f} ms   {cost / len(crops) * 1e6:7.1f} us/crop   transient memory up to {worst:5.2f}x the batch tensor")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crops", type=int, default=2000, help="Text line crops to preprocess. Default: 2000")
+    args = parser.parse_args()
+    main(args)
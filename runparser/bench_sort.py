@@ -0,0 +1,109 @@
+import argparse
+import random
+import sys
+from functools import cmp_to_key
+from pathlib import Path
+from timeit import default_timer as timer
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.vision.recognizer import Recognizer
+
+
+# The comparator and bubble-pass sorts Recognizer used before, kept here as the reference.
+def legacy_sort_Y_firstly(arr, threshold):
+    def cmp(c1, c2):
+        diff = c1["top"] - c2["top"]
+        if abs(diff) < threshold:
+            diff = c1["x0"] - c2["x0"]
+        return diff
+
+    return sorted(arr, key=cmp_to_key(cmp))
+
+
+def legacy_sort_X_firstly(arr, threshold):
+    def cmp(c1, c2):
+        diff = c1["x0"] - c2["x0"]
+        if abs(diff) < threshold:
+            diff = c1["top"] - c2["top"]
+        return diff
+
+    return sorted(arr, key=cmp_to_key(cmp))
+
+
+def legacy_sort_runs(arr, key, minor):
+    for i in range(len(arr) - 1):
+        for j in range(i, -1, -1):
+            if key not in arr[j] or key not in arr[j + 1]:
+                continue
+            if arr[j + 1][key] < arr[j][key] or (arr[j + 1][key] == arr[j][key] and arr[j + 1][minor] < arr[j][minor]):
+                arr[j], arr[j + 1] = arr[j + 1], arr[j]
+    return arr
+
+
+def legacy_sort_C_firstly(arr, thr=0):
+    return legacy_sort_runs(legacy_sort_X_firstly(arr, thr), "C", "top")
+
+
+def legacy_sort_R_firstly(arr, thr=0):
+    return legacy_sort_runs(legacy_sort_Y_firstly(arr, thr), "R", "x0")
+
+
+def make_page(n, line_height=12.0, jitter=2.0):
+    """
+    A page of `n` text boxes laid out as a grid of lines and columns. Tops and
+    lefts jitter by less than the sort threshold, so the old comparator is
+    consistent on it and both implementations must agree.
+    """
+    cols = 8
+    boxes = []
+    for i in range(n):
+        r, c = divmod(i, cols)
+        boxes.append(
+            {
+                "top": r * line_height + random.uniform(0, jitter),
+                "x0": c * 60.0 + random.uniform(0, jitter),
+                "R": r,
+                "C": c,
+            }
+        )
+    for b in boxes:
+        b["bottom"] = b["top"] + line_height - jitter
+        b["x1"] = b["x0"] + 50.0
+    random.shuffle(boxes)
+    return boxes
+
+
+def bench(name, legacy, fast, boxes, thr, repeat):
+    legacy_cost = fast_cost = 0.0
+    for _ in range(repeat):
+        start = timer()
+        expected = legacy(list(boxes), thr)
+        legacy_cost += timer() - start
+        start = timer()
+        got = fast(list(boxes), thr)
+        fast_cost += timer() - start
+        assert [id(b) for b in got] == [id(b) for b in expected], f"{name} order differs from the legacy sort"
+    print(f"{name:<16} legacy {legacy_cost / repeat * 1000:9.2f} ms   new {fast_cost / repeat * 1000:9.2f} ms   x{legacy_cost / max(fast_cost, 1e-9):.1f}")
+
+
+def main(args):
+    random.seed(args.seed)
+    boxes = make_page(args.boxes)
+    thr = 4.0
+    print(f"{args.boxes} boxes, threshold {thr}, {args.repeat} runs each")
+    bench("sort_Y_firstly", legacy_sort_Y_firstly, Recognizer.sort_Y_firstly, boxes, thr, args.repeat)
+    bench("sort_X_firstly", legacy_sort_X_firstly, Recognizer.sort_X_firstly, boxes, thr, args.repeat)
+    bench("sort_R_firstly", legacy_sort_R_firstly, Recognizer.sort_R_firstly, boxes, thr, args.repeat)
+    bench("sort_C_firstly", legacy_sort_C_firstly, Recognizer.sort_C_firstly, boxes, thr, args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boxes", type=int, default=5000, help="Boxes on the synthetic page. Default: 5000")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each sort. Default: 3")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args)
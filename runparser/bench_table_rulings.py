@@ -0,0 +1,119 @@
+import argparse
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from deepdoc.parser.table_rulings import ruled_table_components
+
+
+def grid_rulings(ys, xs, open_v=(), open_h=()):
+    """
+    Rulings of a grid drawn cell side by cell side, as pdfs draw tables: the
+    vertical side (r, c) between cells (r, c - 1) and (r, c), and the
+    horizontal side (r, c) between cells (r - 1, c) and (r, c), are left out
+    when in `open_v` / `open_h`.
+    """
+    hs = [(y, xs[c], xs[c + 1]) for r, y in enumerate(ys) for c in range(len(xs) - 1) if (r, c) not in open_h]
+    vs = [(x, ys[r], ys[r + 1]) for c, x in enumerate(xs) for r in range(len(ys) - 1) if (r, c) not in open_v]
+    return hs, vs
+
+
+def cpn(label, x0, top, x1, bottom):
+    return {"label": label, "score": 1.0, "x0": x0, "x1": x1, "top": top, "bottom": bottom}
+
+
+def table_components(ys, xs, header, spans):
+    """The components expected of a grid: `header` the last column header row, `spans` the merged cells as (x0, top, x1, bottom)."""
+    res = [cpn("table", xs[0], ys[0], xs[-1], ys[-1])]
+    res.extend(cpn("table row", xs[0], ys[r], xs[-1], ys[r + 1]) for r in range(len(ys) - 1))
+    res.extend(cpn("table column", xs[c], ys[0], xs[c + 1], ys[-1]) for c in range(len(xs) - 1))
+    if header is not None:
+        res.append(cpn("table column header", xs[0], ys[0], xs[-1], ys[header + 1]))
+    res.extend(cpn("table spanning cell", *s) for s in spans)
+    return res
+
+
+YS = [100, 120, 140, 160, 180]
+XS = [50, 150, 250, 350]
+LAYOUT = (XS[0], YS[0], XS[-1], YS[-1])
+
+
+def check():
+    # a full grid: 4 rows, 3 columns, the first row as header
+    rulings = grid_rulings(YS, XS)
+    assert ruled_table_components(rulings, *LAYOUT) == table_components(YS, XS, 0, []), "full grid"
+    # drawn with pdf line widths and a layout a few points off
+    jittered = ([(y + 0.4, a - 0.5, b + 0.5) for y, a, b in rulings[0]], [(x - 0.4, a - 0.5, b + 0.5) for x, a, b in rulings[1]])
+    res = ruled_table_components(jittered, XS[0] + 4, YS[0] - 3, XS[-1] - 2, YS[-1] + 5)
+    assert res is not None and [c["label"] for c in res] == [c["label"] for c in table_components(YS, XS, 0, [])], "jittered grid"
+    # too few lines for two rows and two columns
+    assert ruled_table_components(grid_rulings(YS[:2], XS), XS[0], YS[0], XS[-1], YS[1]) is None, "one row"
+    assert ruled_table_components(grid_rulings(YS, XS[:2]), XS[0], YS[0], XS[1], YS[-1]) is None, "one column"
+    print("full grid")
+
+    # a header cell across columns 1 and 2
+    res = ruled_table_components(grid_rulings(YS, XS, open_v={(0, 2)}), *LAYOUT)
+    assert res == table_components(YS, XS, 0, [(150, 100, 350, 120)]), "merged header cell"
+    # a first column cell down rows 0 and 1 makes both rows header
+    res = ruled_table_components(grid_rulings(YS, XS, open_h={(1, 0)}), *LAYOUT)
+    assert res == table_components(YS, XS, 1, [(50, 100, 150, 140)]), "merged row header"
+    # a 2x2 block in the body
+    res = ruled_table_components(grid_rulings(YS, XS, open_v={(2, 2), (3, 2)}, open_h={(3, 1), (3, 2)}), *LAYOUT)
+    assert res == table_components(YS, XS, 0, [(150, 140, 350, 180)]), "merged body block"
+    # a first column cell down every row leaves no body row, so no header
+    res = ruled_table_components(grid_rulings(YS, XS, open_h={(1, 0), (2, 0), (3, 0)}), *LAYOUT)
+    assert res == table_components(YS, XS, None, [(50, 100, 150, 180)]), "merged down every row"
+    print("merged cells")
+
+    # an L of three cells is no cell at all
+    assert ruled_table_components(grid_rulings(YS, XS, open_v={(0, 1)}, open_h={(1, 0)}), *LAYOUT) is None, "L-shaped merge"
+    print("non-rectangular merge")
+
+    # booktabs: top, mid and bottom rules, no verticals
+    booktabs = ([(y, XS[0], XS[-1]) for y in (YS[0], YS[1], YS[-1])], [])
+    assert ruled_table_components(booktabs, *LAYOUT) is None, "booktabs"
+    # with the ticks some generators draw at the rule ends
+    booktabs[1].extend((x, y - 2, y + 2) for x in (XS[0], XS[-1]) for y in (YS[0], YS[1], YS[-1]))
+    assert ruled_table_components(booktabs, *LAYOUT) is None, "booktabs with ticks"
+    print("booktabs")
+
+    # the frame open on one side
+    hs, vs = grid_rulings(YS, XS)
+    assert ruled_table_components((hs, [v for v in vs if v[0] != XS[-1]]), *LAYOUT) is None, "open frame"
+    # a grid in a corner of the layout
+    assert ruled_table_components(grid_rulings(YS, XS), XS[0], YS[0], XS[-1] + 300, YS[-1] + 200) is None, "layout larger than the frame"
+    # a frame around much more than the layout, e.g. a page border with a table in it
+    wide = grid_rulings([0, 20, 400, 780, 800], [0, 300, 600])
+    assert ruled_table_components(wide, 100, 380, 500, 420) is None, "frame larger than the layout"
+    # rulings of another table elsewhere on the page
+    assert ruled_table_components(grid_rulings([y + 400 for y in YS], XS), *LAYOUT) is None, "frame off the layout"
+    print("frame not matching the layout")
+
+
+def main(args):
+    check()
+    print("ruled table components as expected")
+
+    ys = [100 + 15 * r for r in range(args.rows + 1)]
+    xs = [50 + 60 * c for c in range(args.cols + 1)]
+    open_v = {(r, c) for r in range(0, args.rows, 7) for c in range(1, args.cols, 2)}
+    rulings = grid_rulings(ys, xs, open_v=open_v)
+    start = timer()
+    for _ in range(args.loops):
+        res = ruled_table_components(rulings, xs[0], ys[0], xs[-1], ys[-1])
+    elapsed = (timer() - start) / args.loops
+    assert res is not None
+    print(f"{args.rows}x{args.cols} grid, {len(rulings[0]) + len(rulings[1])} segments: {elapsed * 1000:.2f} ms/table, {len(res)} components")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=40)
+    parser.add_argument("--cols", type=int, default=8)
+    parser.add_argument("--loops", type=int, default=20)
+    args = parser.parse_args()
+    main(args)